@@ -1,9 +1,36 @@
 #include <Arduino_BMI270_BMM150.h>
 #include <ArduinoBLE.h>
 
+#define PACKET_VERSION 2
+#define SAMPLES_PER_PACKET 4       // 164-byte notifications, fits the 185-byte MTU macOS negotiates
+#define SAMPLE_INTERVAL_US 10000   // 100 Hz
+
+// Packet format 2 (decoded by code/packet_format.py): a header with the format version, the
+// sample count and a sequence number the logger uses to spot lost packets, followed by
+// SAMPLES_PER_PACKET samples, each stamped with micros() when it was read.
+struct __attribute__((packed)) Sample {
+  uint32_t micros;
+  float values[9];  // acc, gyro, mag
+};
+
+struct __attribute__((packed)) Packet {
+  uint8_t version;
+  uint8_t count;
+  uint16_t seq;
+  Sample samples[SAMPLES_PER_PACKET];
+};
+
 BLEService imuService("12345678-1234-5678-1234-56789abcdef0");  // custom
 BLECharacteristic imuChar("abcdef01-1234-5678-1234-56789abcdef0",
-                          BLERead | BLENotify, 36);  // 9 floats * 4 bytes, all values are sent as one
+                          BLERead | BLENotify, sizeof(Packet));  // several samples are sent as one
+
+Packet packet;
+uint16_t packetSeq = 0;
+
+// last reading of each sensor, kept when a sensor has no new data yet
+float accX, accY, accZ;
+float gyroX, gyroY, gyroZ;
+float magX, magY, magZ;
 
 void setup() {
   Serial.begin(115200); // initialize USB for debugging
@@ -33,10 +60,18 @@ void loop() {
   BLEDevice central = BLE.central(); //device that arduino connects to
 
   if (central) {
+    uint8_t count = 0;
+    unsigned long nextSample = micros();
+
     while (central.connected()) {
-      float accX, accY, accZ;
-      float gyroX, gyroY, gyroZ;
-      float magX, magY, magZ;
+      // sample on a fixed micros() schedule instead of delay(), connected() keeps BLE polled meanwhile
+      if ((long)(micros() - nextSample) < 0) {
+        continue;
+      }
+      nextSample += SAMPLE_INTERVAL_US;
+
+      Sample &sample = packet.samples[count];
+      sample.micros = micros();
 
       if (IMU.accelerationAvailable()) {
         IMU.readAcceleration(accX, accY, accZ);
@@ -55,11 +90,17 @@ void loop() {
         gyroX, gyroY, gyroZ,
         magX, magY, magZ
       };
+      memcpy(sample.values, values, sizeof(values));
 
-      // this automatically sends a notification if subscribed
-      imuChar.setValue((uint8_t*)values, sizeof(values)); //casts array to bytes
+      if (++count == SAMPLES_PER_PACKET) {
+        packet.version = PACKET_VERSION;
+        packet.count = count;
+        packet.seq = packetSeq++;
 
-      delay(10);  // 100 Hz
+        // this automatically sends a notification if subscribed
+        imuChar.setValue((uint8_t*)&packet, sizeof(packet)); //casts struct to bytes
+        count = 0;
+      }
     }
 
     Serial.println("Disconnected");
@@ -1,40 +1,16 @@
-import os
-import csv
-from datetime import datetime
 import numpy as np
 
+from session import load_session
+
 PARTS = ["left_arm", "right_arm", "left_leg", "right_leg"]
 
-def read_csv_file(filename):
-    data = []
-    with open(filename, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            try:
-                ts = row['timestamp']
-                accX = float(row['accX'])
-                accY = float(row['accY'])
-                accZ = float(row['accZ'])
-                data.append((ts, accX, accY, accZ))
-            except:
-                continue
-    return data
-
-def compute_magnitude(ax, ay, az):
-    return np.sqrt(ax**2 + ay**2 + az**2)
-
-def analyze_arm_leg_usage(all_data, movement_threshold=0.8):
+def analyze_arm_leg_usage(magnitudes, movement_threshold=0.8):
+    # magnitudes: part -> acc magnitude; counts sample-to-sample magnitude jumps above the threshold
     movement_counts = {}
 
-    for part, readings in all_data.items():
-        prev_mag = None
-        count = 0
-        for ts, ax, ay, az in readings:
-            mag = compute_magnitude(ax, ay, az)
-            if prev_mag is not None and abs(mag - prev_mag) > movement_threshold:
-                count += 1
-            prev_mag = mag
-        movement_counts[part] = count
+    for part, acc_mag in magnitudes.items():
+        mag_delta = np.abs(np.diff(acc_mag))
+        movement_counts[part] = int(np.count_nonzero(mag_delta > movement_threshold))
 
     return movement_counts
 
@@ -68,17 +44,16 @@ def usage_summary(movement_counts):
         "comment": comment
     }
 
-def get_arm_leg_usage(folder):
-    all_data = {}
+def get_arm_leg_usage(session, movement_threshold=0.8, linear=False):
+    # linear: count jumps of the gravity-free acceleration of Session.orientation() instead of the raw one
+    session = load_session(session)
+    magnitudes = {}
     for part in PARTS:
-        file_match = [f for f in os.listdir(folder) if f.startswith(part)]
-        if not file_match:
-            print(f"No csv file found for {part}")
+        if part not in session:
             continue
-        data = read_csv_file(os.path.join(folder, file_match[0]))
-        all_data[part] = data
+        magnitudes[part] = session.acc_magnitude(part, linear)[1]
 
-    movement_counts = analyze_arm_leg_usage(all_data)
+    movement_counts = analyze_arm_leg_usage(magnitudes, movement_threshold)
     summary = usage_summary(movement_counts)
 
     # print("\nArm / Leg Usage Analysis:\n")
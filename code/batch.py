@@ -0,0 +1,222 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scoring import score_all
+from session import Session, is_session
+
+FIELDS = [
+    "session", "profile", "status", "seconds",
+    "arm_usage_ratio", "leg_usage_ratio", "usage_comment",
+    "stability", "smoothness",
+    "mean_interval", "std_interval", "rhythm_score",
+    "grips_left", "grips_right", "avg_grip_left", "avg_grip_right",
+    "partial_falls", "full_falls",
+    "errors"
+]
+
+
+def find_sessions(paths):
+    """
+    Session folders from the command line: a folder with limb files is a session, any
+    other folder is treated as an archive and its session subfolders are used instead.
+    """
+    sessions = []
+    for path in paths:
+        if not os.path.isdir(path):
+            print(f"[!] Not a folder: {path}", file=sys.stderr)
+        elif is_session(path):
+            sessions.append(os.path.abspath(path))
+        else:
+            for name in sorted(os.listdir(path)):
+                folder = os.path.join(path, name)
+                if os.path.isdir(folder) and is_session(folder):
+                    sessions.append(os.path.abspath(folder))
+    return list(dict.fromkeys(sessions))
+
+
+def profile_key(profile):
+    # short hash of the thresholds a session was scored with, "" for the defaults
+    if not profile:
+        return ""
+    return hashlib.sha1(json.dumps(profile, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def average_duration(events):
+    if not events:
+        return 0.0
+    return round(sum(g["duration"] for g in events) / len(events), 3)
+
+
+def summary_row(folder, scores, errors, seconds):
+    usage, rhythm, grips, falls = scores["usage"], scores["rhythm"], scores["grips"], scores["falls"]
+    grips = grips or {"left_arm": [], "right_arm": []}
+    return {
+        "session": folder,
+        "status": "error" if errors else "ok",
+        "seconds": round(seconds, 3),
+        "arm_usage_ratio": usage["arm_usage_ratio"],
+        "leg_usage_ratio": usage["leg_usage_ratio"],
+        "usage_comment": usage["comment"],
+        "stability": float(scores["stability"]),
+        "smoothness": float(scores["smoothness"]),
+        "mean_interval": float(rhythm["mean_interval"]),
+        "std_interval": float(rhythm["std_interval"]),
+        "rhythm_score": float(rhythm["rhythm_score"]),
+        "grips_left": len(grips["left_arm"]),
+        "grips_right": len(grips["right_arm"]),
+        "avg_grip_left": average_duration(grips["left_arm"]),
+        "avg_grip_right": average_duration(grips["right_arm"]),
+        "partial_falls": len(falls["partial_falls"]),
+        "full_falls": len(falls["full_falls"]),
+        "errors": "; ".join(f"{name}: {message}" for name, message in errors.items())
+    }
+
+
+def score_folder(folder, profile=None, stream=False):
+    # worker: one session, parsed once, every metric through the same get_* functions as the GUI
+    # (or with stream, the chunked equivalents in streaming.py)
+    start = time.perf_counter()
+    try:
+        if stream:
+            from streaming import stream_scores
+            scores, errors = stream_scores(folder, profile)
+        else:
+            scores, errors = score_all(Session.load(folder), profile)
+    except Exception as e:
+        return {"session": folder, "status": "error", "seconds": round(time.perf_counter() - start, 3),
+                "errors": f"load: {type(e).__name__}: {e}"}
+    return summary_row(folder, scores, errors, time.perf_counter() - start)
+
+
+class ResultsFile:
+    """
+    Summary rows appended to a .jsonl or .csv file, one per session, flushed as they come
+    in so an interrupted run loses nothing. done(profile) lists the sessions already in the
+    file with an ok row scored with that profile_key.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.endswith(".csv")
+        self.file = None
+        self.writer = None
+
+    def done(self, profile=""):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline='') as f:
+            if self.is_csv:
+                rows = csv.DictReader(f)
+                if rows.fieldnames and "session" not in rows.fieldnames:
+                    raise ValueError(f"{self.path} is not a batch results file")
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+            return {row["session"] for row in rows if row.get("status") == "ok" and row.get("profile", "") == profile}
+
+    def open(self, truncate=False):
+        # truncate starts the file over, otherwise rows are appended
+        new = truncate or not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.file = open(self.path, "w" if truncate else "a", newline='')
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if new:
+                self.writer.writeheader()
+
+    def write(self, row):
+        if self.is_csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def progress(done, total, row, started):
+    elapsed = time.perf_counter() - started
+    eta = elapsed / done * (total - done)
+    line = f"[{done}/{total}] {row['status']:5} {row['seconds']:6.2f} s  {row['session']}  (eta {eta:.0f} s)"
+    if row.get("errors"):
+        line += f"\n    {row['errors']}"
+    print(line, file=sys.stderr)
+
+
+def run_batch(paths, output, workers=None, resume=True, profile=None, stream=False):
+    """
+    Scores every session under paths in a process pool, one session per worker, and
+    appends a summary row per session to output. With resume, sessions that already have
+    an ok row in output scored with the same profile are skipped, failed ones are
+    retried; without it, output is started over. profile: threshold
+    overrides per metric, see calibrate.load_profile. With stream, sessions are read in
+    chunks so each worker's memory stays the same for sessions of any length.
+    """
+    results = ResultsFile(output)
+    sessions = find_sessions(paths)
+    key = profile_key(profile)
+    if resume:
+        done = results.done(key)
+        skipped = len(sessions)
+        sessions = [folder for folder in sessions if folder not in done]
+        skipped -= len(sessions)
+        if skipped:
+            print(f"[*] Skipping {skipped} sessions already in {output}", file=sys.stderr)
+    if not sessions:
+        print("[*] Nothing to score", file=sys.stderr)
+        return 0
+
+    print(f"[*] Scoring {len(sessions)} sessions", file=sys.stderr)
+    failed = 0
+    started = time.perf_counter()
+    results.open(truncate=not resume)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(score_folder, folder, profile, stream): folder for folder in sessions}
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    row = future.result()
+                except Exception as e:
+                    row = {"session": futures[future], "status": "error", "seconds": 0.0,
+                           "errors": f"worker: {type(e).__name__}: {e}"}
+                failed += row["status"] != "ok"
+                row["profile"] = key
+                results.write(row)
+                progress(done, len(sessions), row, started)
+    finally:
+        results.close()
+
+    print(f"[+] {len(sessions) - failed} scored, {failed} failed, {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
+    # python code/batch.py archive/ -o results.csv
+    # python code/batch.py data archive/2025-07-18 -o results.jsonl --workers 8
+    parser = argparse.ArgumentParser(description="Score many recorded sessions without the GUI.")
+    parser.add_argument("paths", nargs="+", help="session folders, or folders of session folders")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="summary file, .jsonl or .csv (default: results.jsonl)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", help="re-score sessions already in the output")
+    parser.add_argument("--climber", help="score with this climber's calibrated thresholds (see calibrate.py)")
+    parser.add_argument("--profiles", default="data", help="folder of profiles.json (default: data)")
+    parser.add_argument("--stream", action="store_true", help="score in constant memory, for very long sessions")
+    args = parser.parse_args(argv)
+    profile = None
+    if args.climber:
+        from calibrate import load_profile
+        profile = load_profile(args.climber, args.profiles)
+        if not profile:
+            print(f"[!] No calibrated thresholds for {args.climber}, using the defaults", file=sys.stderr)
+    failed = run_batch(args.paths, args.output, args.workers, args.resume, profile, args.stream)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from arm_leg_usage import get_arm_leg_usage
+from binary_format import format_timestamp, local_time_ns
+from fall_rhythm import get_falls, get_rhythm
+from grip_count import get_grip_count
+from orientation import estimate_orientation
+from session import LimbData, Session
+from smoothness import get_smoothness_score
+from stability import get_stability
+from streaming import stream_scores
+from synth import generate_session, write_session
+
+METRICS = {
+    "get_stability": get_stability,
+    "get_smoothness_score": get_smoothness_score,
+    "get_rhythm": get_rhythm,
+    "get_falls": get_falls,
+    "get_grip_count": get_grip_count,
+    "get_arm_leg_usage": get_arm_leg_usage,
+    "estimate_orientation": estimate_orientation
+}
+
+DURATIONS = [60, 600, 3600, 4 * 3600]   # 1 minute to 4 hours
+REGRESSION_TOLERANCE = 1.25             # slower than baseline by more than this is a regression
+
+# modules the GUI imports before its window appears, and what they must not pull in
+STARTUP_MODULES = ["logger", "gui"]
+DEFERRED_MODULES = ["pandas", "matplotlib", "scoring"]
+STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(" ".join(name for name in {deferred} if name in sys.modules))
+"""
+
+
+def fresh(session):
+    # same arrays, new LimbData, so no metric benefits from magnitudes an earlier one cached
+    return Session(session.folder, {part: LimbData(limb.timestamps, limb.values)
+                                    for part, limb in session.limbs.items()})
+
+
+def measure(fn, make_arg, repeat):
+    """
+    Best and median wall time over repeat runs, then peak traced memory of one more run.
+    tracemalloc slows Python code down, so it is kept out of the timed runs. Anything the
+    function prints is swallowed.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            arg = make_arg()
+            gc.collect()
+            start = time.perf_counter()
+            fn(arg)
+            times.append(time.perf_counter() - start)
+
+        arg = make_arg()
+        gc.collect()
+        tracemalloc.start()
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+def run_benchmarks(durations=DURATIONS, metrics=None, repeat=3, seed=0, load=False, print_callback=print):
+    """
+    Times and memory-profiles every metric on synthetic sessions of each duration
+    (seconds). With load, Session.load of the same session written as CSV and as binary
+    is measured too, and stream_scores on the binary files. Returns the result rows.
+    """
+    metrics = metrics or list(METRICS)
+    results = []
+    for duration in durations:
+        session = generate_session(duration, seed=seed)
+        samples = sum(len(limb) for limb in session.limbs.values())
+        print_callback(f"[*] {duration / 60:g} min session, {samples} samples")
+        # long sessions get fewer repeats, their timings are stable anyway
+        runs = repeat if duration <= 600 else 1
+
+        jobs = [(name, METRICS[name], lambda: fresh(session)) for name in metrics]
+        tmp = None
+        if load:
+            tmp = tempfile.TemporaryDirectory()
+            csv_dir = os.path.join(tmp.name, "csv")
+            bin_dir = os.path.join(tmp.name, "bin")
+            write_session(session, csv_dir)
+            write_session(session, bin_dir, binary=True)
+            jobs += [("load_csv", Session.load, lambda: csv_dir),
+                     ("load_binary", Session.load, lambda: bin_dir),
+                     ("stream_scores", stream_scores, lambda: bin_dir)]
+
+        try:
+            for name, fn, make_arg in jobs:
+                best, median, peak = measure(fn, make_arg, runs)
+                results.append({
+                    "benchmark": name,
+                    "duration_s": duration,
+                    "samples": samples,
+                    "runs": runs,
+                    "best_s": round(best, 6),
+                    "median_s": round(median, 6),
+                    "us_per_sample": round(best / samples * 1e6, 4),
+                    "peak_bytes": peak
+                })
+                print_callback(f"    {name:22} {best * 1000:10.1f} ms  {peak / 2 ** 20:8.1f} MiB peak")
+        finally:
+            if tmp is not None:
+                tmp.cleanup()
+    return results
+
+
+def measure_startup(repeat=5, print_callback=print):
+    """
+    Import time of each of STARTUP_MODULES in a fresh interpreter (the GUI's startup
+    cost before the window appears), and which DEFERRED_MODULES the import loaded anyway.
+    """
+    results = []
+    for module in STARTUP_MODULES:
+        script = STARTUP_SCRIPT.format(module=module, deferred=DEFERRED_MODULES)
+        times, loaded = [], []
+        for _ in range(repeat):
+            out = subprocess.run([sys.executable, "-c", script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                 capture_output=True, text=True, check=True).stdout.splitlines()
+            times.append(float(out[0]))
+            loaded = out[1].split() if len(out) > 1 else []
+        results.append({
+            "benchmark": f"import_{module}",
+            "duration_s": 0,
+            "samples": 0,
+            "runs": repeat,
+            "best_s": round(min(times), 6),
+            "median_s": round(statistics.median(times), 6),
+            "us_per_sample": None,
+            "peak_bytes": None,
+            "deferred_loaded": loaded
+        })
+        print_callback(f"    import {module:15} {min(times) * 1000:10.1f} ms"
+                       + (f"  [!] also loaded {', '.join(loaded)}" if loaded else ""))
+    return results
+
+
+def environment():
+    return {
+        "created": format_timestamp(local_time_ns()),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count()
+    }
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    # rows of results more than tolerance times slower than the same benchmark in baseline
+    previous = {(row["benchmark"], row["duration_s"]): row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        old = previous.get((row["benchmark"], row["duration_s"]))
+        if old is not None and old["best_s"] > 0 and row["best_s"] / old["best_s"] > tolerance:
+            regressions.append({**row, "baseline_s": old["best_s"], "ratio": round(row["best_s"] / old["best_s"], 3)})
+    return regressions
+
+
+def main(argv=None):
+    # python code/benchmark.py -o benchmark.json
+    # python code/benchmark.py --minutes 1 10 --load --baseline benchmark.json
+    # python code/benchmark.py --minutes 1 --startup
+    parser = argparse.ArgumentParser(description="Time and memory-profile the metrics on synthetic sessions.")
+    parser.add_argument("-o", "--output", default="benchmark.json", help="JSON report (default: benchmark.json)")
+    parser.add_argument("--minutes", type=float, nargs="+", help="session lengths (default: 1 10 60 240)")
+    parser.add_argument("--metric", action="append", choices=list(METRICS), help="only these metrics")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs for sessions up to 10 minutes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--load", action="store_true", help="also time loading the session from CSV and binary")
+    parser.add_argument("--startup", action="store_true", help="also time the GUI's imports before its window appears")
+    parser.add_argument("--baseline", help="earlier report to check for regressions")
+    args = parser.parse_args(argv)
+
+    durations = [m * 60 for m in args.minutes] if args.minutes else DURATIONS
+    results = run_benchmarks(durations, args.metric, args.repeat, args.seed, args.load)
+    if args.startup:
+        print("[*] Startup")
+        results += measure_startup()
+    report = {**environment(), "seed": args.seed, "results": results}
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = compare(results, json.load(f))
+        for row in report["regressions"]:
+            print(f"[!] {row['benchmark']} at {row['duration_s'] / 60:g} min: "
+                  f"{row['best_s']:.3f} s vs {row['baseline_s']:.3f} s ({row['ratio']}x)")
+        status = 1 if report["regressions"] else 0
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[+] Report written to {args.output}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import os
+import csv
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# File layout: a 16 byte header followed by fixed-width little-endian records.
+#   header: MAGIC (8 bytes), format version (uint32), record size in bytes (uint32)
+#   record: timestamp (int64 ns) + accX..magZ (9 x float32) = 44 bytes
+# Timestamps are host wall-clock nanoseconds since 1970-01-01, local time, the same
+# clock the CSV files' isoformat() strings are written in.
+
+MAGIC = b"ALTIUSIM"
+FORMAT_VERSION = 1
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")])
+RECORD_DTYPE = np.dtype([("timestamp", "<i8"), ("values", "<f4", (9,))])
+HEADER_SIZE = HEADER_DTYPE.itemsize
+
+CSV_HEADER = [
+    "timestamp",
+    "accX", "accY", "accZ",
+    "gyroX", "gyroY", "gyroZ",
+    "magX", "magY", "magZ"
+]
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def local_time_ns():
+    # wall clock in local time, matching datetime.now() in the CSV logger
+    return time.time_ns() + time.localtime().tm_gmtoff * 1_000_000_000
+
+
+def format_timestamp(ns):
+    # back to the logger's datetime.now().isoformat() string
+    return (EPOCH + timedelta(microseconds=int(ns) // 1000)).isoformat()
+
+
+class BinaryWriter:
+    """
+    Appends records to a binary session file in blocks.
+
+    Samples are collected in a preallocated block and written out once it fills up
+    (or on flush/close), so a notification only costs a couple of array stores.
+    """
+
+    def __init__(self, filename, block_records=256, mode='w'):
+        exists = mode == 'a' and os.path.exists(filename) and os.path.getsize(filename) >= HEADER_SIZE
+        if exists:
+            read_header(filename)
+        self.file = open(filename, 'ab' if exists else 'wb')
+        if not exists:
+            header = np.zeros(1, dtype=HEADER_DTYPE)
+            header[0] = (MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize)
+            self.file.write(header.tobytes())
+        self.block = np.zeros(block_records, dtype=RECORD_DTYPE)
+        self.block_timestamps = self.block["timestamp"]
+        self.block_values = self.block["values"]
+        self.pending = 0
+        self.records_written = 0
+
+    def write_sample(self, timestamp_ns, values):
+        self.block_timestamps[self.pending] = timestamp_ns
+        self.block_values[self.pending] = values
+        self.pending += 1
+        if self.pending == len(self.block):
+            self.flush()
+
+    def write_records(self, records):
+        # records: structured array of RECORD_DTYPE
+        self.flush()
+        self.file.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
+        self.records_written += len(records)
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.block[:self.pending].tobytes())
+            self.records_written += self.pending
+            self.pending = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read_header(filename):
+    header = np.fromfile(filename, dtype=HEADER_DTYPE, count=1)
+    if len(header) == 0 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{filename} is not an Altius binary session file")
+    if header[0]["version"] != FORMAT_VERSION or header[0]["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{filename} has unsupported format version {header[0]['version']}")
+    return header[0]
+
+
+def read_binary(filename):
+    """
+    Memory-maps a binary session file as a structured array of RECORD_DTYPE.
+
+    Nothing is copied: rec['timestamp'] and rec['values'] are views onto the file.
+    A record cut short by a crash mid-write is ignored.
+    """
+    read_header(filename)
+    count = (os.path.getsize(filename) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(filename, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def iter_binary(filename, chunk_records):
+    """
+    The records of a binary session file as consecutive structured arrays of at most
+    chunk_records, read one at a time so memory does not grow with the file. A record cut
+    short by a crash mid-write is ignored, as in read_binary.
+    """
+    read_header(filename)
+    remaining = (os.path.getsize(filename) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    with open(filename, 'rb') as f:
+        f.seek(HEADER_SIZE)
+        while remaining > 0:
+            records = np.fromfile(f, dtype=RECORD_DTYPE, count=min(chunk_records, remaining))
+            if len(records) == 0:
+                break
+            remaining -= len(records)
+            yield records
+
+
+def csv_to_binary(csv_path, bin_path):
+    from session import read_limb_csv
+
+    limb = read_limb_csv(csv_path)
+    records = np.zeros(len(limb), dtype=RECORD_DTYPE)
+    records["timestamp"] = limb.timestamps
+    records["values"] = limb.values
+
+    writer = BinaryWriter(bin_path)
+    writer.write_records(records)
+    writer.close()
+    return len(records)
+
+
+def binary_to_csv(bin_path, csv_path):
+    records = read_binary(bin_path)
+    with open(csv_path, mode='w', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(CSV_HEADER)
+        for ts, values in zip(records["timestamp"].tolist(), records["values"].tolist()):
+            csv_writer.writerow([format_timestamp(ts)] + values)
+    return len(records)
+
+
+def convert_folder(folder, to_binary=True):
+    # converts every limb file in a session folder, leaving the originals in place
+    src_ext, dst_ext = (".csv", ".bin") if to_binary else (".bin", ".csv")
+    convert = csv_to_binary if to_binary else binary_to_csv
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(src_ext):
+            continue
+        src = os.path.join(folder, name)
+        dst = os.path.join(folder, name[:-len(src_ext)] + dst_ext)
+        count = convert(src, dst)
+        print(f"[+] {src} -> {dst} ({count} samples)")
+
+
+if __name__ == "__main__":
+    # python code/binary_format.py to-bin data
+    # python code/binary_format.py to-csv data
+    if len(sys.argv) != 3 or sys.argv[1] not in ("to-bin", "to-csv"):
+        print("usage: binary_format.py to-bin|to-csv <session folder>")
+        sys.exit(1)
+    convert_folder(sys.argv[2], to_binary=sys.argv[1] == "to-bin")
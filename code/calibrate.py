@@ -0,0 +1,397 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from arm_leg_usage import usage_summary
+from fall_rhythm import find_synced_events
+from resample import estimate_sample_rate
+from session import PARTS, load_session
+from smoothness import LIMB_NAMES, median_movement_jerk, movement_stats
+from trends import DEFAULT_CLIMBER
+from windowing import run_lengths, window_view
+
+DATA_DIR = "data"
+PROFILES = "profiles.json"
+ARMS = ["left_arm", "right_arm"]
+STABILITY_LIMBS = ["left_leg", "right_leg", "left_arm", "right_arm"]   # get_stability's averaging order
+WINDOW_SECONDS = 0.25     # stability and grip window length, as in their metrics
+
+# thresholds tried per metric; every list contains the metric's default
+GRIDS = {
+    "falls": {
+        "partial_threshold": [6.0, 7.0, 8.0, 9.0, 10.0, 11.0, 12.0, 13.0, 14.0, 15.0],
+        "sync_window": [0.25, 0.5, 0.75, 1.0, 1.5],
+    },
+    "usage": {
+        "movement_threshold": [round(0.2 + 0.1 * i, 1) for i in range(19)],
+    },
+    "stability": {
+        "accel_thresh": [0.06, 0.08, 0.1, 0.12, 0.15, 0.2],
+        "gyro_thresh": [15, 20, 30, 40, 60],
+        "stillness_tol_acc": [0.25, 0.5, 1, 1.5],
+        "stillness_tol_gyro": [25, 50, 75, 100],
+        "min_consec_windows": [2, 3, 4],
+    },
+    "grips": {
+        "stillness_tol_acc": [0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5],
+        "stillness_tol_gyro": [10, 20, 30, 50, 75, 100],
+        "min_consec_windows": [2, 3, 4, 5, 6],
+    },
+    "smoothness": {
+        "stillness_accel_threshold": [0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.5],
+        "stillness_gyro_threshold": [2.0, 4.0, 6.0, 8.0, 10.0, 15.0, 20.0],
+        "max_expected_jerk": [500.0, 750.0, 1000.0, 1500.0, 2000.0],
+    },
+}
+
+DEFAULTS = {
+    "falls": {"partial_threshold": 10.0, "sync_window": 0.5},
+    "usage": {"movement_threshold": 0.8},
+    "stability": {"accel_thresh": 0.12, "gyro_thresh": 30, "stillness_tol_acc": 1, "stillness_tol_gyro": 50,
+                  "min_consec_windows": 3},
+    "grips": {"stillness_tol_acc": 1, "stillness_tol_gyro": 50, "min_consec_windows": 3},
+    "smoothness": {"stillness_accel_threshold": 0.8, "stillness_gyro_threshold": 8.0, "max_expected_jerk": 1000.0},
+}
+
+# calibration target -> the metric whose thresholds it tunes
+TARGETS = {
+    "full_falls": "falls",
+    "partial_falls": "falls",
+    "arm_usage_ratio": "usage",
+    "stability": "stability",
+    "grips_left": "grips",
+    "grips_right": "grips",
+    "smoothness": "smoothness",
+}
+
+
+def combinations(grid):
+    # param -> flat array over every combination, the last param varying fastest
+    axes = np.meshgrid(*[np.asarray(values) for values in grid.values()], indexing='ij')
+    return {name: axis.ravel() for name, axis in zip(grid, axes)}
+
+
+# ---- sweeps: each returns output name -> array with one value per combinations(grid) entry ----
+
+def sweep_falls(session, grid):
+    """
+    Partial falls are counted against every partial_threshold with one searchsorted on each
+    limb's sorted magnitudes. Full falls only ever involve samples above the lowest threshold,
+    so those are gathered once and each combination runs find_synced_events on that short list.
+    """
+    thresholds = np.asarray(grid["partial_threshold"], dtype=np.float64)
+    windows = grid["sync_window"]
+    lowest = thresholds.min()
+
+    partial = np.zeros(len(thresholds), dtype=np.int64)
+    candidate_times, candidate_parts, candidate_mags = [], [], []
+    for part in PARTS:
+        limb = session.get(part)
+        if limb is None:
+            continue
+        mags = limb.acc_magnitude()
+        ordered = np.sort(mags)
+        partial += len(ordered) - np.searchsorted(ordered, thresholds, side='right')
+        hits = np.flatnonzero(mags > lowest)
+        candidate_times.append(np.asarray(limb.timestamps[hits], dtype=np.int64))
+        candidate_parts.append(np.full(len(hits), PARTS.index(part)))
+        candidate_mags.append(mags[hits])
+
+    full = np.zeros((len(thresholds), len(windows)), dtype=np.int64)
+    if candidate_times:
+        times = np.concatenate(candidate_times)
+        parts = np.concatenate(candidate_parts)
+        mags = np.concatenate(candidate_mags)
+        for i, threshold in enumerate(thresholds):
+            above = mags > threshold
+            for j, window in enumerate(windows):
+                full[i, j] = len(find_synced_events(times[above], parts[above], len(PARTS), window))
+
+    return {"partial_falls": np.repeat(partial, len(windows)), "full_falls": full.ravel()}
+
+
+def sweep_usage(session, grid):
+    thresholds = np.asarray(grid["movement_threshold"], dtype=np.float64)
+    counts = {}
+    for part in PARTS:
+        limb = session.get(part)
+        if limb is None:
+            continue
+        jumps = np.sort(np.abs(np.diff(limb.acc_magnitude())))
+        counts[part] = len(jumps) - np.searchsorted(jumps, thresholds, side='right')
+    # the ratio rounding and comment stay with usage_summary, one call per threshold
+    ratios = [usage_summary({part: int(c[i]) for part, c in counts.items()})["arm_usage_ratio"]
+              for i in range(len(thresholds))]
+    return {"arm_usage_ratio": np.array(ratios)}
+
+
+def window_length(limb):
+    return max(1, int(WINDOW_SECONDS * estimate_sample_rate(limb.timestamps)))
+
+
+def hold_masks(still, min_lengths):
+    """
+    still: (rows, windows) bool. Returns (len(min_lengths), rows, windows), True for windows
+    in a run of at least min_length still windows of their row. Rows are run-length encoded
+    together, with a break at every row start.
+    """
+    rows, windows = still.shape
+    breaks = np.zeros(still.shape, dtype=bool)
+    breaks[:, 0] = True
+    starts, lengths, values = run_lengths(still.ravel(), breaks.ravel())
+    return np.stack([np.repeat(values & (lengths >= m), lengths).reshape(rows, windows) for m in min_lengths])
+
+
+def sweep_stability(session, grid):
+    """
+    Window means and stds are computed once per limb. The stillness tolerances give a
+    (tol_acc, tol_gyro, windows) still mask, each min_consec_windows a hold mask from it, the
+    std thresholds a (accel, gyro, windows) stable mask; stable windows within holds for every
+    combination are then one matrix product.
+    """
+    shape = tuple(len(values) for values in grid.values())
+    accel, gyro = np.asarray(grid["accel_thresh"]), np.asarray(grid["gyro_thresh"])
+    tol_acc, tol_gyro = np.asarray(grid["stillness_tol_acc"]), np.asarray(grid["stillness_tol_gyro"])
+    min_consec = grid["min_consec_windows"]
+
+    scores = []
+    for part in STABILITY_LIMBS:
+        limb = session.get(part)
+        if limb is None:
+            continue
+        window_len = window_length(limb)
+        acc_windows = window_view(limb.acc.astype(np.float64), window_len)
+        gyro_windows = window_view(limb.gyro.astype(np.float64), window_len)
+        acc_off = np.mean(np.abs(np.linalg.norm(acc_windows, axis=2) - 1.0), axis=1)
+        gyro_off = np.mean(np.abs(np.linalg.norm(gyro_windows, axis=2) - 1.0), axis=1)
+        acc_std = np.std(acc_windows, axis=1).max(axis=1, initial=-np.inf)
+        gyro_std = np.std(gyro_windows, axis=1).max(axis=1, initial=-np.inf)
+        if len(acc_off) == 0:
+            scores.append(np.zeros(shape))
+            continue
+
+        still = (acc_off < tol_acc[:, None, None]) & (gyro_off < tol_gyro[None, :, None])
+        hold = hold_masks(still.reshape(-1, len(acc_off)), min_consec)           # (m, tol pairs, windows)
+        hold = hold.transpose(1, 0, 2).reshape(-1, len(acc_off))                  # (tol_acc, tol_gyro, m) rows
+        stable = (acc_std < accel[:, None, None]) & (gyro_std < gyro[None, :, None])
+        stable = stable.reshape(-1, len(acc_off))
+
+        stable_in_hold = stable.astype(np.float64) @ hold.T.astype(np.float64)    # (accel * gyro, tol * m)
+        analyzed = hold.sum(axis=1)
+        score = np.divide(stable_in_hold, analyzed, out=np.zeros_like(stable_in_hold), where=analyzed > 0)
+        scores.append(score.reshape(shape))
+
+    if not scores:
+        return {"stability": np.zeros(shape).ravel()}
+    return {"stability": np.mean(np.stack(scores), axis=0).ravel()}
+
+
+def sweep_grips(session, grid):
+    shape = tuple(len(values) for values in grid.values())
+    tol_acc, tol_gyro = np.asarray(grid["stillness_tol_acc"]), np.asarray(grid["stillness_tol_gyro"])
+    min_consec = np.asarray(grid["min_consec_windows"])
+
+    counts = {}
+    for side, name in zip(ARMS, ("grips_left", "grips_right")):
+        limb = session.get(side)
+        if limb is None or len(limb) == 0:
+            counts[name] = np.zeros(shape, dtype=np.int64).ravel()
+            continue
+        window_len = window_length(limb)
+        acc_off = np.mean(np.abs(window_view(limb.acc_magnitude(), window_len) - 1.0), axis=1)
+        gyro_level = np.mean(window_view(limb.gyro_magnitude(), window_len), axis=1)
+        if len(acc_off) == 0:
+            counts[name] = np.zeros(shape, dtype=np.int64).ravel()
+            continue
+        still = (acc_off < tol_acc[:, None, None]) & (gyro_level < tol_gyro[None, :, None])
+        still = still.reshape(-1, len(acc_off))
+
+        breaks = np.zeros(still.shape, dtype=bool)
+        breaks[:, 0] = True
+        starts, lengths, values = run_lengths(still.ravel(), breaks.ravel())
+        rows = starts // len(acc_off)
+        # runs per row that are still and at least m windows long, for every m
+        long_enough = values[:, None] & (lengths[:, None] >= min_consec[None, :])
+        per_row = np.zeros((len(still), len(min_consec)), dtype=np.int64)
+        np.add.at(per_row, rows, long_enough)
+        counts[name] = per_row.ravel()
+    return counts
+
+
+def sweep_smoothness(session, grid):
+    """
+    Each limb's rolling stds and jerks come from movement_stats once; every stillness
+    threshold pair then only re-detects the movements and takes their median jerk, and
+    max_expected_jerk is applied to those medians by broadcasting.
+    """
+    acc_thresholds = grid["stillness_accel_threshold"]
+    gyro_thresholds = grid["stillness_gyro_threshold"]
+    max_jerk = np.asarray(grid["max_expected_jerk"], dtype=np.float64)
+
+    total = np.zeros((len(acc_thresholds), len(gyro_thresholds), len(max_jerk)))
+    scored = 0
+    for part in LIMB_NAMES.values():
+        limb = session.get(part)
+        if limb is None or len(limb) == 0:
+            continue
+        stats = movement_stats(limb)
+        median = np.full((len(acc_thresholds), len(gyro_thresholds)), np.nan)
+        for i, j in itertools.product(range(len(acc_thresholds)), range(len(gyro_thresholds))):
+            jerk, movements = median_movement_jerk(limb, stats, acc_thresholds[i], gyro_thresholds[j])
+            if movements and jerk is not None:
+                median[i, j] = jerk
+        score = np.clip(1 - median[:, :, None] / max_jerk, 0.0, 1.0) * 100
+        total += np.where(np.isnan(score), 100.0, score)
+        scored += 1
+    return {"smoothness": (total / scored if scored else total).ravel()}
+
+
+SWEEPS = {
+    "falls": sweep_falls,
+    "usage": sweep_usage,
+    "stability": sweep_stability,
+    "grips": sweep_grips,
+    "smoothness": sweep_smoothness,
+}
+
+
+def sweep(session, metrics=None, grids=GRIDS):
+    """
+    Every threshold combination of each metric's grid evaluated against one session.
+    Returns metric -> (combinations, outputs), both name -> flat array, index-aligned.
+    """
+    session = load_session(session)
+    results = {}
+    for metric in metrics or SWEEPS:
+        grid = grids[metric]
+        results[metric] = (combinations(grid), SWEEPS[metric](session, grid))
+    return results
+
+
+def best_combination(combos, outputs, targets, defaults):
+    """
+    Index of the combination whose outputs are closest to targets (output -> value), each
+    output's miss relative to its target (at least 1). Ties go to the combination nearest
+    the defaults.
+    """
+    miss = sum(np.abs(outputs[name] - target) / max(abs(target), 1.0) for name, target in targets.items())
+    drift = sum(np.abs(values - defaults[name]) / abs(defaults[name]) for name, values in combos.items())
+    return int(np.lexsort((drift, np.round(miss, 9)))[0])
+
+
+def calibrate(session, targets, grids=GRIDS):
+    """
+    The threshold profile that brings the session's scores closest to targets (output name
+    -> value, see TARGETS). Only metrics with a target are swept and end up in the profile.
+    Returns (profile, sweeps): metric -> params, and sweep()'s result.
+    """
+    by_metric = {}
+    for name, value in targets.items():
+        if name not in TARGETS:
+            raise ValueError(f"Unknown target {name}, expected one of {', '.join(TARGETS)}")
+        by_metric.setdefault(TARGETS[name], {})[name] = value
+
+    sweeps = sweep(session, list(by_metric), grids)
+    profile = {}
+    for metric, metric_targets in by_metric.items():
+        combos, outputs = sweeps[metric]
+        best = best_combination(combos, outputs, metric_targets, DEFAULTS[metric])
+        profile[metric] = {name: values[best].item() for name, values in combos.items()}
+    return profile, sweeps
+
+
+# ---- profiles: data/profiles.json, climber -> metric -> threshold keyword arguments ----
+
+def profiles_path(root=DATA_DIR):
+    return os.path.join(root, PROFILES)
+
+
+def load_profiles(root=DATA_DIR):
+    path = profiles_path(root)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_profile(climber, root=DATA_DIR):
+    # metric -> threshold overrides for scoring, empty for a climber who was never calibrated
+    return load_profiles(root).get(climber or DEFAULT_CLIMBER, {})
+
+
+def save_profile(climber, profile, root=DATA_DIR):
+    # merges profile into the climber's saved one per metric: metrics and settings not in it
+    # (e.g. an opt-in "linear") keep their saved values
+    profiles = load_profiles(root)
+    saved = profiles.setdefault(climber or DEFAULT_CLIMBER, {})
+    for metric, params in profile.items():
+        saved.setdefault(metric, {}).update(params)
+    path = profiles_path(root)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def write_sweeps(path, sweeps):
+    # one row per metric and combination, params and outputs as columns
+    with open(path, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["metric", "params", "outputs"])
+        for metric, (combos, outputs) in sweeps.items():
+            for i in range(len(next(iter(combos.values())))):
+                params = ";".join(f"{name}={values[i].item()}" for name, values in combos.items())
+                values = ";".join(f"{name}={values[i].item()}" for name, values in outputs.items())
+                writer.writerow([metric, params, values])
+
+
+def parse_target(text):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected name=value, got {text}")
+    try:
+        return name, float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a number: {value}")
+
+
+if __name__ == "__main__":
+    # python code/calibrate.py data --climber alex --target grips_left=14 --target grips_right=12
+    # python code/calibrate.py data --target full_falls=1 --sweep sweep.csv --dry-run
+    parser = argparse.ArgumentParser(description="Tune the metric thresholds to a climber on a reference session.")
+    parser.add_argument("folder", help="reference session the targets were counted on")
+    parser.add_argument("--climber", default=DEFAULT_CLIMBER)
+    parser.add_argument("--target", type=parse_target, action="append", default=[], metavar="NAME=VALUE",
+                        help=f"expected score, one of {', '.join(TARGETS)}; repeatable")
+    parser.add_argument("--root", default=DATA_DIR, help="folder of profiles.json")
+    parser.add_argument("--sweep", help="also write every combination's outputs to this CSV")
+    parser.add_argument("--dry-run", action="store_true", help="print the profile without saving it")
+    args = parser.parse_args()
+    if not args.target:
+        parser.error("at least one --target is needed")
+
+    session = load_session(args.folder)
+    start = time.perf_counter()
+    try:
+        profile, sweeps = calibrate(session, dict(args.target))
+    except ValueError as e:
+        print(f"[!] {e}", file=sys.stderr)
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+
+    tried = sum(len(next(iter(combos.values()))) for combos, _ in sweeps.values())
+    print(f"[*] {tried} threshold combinations in {elapsed:.2f} s")
+    for metric, params in profile.items():
+        print(f"  {metric}: " + ", ".join(f"{name}={value}" for name, value in params.items()))
+    if args.sweep:
+        write_sweeps(args.sweep, sweeps)
+        print(f"[+] Sweep written to {args.sweep}")
+    if not args.dry_run:
+        save_profile(args.climber, profile, args.root)
+        print(f"[+] Profile of {args.climber} saved to {profiles_path(args.root)}")
@@ -0,0 +1,148 @@
+import json
+import os
+import sys
+
+from binary_format import format_timestamp, local_time_ns
+from session import PARTS, Session, find_limb_file, is_session, read_manifest
+
+DATA_DIR = "data"
+CATALOG = "catalog.json"
+
+
+def file_signature(folder):
+    # what a session's scores are computed from: its limb files' names, sizes and mtimes
+    signature = {}
+    for part in PARTS:
+        path = find_limb_file(folder, part)
+        if path is not None:
+            stat = os.stat(path)
+            signature[part] = [os.path.basename(path), stat.st_size, stat.st_mtime_ns]
+    return signature
+
+
+def to_json(value):
+    # numpy scalars become plain numbers and tuples lists, so cached and fresh scores look alike
+    return json.loads(json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o)))
+
+
+class Catalog:
+    """
+    Index of the recorded sessions under root, kept in root/catalog.json.
+
+    Every entry holds the session's manifest and, once scored, its scores with the
+    signature of the limb files they came from. Browsing or comparing past sessions reads
+    this one file; a session is only reloaded and re-scored when its files changed.
+    """
+
+    def __init__(self, root=DATA_DIR):
+        self.root = root
+        self.path = os.path.join(root, CATALOG)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        # write-then-rename, an interrupted save never leaves a truncated catalog
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def key(self, folder):
+        return os.path.relpath(folder, self.root)
+
+    def folder(self, key):
+        return os.path.normpath(os.path.join(self.root, key))
+
+    def add(self, folder):
+        entry = self.entries.setdefault(self.key(folder), {})
+        entry["manifest"] = read_manifest(folder)
+        return entry
+
+    def refresh(self):
+        """
+        Adds session folders under root that are not in the catalog yet and drops entries
+        whose folder is gone. Returns the keys that were added.
+        """
+        folders = [self.root] if is_session(self.root) else []
+        folders += [os.path.join(self.root, name) for name in sorted(os.listdir(self.root))
+                    if os.path.isdir(os.path.join(self.root, name))]
+        added = []
+        for folder in folders:
+            if self.key(folder) not in self.entries and is_session(folder):
+                self.add(folder)
+                added.append(self.key(folder))
+        for key in list(self.entries):
+            if not is_session(self.folder(key)):
+                del self.entries[key]
+        self.save()
+        return added
+
+    def cached_scores(self, folder):
+        entry = self.entries.get(self.key(folder))
+        if entry is None or "scores" not in entry:
+            return None
+        if entry.get("signature") != file_signature(folder):
+            return None
+        return entry["scores"]
+
+    def store_scores(self, folder, scores):
+        entry = self.entries.get(self.key(folder)) or self.add(folder)
+        entry["scores"] = to_json(scores)
+        entry["signature"] = file_signature(folder)
+        entry["scored_at"] = format_timestamp(local_time_ns())
+        self.save()
+
+    def scores(self, folder):
+        """
+        The session's scores, from the catalog when its files are unchanged since they
+        were scored, otherwise computed with scoring.score_all and cached.
+        """
+        cached = self.cached_scores(folder)
+        if cached is not None:
+            return cached
+        from scoring import score_all
+        scores, errors = score_all(Session.load(folder))
+        if errors:
+            # failed metrics only have placeholder values, don't cache them
+            return to_json(scores)
+        self.store_scores(folder, scores)
+        return self.entries[self.key(folder)]["scores"]
+
+    def sessions(self):
+        # (key, entry) pairs, oldest recording first
+        def started(item):
+            manifest = item[1].get("manifest") or {}
+            return manifest.get("started", ""), item[0]
+        return sorted(self.entries.items(), key=started)
+
+    def compare(self, metric, keys=None):
+        # key -> cached value of one metric, for the sessions that have been scored
+        keys = keys if keys is not None else [key for key, _ in self.sessions()]
+        return {key: self.entries[key]["scores"][metric] for key in keys
+                if "scores" in self.entries.get(key, {})}
+
+
+def print_catalog(catalog):
+    print(f"{'session':28} {'duration':>9} {'stability':>10} {'smoothness':>11} {'grips L/R':>10}")
+    for key, entry in catalog.sessions():
+        manifest = entry.get("manifest") or {}
+        duration = f"{manifest['duration']:.0f} s" if "duration" in manifest else "-"
+        scores = entry.get("scores")
+        if scores is None:
+            print(f"{key:28} {duration:>9} {'not scored':>10}")
+            continue
+        grips = scores["grips"] or {"left_arm": [], "right_arm": []}
+        print(f"{key:28} {duration:>9} {scores['stability'] * 100:9.1f}% {scores['smoothness']:10.1f}% "
+              f"{len(grips['left_arm']):>5}/{len(grips['right_arm'])}")
+
+
+if __name__ == "__main__":
+    # python code/catalog.py [data]
+    # indexes new session folders, scores the ones without cached scores and lists them all
+    catalog = Catalog(sys.argv[1] if len(sys.argv) > 1 else DATA_DIR)
+    catalog.refresh()
+    for key, _ in catalog.sessions():
+        catalog.scores(catalog.folder(key))
+    print_catalog(catalog)
@@ -0,0 +1,83 @@
+import struct
+from collections import deque
+
+from fall_rhythm import PARTS
+from packet_format import HEADER_SIZE, LEGACY_PACKET_SIZE, PACKET_VERSION, SAMPLE_SIZE, packet_samples
+
+# Same defaults as fall_rhythm.detect_falls, a climber's calibrated profile overrides them
+PARTIAL_THRESHOLD = 10.0   # acc magnitude
+SYNC_WINDOW = 0.5          # s
+RECENT_EVENTS = 32         # over-threshold packets kept per limb
+
+ACC = struct.Struct("<3f")
+MICROS_SIZE = 4            # a format 2 sample starts with its uint32 micros()
+
+
+def peak_acc_squared(data):
+    """
+    Largest squared acc magnitude among the samples of one raw notification, read straight
+    from the packet bytes of either format (see packet_format.py); 0 for a packet neither
+    format has. No decoding and no allocation, so it can run in the BLE callback.
+    """
+    length = len(data)
+    if length == LEGACY_PACKET_SIZE:
+        x, y, z = ACC.unpack_from(data, 0)
+        return x * x + y * y + z * z
+    if packet_samples(length) is None or data[0] != PACKET_VERSION:
+        return 0.0
+    peak = 0.0
+    for offset in range(HEADER_SIZE + MICROS_SIZE, length, SAMPLE_SIZE):
+        x, y, z = ACC.unpack_from(data, offset)
+        magnitude = x * x + y * y + z * z
+        if magnitude > peak:
+            peak = magnitude
+    return peak
+
+
+class FallDetector:
+    """
+    Full falls while recording, from the notifications as they arrive.
+
+    check() is called for every packet of every limb. A packet with a sample over
+    partial_threshold is an event, stamped with its host receive time and kept in the
+    limb's buffer of recent events; when every one of parts has an event within
+    sync_window, on_fall(start_ns) is called at once with the time.time_ns() of the
+    earliest of them. As in fall_rhythm.find_synced_events, a fall needs all four limbs,
+    so nothing is alerted while one is not connected, and events up to the end of the
+    window belong to the same fall. on_fall runs in the BLE callback, so it should only
+    hand the alert on.
+    """
+
+    def __init__(self, on_fall, partial_threshold=PARTIAL_THRESHOLD, sync_window=SYNC_WINDOW, parts=PARTS):
+        self.on_fall = on_fall
+        self.threshold_squared = partial_threshold ** 2
+        self.window_ns = int(round(sync_window * 1e9))
+        self.recent = {part: deque(maxlen=RECENT_EVENTS) for part in parts}
+        self.quiet_until = None    # end of the last fall's window
+        self.falls = []            # start_ns of every fall alerted
+
+    def check(self, part, recv_ns, data):
+        # the per-packet path: nothing but the magnitude test unless the packet is an event
+        if peak_acc_squared(data) > self.threshold_squared:
+            self.add_event(part, recv_ns)
+
+    def add_event(self, part, recv_ns):
+        events = self.recent.get(part)
+        if events is None:
+            return
+        events.append(recv_ns)
+
+        earliest = recv_ns - self.window_ns
+        if self.quiet_until is not None:
+            earliest = max(earliest, self.quiet_until + 1)
+        start = recv_ns
+        for limb_events in self.recent.values():
+            in_window = [t for t in limb_events if t >= earliest]
+            if not in_window:
+                return
+            start = min(start, in_window[0])
+
+        # every limb's event lies in [start, recv_ns], which sync_window covers
+        self.quiet_until = start + self.window_ns
+        self.falls.append(start)
+        self.on_fall(start)
@@ -1,96 +1,121 @@
-import csv
-from datetime import datetime
-import os
 import numpy as np
-from collections import defaultdict
+
+from binary_format import format_timestamp
+from session import load_session
 
 PARTS = ["left_arm","left_leg","right_arm","right_leg"]
 
-def read_csv_file(filename):
-    data = []
-    with open(filename, 'r') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            try:
-                ts = row['timestamp']
-                accX = float(row['accX'])
-                accY = float(row['accY'])
-                accZ = float(row['accZ'])
-                data.append((ts,accX,accY,accZ))
-            except:
-                continue
-    return data
-
-def load_all_sensor_data(folder):
+def load_all_sensor_data(session):
+    # part -> LimbData
+    session = load_session(session)
     all_data = {}
     for part in PARTS:
-        file_path = os.path.join(folder, f"{part}.csv")
-        if os.path.exists(file_path):
-            all_data[part] = read_csv_file(file_path)
-        else:
-            print(f"No csv file found for {part}")
+        if part in session:
+            all_data[part] = session[part]
     return all_data
 
 
 # fall detection start
-def compute_magnitude(ax,ay,az):
-    return np.sqrt(ax**2 + ay**2 + az**2)
-
-def detect_falls(all_data, partial_threshold = 10.0, sync_window = 0.5):
+def find_synced_events(event_times, event_parts, num_parts, sync_window):
+    """
+    Finds windows [t0, t0 + sync_window] in which every one of num_parts limbs has an event.
+
+    event_times: int64 ns, event_parts: limb index per event. Returns the window start times.
+    A window starts at an event; once one is found, the search resumes after it (same as the
+    old scan), so runs of overlapping windows count as a single fall.
+    """
+    order = np.argsort(event_times, kind='stable')
+    times = event_times[order]
+    parts = event_parts[order]
+    n = len(times)
+    if n == 0:
+        return []
+
+    # window i covers events i .. ends[i] - 1
+    ends = np.searchsorted(times, times + int(round(sync_window * 1e9)), side='right')
+
+    parts_present = np.zeros(n, dtype=np.int64)
+    for p in range(num_parts):
+        cum = np.concatenate(([0], np.cumsum(parts == p)))
+        parts_present += (cum[ends] - cum[:n]) > 0
+    full = np.flatnonzero(parts_present == num_parts)
+
+    starts = []
+    pos = 0
+    while True:
+        k = np.searchsorted(full, pos)
+        if k == len(full):
+            break
+        i = full[k]
+        starts.append(times[i])
+        pos = ends[i]
+    return starts
+
+def detect_falls(magnitudes, partial_threshold = 10.0, sync_window = 0.5):
+    # magnitudes: part -> (timestamps, acc magnitude), see Session.acc_magnitude
     partial_falls = []
-    full_falls = []
-
-    partial_events = defaultdict(list)
-    for part, readings in all_data.items():
-        for ts, ax, ay, az in readings:
-            mag = compute_magnitude(ax, ay, az)
-            if mag > partial_threshold:
-                partial_falls.append((ts, part))
-                partial_events[part].append(ts)
-
-    def parse_time(ts):
-        return datetime.fromisoformat(ts).timestamp()
-
-    all_events = sorted([
-        (parse_time(ts), part) for part, ts_list in partial_events.items() for ts in ts_list
-    ])
-
-    i = 0
-    while i < len(all_events):
-        t0, _ = all_events[i]
-        parts_triggered = set()
-        j=1
-        while j < len(all_events) and (all_events[j][0] - t0) <= sync_window:
-            parts_triggered.add(all_events[j][1])
-            j += 1
-        if len(parts_triggered) == len(PARTS):
-            full_falls.append(datetime.fromtimestamp(t0).isoformat())
-            i = j
-        else:
-            i += 1
+    event_times = []
+    event_parts = []
+
+    for part, (timestamps, acc_mag) in magnitudes.items():
+        hits = np.flatnonzero(acc_mag > partial_threshold)
+        times = np.asarray(timestamps[hits], dtype=np.int64)
+        partial_falls.extend((format_timestamp(ts), part) for ts in times.tolist())
+        event_times.append(times)
+        event_parts.append(np.full(len(times), PARTS.index(part)))
+
+    if event_times:
+        full_starts = find_synced_events(
+            np.concatenate(event_times), np.concatenate(event_parts), len(PARTS), sync_window
+        )
+    else:
+        full_starts = []
+    full_falls = [format_timestamp(ts) for ts in full_starts]
 
     return {
         "partial_falls": partial_falls,
         "full_falls": full_falls
     }
 
-def get_falls(folder):
-    all_data = load_all_sensor_data(folder)
-    return detect_falls(all_data)
+def get_falls(session, partial_threshold=10.0, sync_window=0.5, linear=False):
+    # linear: threshold the gravity-free acceleration of Session.orientation() instead of the raw one
+    session = load_session(session)
+    magnitudes = {part: session.acc_magnitude(part, linear) for part in PARTS if part in session}
+    return detect_falls(magnitudes, partial_threshold, sync_window)
 
 # rhythm-flow analysis start
-def detect_movement_times(data, movement_threshold = 2.5, min_pause = 0.5):
-    movement_times = []
-    last_time = None
-
-    for ts, ax, ay, az in data:
-        mag = compute_magnitude(ax, ay, az)
-        if mag > movement_threshold:
-            t = datetime.fromisoformat(ts).timestamp()
-            if last_time is None or (t - last_time) > min_pause:
-                movement_times.append(t)
-                last_time = t
-    return movement_times
+def debounce(times, min_gap):
+    """
+    Keeps the first time, then each next time more than min_gap after the last kept one.
+
+    The kept time depends on the previous pick, so this can't be a single array operation.
+    On sorted times each pick is one searchsorted jump, the loop runs once per kept time
+    rather than once per candidate.
+    """
+    if len(times) == 0:
+        return times
+    if np.any(np.diff(times) < 0):
+        # the host clock stepped back during the session, fall back to the plain scan
+        kept = []
+        last = None
+        for t in times.tolist():
+            if last is None or (t - last) > min_gap:
+                kept.append(t)
+                last = t
+        return np.array(kept, dtype=times.dtype)
+
+    kept = []
+    i = 0
+    while i < len(times):
+        kept.append(i)
+        i = np.searchsorted(times, times[i] + min_gap, side='right')
+    return times[kept]
+
+def detect_movement_times(limb, movement_threshold = 2.5, min_pause = 0.5):
+    # epoch seconds of each movement onset, at least min_pause apart
+    hits = limb.timestamps[limb.acc_magnitude() > movement_threshold]
+    onsets = debounce(np.asarray(hits, dtype=np.int64), int(round(min_pause * 1e9)))
+    return (onsets / 1e9).tolist()
 
 def analyze_rhythm(movement_times):
     if len(movement_times) < 2:
@@ -105,12 +130,12 @@ def analyze_rhythm(movement_times):
         "rhythm_score" : round(rhythm_score, 3)
     }
 
-def get_rhythm(folder):
-    all_data = load_all_sensor_data(folder)
+def get_rhythm(session):
+    all_data = load_all_sensor_data(session)
     all_movement_times = []
 
-    for readings in all_data.values():
-        times = detect_movement_times(readings)
+    for limb in all_data.values():
+        times = detect_movement_times(limb)
         all_movement_times.extend(times)
 
     all_movement_times.sort()
@@ -1,77 +1,110 @@
-import pandas as pd
 import numpy as np
-import os
+from collections import defaultdict
 
-def estimate_sample_rate(timestamps):
-    if len(timestamps) < 2:
-        return 1
-    intervals = [(t2 - t1).total_seconds() for t1, t2 in zip(timestamps[:-1], timestamps[1:])]
-    avg_interval = np.mean(intervals)
-    return 1 / avg_interval if avg_interval > 0 else 1
+from binary_format import format_timestamp
+from resample import estimate_sample_rate
+from session import load_session
+from windowing import run_lengths, segment_breaks, window_view
 
-def count_grips(
-    path,
-    sample_rate,
+ARMS = ["left_arm", "right_arm"]
+
+def grip_still_mask(acc_mag_windows, gyro_mag_windows, stillness_tol_acc=1, stillness_tol_gyro=50):
+    # windows of acc and gyro magnitudes where the hand is at rest
+    return (np.mean(np.abs(acc_mag_windows - 1.0), axis=1) < stillness_tol_acc) & \
+           (np.mean(gyro_mag_windows, axis=1) < stillness_tol_gyro)
+
+def detect_grips(
+    limbs,
     window_sec=0.25,
     stillness_tol_acc=1,
     stillness_tol_gyro=50,
     min_consec_windows=3
 ):
-    df = pd.read_csv(path)
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    """
+    Finds grips (runs of at least min_consec_windows still windows) on several limbs in one call.
 
-    acc_data = df[['accX', 'accY', 'accZ']].to_numpy()
-    gyro_data = df[['gyroX', 'gyroY', 'gyroZ']].to_numpy()
+    limbs: name -> (LimbData, sample_rate)
+    Returns name -> list of grips, each {"start": iso time, "end": iso time, "duration": seconds}.
+    Limbs sharing a window length are windowed and run-length encoded together.
+    """
+    groups = defaultdict(list)
+    for name, (limb, sample_rate) in limbs.items():
+        groups[max(1, int(window_sec * sample_rate))].append(name)
 
-    accel_magnitude = np.linalg.norm(acc_data, axis=1)
-    gyro_magnitude = np.linalg.norm(gyro_data, axis=1)
+    grips = {}
+    for window_len, names in groups.items():
+        acc_windows = []
+        gyro_windows = []
+        limb_ids = []
+        for k, name in enumerate(names):
+            limb = limbs[name][0]
+            acc_windows.append(window_view(limb.acc_magnitude(), window_len))
+            gyro_windows.append(window_view(limb.gyro_magnitude(), window_len))
+            limb_ids.append(np.full(len(acc_windows[-1]), k))
+        offsets = np.cumsum([0] + [len(w) for w in acc_windows])
+        acc_windows = np.concatenate(acc_windows)
+        gyro_windows = np.concatenate(gyro_windows)
+        limb_ids = np.concatenate(limb_ids)
 
-    window_len = int(window_sec * sample_rate)
-    num_windows = len(df) // window_len
+        is_still = grip_still_mask(acc_windows, gyro_windows, stillness_tol_acc, stillness_tol_gyro)
 
-    is_still = []
-    for i in range(num_windows):
-        start = i * window_len
-        end = start + window_len
-        acc_mag_window = accel_magnitude[start:end]
-        gyro_mag_window = gyro_magnitude[start:end]
+        starts, lengths, still = run_lengths(is_still, segment_breaks(limb_ids))
+        is_grip = still & (lengths >= min_consec_windows)
+        starts = starts[is_grip]
+        lengths = lengths[is_grip]
+        run_limbs = limb_ids[starts]
 
-        still = np.mean(np.abs(acc_mag_window - 1.0)) < stillness_tol_acc and \
-                np.mean(gyro_mag_window) < stillness_tol_gyro
-        is_still.append(still)
+        for k, name in enumerate(names):
+            timestamps = limbs[name][0].timestamps
+            first = (starts[run_limbs == k] - offsets[k]) * window_len
+            last = first + lengths[run_limbs == k] * window_len - 1
+            start_ns = timestamps[first].tolist()
+            end_ns = timestamps[last].tolist()
+            grips[name] = [
+                {
+                    "start": format_timestamp(t0),
+                    "end": format_timestamp(t1),
+                    "duration": (t1 - t0) / 1e9
+                }
+                for t0, t1 in zip(start_ns, end_ns)
+            ]
 
-    grip_count = 0
-    i = 0
-    while i <= len(is_still) - min_consec_windows:
-        if all(is_still[i:i + min_consec_windows]):
-            grip_count += 1
-            while i < len(is_still) and is_still[i]:
-                i += 1
-        else:
-            i += 1
+    return grips
 
-    return grip_count
+def count_grips(
+    limb,
+    sample_rate,
+    window_sec=0.25,
+    stillness_tol_acc=1,
+    stillness_tol_gyro=50,
+    min_consec_windows=3
+):
+    grips = detect_grips(
+        {"limb": (limb, sample_rate)},
+        window_sec=window_sec,
+        stillness_tol_acc=stillness_tol_acc,
+        stillness_tol_gyro=stillness_tol_gyro,
+        min_consec_windows=min_consec_windows
+    )
+    return len(grips["limb"])
 
-def get_grip_count(folder):
-    grip_counts = []
-    for side in ["left_arm", "right_arm"]:
-        file_path = os.path.join(folder, f"{side}.csv")
-        if not os.path.exists(file_path):
-            print(f"[!] File not found: {file_path}")
-            grip_counts.append(0)
+def get_grips(session, stillness_tol_acc=1, stillness_tol_gyro=50, min_consec_windows=3):
+    # side -> grip event list, for both arms in one pass
+    session = load_session(session)
+    limbs = {}
+    for side in ARMS:
+        limb = session.get(side)
+        if limb is None:
+            print(f"[!] File not found: {side}.csv")
             continue
-
-        df = pd.read_csv(file_path)
-        if df.empty:
-            grip_counts.append(0)
+        if len(limb) == 0:
             continue
+        limbs[side] = (limb, estimate_sample_rate(limb.timestamps))
 
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        sample_rate = estimate_sample_rate(df['timestamp'].to_list())
-        grips = count_grips(
-            path=file_path,
-            sample_rate=sample_rate
-        )
-        grip_counts.append(grips)
+    grips = detect_grips(limbs, stillness_tol_acc=stillness_tol_acc, stillness_tol_gyro=stillness_tol_gyro,
+                         min_consec_windows=min_consec_windows)
+    return {side: grips.get(side, []) for side in ARMS}
 
-    return grip_counts
+def get_grip_count(session):
+    grips = get_grips(session)
+    return [len(grips[side]) for side in ARMS]
@@ -1,14 +1,16 @@
 import tkinter as tk
 import asyncio
+import importlib
+import sys
 import time
 import math
+
+STARTED = time.perf_counter()  # startup times are measured from here, before the imports below
+
+import numpy as np
 from async_tkinter_loop import async_mainloop
 
-from arm_leg_usage import get_arm_leg_usage
-from stability import get_stability
-from smoothness import get_smoothness_score
-from fall_rhythm import get_rhythm, get_falls
-from grip_count import get_grip_count
+from live_plot import PLOT_SECONDS, decimate_minmax
 
 import logger  # your updated logger module
 
@@ -17,10 +19,17 @@ import logger  # your updated logger module
 root = None
 canvas = None
 animation = None
+live_plot = None
 logger_task = None
 logger_stop_event = None
 status_var = None
+live_var = None
+fall_var = None      # the fall alert line, set by show_fall_alert
+fall_alert_job = None  # Tk timer that clears the fall alert
+FALL_ALERT_MS = 10000  # how long a fall alert stays up
 logger_widgets = []  # elements to remove on stop
+warm_up_task = None  # scoring's pre-started worker pool, see warm_up_scoring()
+climber = None       # whose session is recorded: python code/gui.py [climber]
 
 
 ### ---------- Logger Integration ----------
@@ -44,8 +53,34 @@ async def start_logger():
             status_var.set(msg)
 
     logger_task = asyncio.create_task(
-        logger.main(print_callback=update_status, stop_event=logger_stop_event)
+        logger.main(print_callback=update_status, stop_event=logger_stop_event, climber=climber,
+                    on_fall=show_fall_alert)
     )
+    print(f"[*] Logger started {(time.perf_counter() - STARTED) * 1000:.0f} ms after launch")
+
+def show_fall_alert(start_ns):
+    # called from the BLE notification callback, which runs on the Tk loop: only set the
+    # alert up here, Tk draws it on its next pass
+    global fall_alert_job
+    root.bell()
+    fall_var.set(f"FALL DETECTED  {time.strftime('%H:%M:%S', time.localtime(start_ns / 1e9))}")
+    if fall_alert_job is not None:
+        root.after_cancel(fall_alert_job)
+    fall_alert_job = root.after(FALL_ALERT_MS, lambda: fall_var.set(""))
+
+async def warm_up_scoring():
+    # imports the analysis stack (pandas and the metrics) on a thread and starts the scoring
+    # workers while recording, so neither delays the window, the scan or the score page
+    start = time.perf_counter()
+    scoring = await asyncio.get_running_loop().run_in_executor(None, importlib.import_module, "scoring")
+    pool = await scoring.warm_pool()
+    print(f"[*] Scoring workers ready in {time.perf_counter() - start:.1f} s")
+    return pool
+
+def start_warm_up():
+    global warm_up_task
+    if warm_up_task is None:
+        warm_up_task = asyncio.create_task(warm_up_scoring())
 def stop_logger(event=None):
     global logger_task, logger_stop_event
 
@@ -55,9 +90,45 @@ def stop_logger(event=None):
         logger_task.cancel()
 
     animation.stop()
+    live_plot.stop()
     clear_logger_screen()
     asyncio.create_task(show_scores())
 
+def format_live_scores(scores):
+    if scores is None:
+        return ""
+    rhythm = scores['rhythm']
+    lines = [
+        f"Stability {scores['stability'] * 100:.0f}%   Smoothness {scores['smoothness']:.0f}%",
+        f"Arm/Leg {scores['usage']['arm_usage_ratio'] * 100:.0f}% / {scores['usage']['leg_usage_ratio'] * 100:.0f}%   "
+        f"Grips {scores['grip_count'][0]} / {scores['grip_count'][1]}",
+    ]
+    if rhythm is not None:
+        lines.append(f"Mean Move Time {rhythm['mean_interval']} s")
+    return "\n".join(lines)
+
+def format_link_metrics(metrics):
+    # one short line per device: throughput and anything that went missing
+    if metrics is None:
+        return ""
+    lines = []
+    for name, device in sorted(metrics["devices"].items()):
+        missing = device["dropped"] + device["lost"] + device["malformed"]
+        lines.append(f"{name.replace('IMU_', '')}: {device['packets_per_sec']:.0f} pkt/s, "
+                     f"jitter {device['interarrival_jitter_ms']:.0f} ms, {missing} missing")
+    return "\n".join(lines)
+
+def update_live_scores():
+    # running scores from the logger's LiveScores and its link metrics, refreshed while recording
+    if not animation.running:
+        return
+    text = ""
+    if logger.live_scores is not None:
+        text = format_live_scores(logger.live_scores.snapshot())
+    link = format_link_metrics(logger.metrics_snapshot())
+    live_var.set("\n".join(part for part in (text, link) if part))
+    root.after(500, update_live_scores)
+
 def clear_logger_screen():
     for widget in logger_widgets:
         try:
@@ -117,66 +188,205 @@ class DotAnimation:
     def stop(self):
         self.running = False
 
+    def hide(self):
+        self.canvas.itemconfigure(self.dot1, state='hidden')
+        self.canvas.itemconfigure(self.dot2, state='hidden')
 
-### ---------- Show Score Page ----------
-
-async def show_scores():
-    def safe(fn, default, *args):
-        try:
-            return fn(*args)
-        except Exception as e:
-            print(f"[!] {fn.__name__} failed: {e}")
-            return default
 
-    usage = await asyncio.to_thread(lambda: safe(get_arm_leg_usage, {
-        "arm_usage_ratio": 0,
-        "leg_usage_ratio": 0,
-        "comment": "No data recorded"
-    }, "data"))
+### ---------- Live Plot ----------
 
-    stability_score = safe(get_stability, 0.0, "data")
-    smoothness_score = await asyncio.to_thread(lambda: safe(get_smoothness_score, 0.0, "data"))
-    rhythm = await asyncio.to_thread(lambda: safe(get_rhythm, {
-    "mean_interval": 0.0,
-    "std_interval": 0.0,
-    "rhythm_score": 0.0
-        }, "data"))
-    grip_count = safe(get_grip_count, ["No data", "No data"], "data")
-    falls = safe(get_falls, {"partial_falls": [], "full_falls": []}, "data")
+class LivePlot:
+    """
+    Acc and gyro magnitude of the last PLOT_SECONDS of every limb, one strip per limb,
+    drawn from logger.live_history. Each redraw is min/max decimated to the strip's pixel
+    width and redraws are at most FRAME_MS apart, so the cost per frame does not depend on
+    the sample rate; the samples are collected on the writer thread, never here.
+    """
 
+    PARTS = [("left_arm", "LA"), ("right_arm", "RA"), ("left_leg", "LL"), ("right_leg", "RL")]
+    ACC_RANGE = 4.0      # g at the top of a strip, larger values are clipped
+    GYRO_RANGE = 1000.0  # deg/s at the top of a strip
+    FRAME_MS = 100       # at most 10 redraws per second
+    MAX_LOAD = 0.25      # slow machines redraw less often instead of spending more of the Tk loop
 
+    def __init__(self, canvas, x0=50, x1=680, y0=290, y1=470, on_data=None):
+        self.canvas = canvas
+        self.x0, self.y0, self.width = x0, y0, x1 - x0
+        self.strip = (y1 - y0) / len(self.PARTS)
+        self.on_data = on_data
+        self.has_data = False
+        self.running = True
+        self.lines = {}
+        for i, (part, short) in enumerate(self.PARTS):
+            top = y0 + i * self.strip
+            canvas.create_text(x0 - 10, top + self.strip / 2, text=short, fill='gray', anchor='e',
+                               font=("Helvetica", 10))
+            canvas.create_line(x0, top + self.strip - 2, x1, top + self.strip - 2, fill='#333333')
+            self.lines[part] = (
+                canvas.create_line(0, 0, 0, 0, fill='#4fc3f7', state='hidden'),
+                canvas.create_line(0, 0, 0, 0, fill='#ffb74d', state='hidden')
+            )
+        self.draw()
+
+    def points(self, columns, lo, hi, bottom, full_scale):
+        # a vertical min-max stroke per pixel column, joined into one line
+        height = self.strip - 6
+        x = self.x0 + columns
+        y_hi = bottom - np.clip(hi / full_scale, 0, 1) * height
+        y_lo = bottom - np.clip(lo / full_scale, 0, 1) * height
+        return np.column_stack((x, y_hi, x, y_lo)).ravel().tolist()
+
+    def draw(self):
+        if not self.running:
+            return
+        start = time.perf_counter()
+
+        history = logger.live_history.recent() if logger.live_history is not None else {}
+        latest = max((int(times[-1]) for times, _, _ in history.values() if len(times)), default=None)
+        if latest is not None:
+            if not self.has_data and self.on_data is not None:
+                self.on_data()
+            self.has_data = True
+            first = latest - int(PLOT_SECONDS * 1e9)
+            for i, (part, _) in enumerate(self.PARTS):
+                acc_line, gyro_line = self.lines[part]
+                if part not in history:
+                    continue
+                times, acc, gyro = history[part]
+                bottom = self.y0 + (i + 1) * self.strip - 3
+                for line, values, full_scale in ((acc_line, acc, self.ACC_RANGE), (gyro_line, gyro, self.GYRO_RANGE)):
+                    columns, lo, hi = decimate_minmax(times, values, first, latest, self.width)
+                    if len(columns) == 0:
+                        self.canvas.itemconfigure(line, state='hidden')
+                        continue
+                    self.canvas.coords(line, self.points(columns, lo, hi, bottom, full_scale))
+                    self.canvas.itemconfigure(line, state='normal')
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.canvas.after(max(self.FRAME_MS, int(elapsed_ms / self.MAX_LOAD)), self.draw)
 
-    label_cfg = {"font": ("Helvetica", 20, "bold"), "bg": "black", "fg": "white"}
-    small_label_cfg = {**label_cfg, "font": ("Helvetica", 15)}
+    def stop(self):
+        self.running = False
 
-    tk.Label(root, text=f"Smoothness: {smoothness_score:.1f}%", **label_cfg).place(relx=0.2, rely=0.15, anchor='w')
-    tk.Label(root, text=f"Stability: {stability_score * 100:.1f}%", **label_cfg).place(relx=0.2, rely=0.23, anchor='w')
-    tk.Label(root, text=f"Arm/Leg Usage: {usage['arm_usage_ratio'] * 100:.0f}% / {usage['leg_usage_ratio'] * 100:.0f}%", **label_cfg).place(relx=0.2, rely=0.31, anchor='w')
-    tk.Label(root, text=usage['comment'], **small_label_cfg).place(relx=0.25, rely=0.36, anchor='w')
 
-    tk.Label(root, text="Rhythm/Flow:", **label_cfg).place(relx=0.2, rely=0.45, anchor='w')
-    tk.Label(root, text=f"Mean Move Time: {rhythm['mean_interval']} s", **small_label_cfg).place(relx=0.25, rely=0.50, anchor='w')
-    tk.Label(root, text=f"Rhythm Score: {rhythm['rhythm_score']}", **small_label_cfg).place(relx=0.25, rely=0.55, anchor='w')
+### ---------- Show Score Page ----------
 
-    tk.Label(root, text=f"Grip Count (L): {grip_count[0]}", **label_cfg).place(relx=0.2, rely=0.63, anchor='w')
-    tk.Label(root, text=f"Grip Count (R): {grip_count[1]}", **label_cfg).place(relx=0.2, rely=0.68, anchor='w')
+def format_grips(grips, side):
+    if grips is None:
+        return "No data"
+    events = grips[side]
+    if not events:
+        return "0"
+    avg_duration = sum(g["duration"] for g in events) / len(events)
+    return f"{len(events)} (avg hold {avg_duration:.1f} s)"
 
-    tk.Label(root, text="Fall Detection:", **label_cfg).place(relx=0.2, rely=0.78, anchor='w')
-    tk.Label(
-        root,
-        text=f"Partial Falls: {', '.join(f'{p} @ {t}' for t, p in falls['partial_falls']) or 'None'}",
-        **small_label_cfg
-    ).place(relx=0.25, rely=0.83, anchor='w')
+async def show_scores():
+    label_cfg = {"font": ("Helvetica", 20, "bold"), "bg": "black", "fg": "white"}
+    small_label_cfg = {**label_cfg, "font": ("Helvetica", 15)}
 
-    tk.Label(
-        root,
-        text=f"Full Falls: {', '.join(falls['full_falls']) or 'None'}",
-        **small_label_cfg
-    ).place(relx=0.25, rely=0.88, anchor='w')
+    def label(text, cfg, relx, rely):
+        widget = tk.Label(root, text=text, **cfg)
+        widget.place(relx=relx, rely=rely, anchor='w')
+        return widget
+
+    # every label starts as a placeholder or the running score from recording, and gets
+    # the exact score from the session files as its metric finishes
+    smoothness_label = label("Smoothness: ...", label_cfg, 0.2, 0.15)
+    stability_label = label("Stability: ...", label_cfg, 0.2, 0.23)
+    usage_label = label("Arm/Leg Usage: ...", label_cfg, 0.2, 0.31)
+    usage_comment = label("", small_label_cfg, 0.25, 0.36)
+
+    label("Rhythm/Flow:", label_cfg, 0.2, 0.45)
+    mean_move_label = label("Mean Move Time: ...", small_label_cfg, 0.25, 0.50)
+    rhythm_label = label("Rhythm Score: ...", small_label_cfg, 0.25, 0.55)
+
+    grips_left_label = label("Grip Count (L): ...", label_cfg, 0.2, 0.63)
+    grips_right_label = label("Grip Count (R): ...", label_cfg, 0.2, 0.68)
+
+    label("Fall Detection:", label_cfg, 0.2, 0.78)
+    partial_falls_label = label("Partial Falls: ...", small_label_cfg, 0.25, 0.83)
+    full_falls_label = label("Full Falls: ...", small_label_cfg, 0.25, 0.88)
+
+    folder = logger.session_dir or "data"
+    results = {}
+
+    def render(name, value, note=""):
+        if name == "smoothness":
+            smoothness_label.config(text=f"Smoothness: {value:.1f}%{note}")
+        elif name == "stability":
+            stability_label.config(text=f"Stability: {value * 100:.1f}%{note}")
+        elif name == "usage":
+            usage_label.config(text=f"Arm/Leg Usage: {value['arm_usage_ratio'] * 100:.0f}% / {value['leg_usage_ratio'] * 100:.0f}%{note}")
+            usage_comment.config(text=value['comment'])
+        elif name == "rhythm":
+            mean_move_label.config(text=f"Mean Move Time: {value['mean_interval']} s{note}")
+            rhythm_label.config(text=f"Rhythm Score: {value['rhythm_score']}{note}")
+        elif name == "grips":
+            grips_left_label.config(text=f"Grip Count (L): {format_grips(value, 'left_arm')}")
+            grips_right_label.config(text=f"Grip Count (R): {format_grips(value, 'right_arm')}")
+        elif name == "falls":
+            partial_falls_label.config(text=f"Partial Falls: {', '.join(f'{p} @ {t}' for t, p in value['partial_falls']) or 'None'}")
+            full_falls_label.config(text=f"Full Falls: {', '.join(value['full_falls']) or 'None'}")
+
+    def on_result(name, value):
+        results[name] = value
+        render(name, value)
+
+    # LiveScores kept up with the recording, its snapshot costs the same for any session
+    # length and shows right away while the workers re-score the files
+    live = logger.live_scores.snapshot() if logger.live_scores is not None else None
+    if live is not None:
+        for name in ("smoothness", "stability", "usage", "rhythm"):
+            if live[name] is not None:
+                render(name, live[name], " (live)")
+        grips_left_label.config(text=f"Grip Count (L): {live['grip_count'][0]} (live)")
+        grips_right_label.config(text=f"Grip Count (R): {live['grip_count'][1]} (live)")
+    if logger.fall_detector is not None:
+        full_falls_label.config(text=f"Full Falls: {len(logger.fall_detector.falls)} (live)")
+
+    # the logger's shutdown flushes and closes the limb files and adds the session to the
+    # catalog; nothing below may read either before it is done
+    if logger_task is not None:
+        await asyncio.gather(logger_task, return_exceptions=True)
+
+    # a pool warmed up during recording is ready or at least part of the way there
+    pool = None
+    if warm_up_task is not None:
+        try:
+            pool = await warm_up_task
+        except Exception as e:
+            print(f"[!] Scoring warm-up failed: {e}")
+    # imported by the warm-up already, or now if recording never got samples
+    import scoring
+    from calibrate import load_profile
+    from catalog import Catalog
+
+    # metrics run in worker processes, the Tk loop stays free while they do, with the
+    # thresholds calibrate.py tuned to the climber if it was run for them
+    profile = load_profile(climber, logger.DATA_DIR)
+    errors = await scoring.score_session(folder, on_result, pool=pool, profile=profile)
+
+    # cache complete results so past sessions can be browsed from the catalog and
+    # followed over time in the climber's trends
+    if not errors:
+        try:
+            catalog = Catalog(logger.DATA_DIR)
+            catalog.store_scores(folder, results)
+        except Exception as e:
+            print(f"[!] Could not update the session catalog: {e}")
+        try:
+            from trends import DEFAULT_CLIMBER, TrendStore, session_started
+            started, duration = session_started(folder)
+            with TrendStore(logger.DATA_DIR) as store:
+                store.add_session(climber or DEFAULT_CLIMBER, catalog.key(folder), started, results, duration)
+        except Exception as e:
+            print(f"[!] Could not update the trend store: {e}")
 
 ### ---------- Main ----------
 
 if __name__ == "__main__":
+    climber = sys.argv[1] if len(sys.argv) > 1 else None
+
     root = tk.Tk()
     root.configure(bg='black')
     root.geometry("700x600")
@@ -186,6 +396,13 @@ if __name__ == "__main__":
     canvas.pack()
 
     animation = DotAnimation(canvas)
+    # the dots show that devices are being searched for, the plot replaces them once samples
+    # arrive; from then on the scoring workers can start up without slowing the connection
+    def on_first_samples():
+        animation.hide()
+        start_warm_up()
+
+    live_plot = LivePlot(canvas, on_data=on_first_samples)
 
     status_var = tk.StringVar()
     status_var.set("Waiting to start...")
@@ -194,6 +411,17 @@ if __name__ == "__main__":
     canvas.create_window(350, 200, window=status_label)
     logger_widgets.append(status_label)
 
+    live_var = tk.StringVar()
+    live_label = tk.Label(root, textvariable=live_var, font=("Helvetica", 14), fg='white', bg='black')
+    canvas.create_window(350, 70, window=live_label)
+    logger_widgets.append(live_label)
+    root.after(500, update_live_scores)
+
+    fall_var = tk.StringVar()
+    fall_label = tk.Label(root, textvariable=fall_var, font=("Helvetica", 20, "bold"), fg='red', bg='black')
+    canvas.create_window(350, 560, window=fall_label)
+    logger_widgets.append(fall_label)
+
     stop_btn = tk.Label(root, text=" X ", font=("Helvetica", 24, "bold"), fg='white', bg='black', cursor="hand2")
     stop_btn.bind("<Button-1>", stop_logger)
     canvas.create_window(350, 500, window=stop_btn)
@@ -204,4 +432,5 @@ if __name__ == "__main__":
         await start_logger()
 
     root.after(0, lambda: asyncio.create_task(start_logger_after_gui_loads()))
+    root.after_idle(lambda: print(f"[*] Window ready {(time.perf_counter() - STARTED) * 1000:.0f} ms after launch"))
     async_mainloop(root)
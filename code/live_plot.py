@@ -0,0 +1,82 @@
+import threading
+
+import numpy as np
+
+HISTORY = 4096        # samples kept per limb, 10 s at up to ~400 Hz
+PLOT_SECONDS = 10.0   # time span the live plot shows
+
+
+class LimbHistory:
+    """
+    Fixed-size ring of one limb's most recent (timestamp, acc magnitude, gyro magnitude)
+    samples. push() is called from the logger's writer thread with every decoded batch,
+    recent() from the GUI; neither allocates more than one batch or one ring's worth.
+    """
+
+    def __init__(self, capacity=HISTORY):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.acc = np.zeros(capacity, dtype=np.float32)
+        self.gyro = np.zeros(capacity, dtype=np.float32)
+        self.head = 0    # next slot to write
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def push(self, times, values):
+        if len(times) > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+        n = len(times)
+        acc = np.linalg.norm(values[:, 0:3], axis=1)
+        gyro = np.linalg.norm(values[:, 3:6], axis=1)
+        with self.lock:
+            slots = (self.head + np.arange(n)) % self.capacity
+            self.times[slots] = times
+            self.acc[slots] = acc
+            self.gyro[slots] = gyro
+            self.head = (self.head + n) % self.capacity
+            self.count = min(self.count + n, self.capacity)
+
+    def recent(self):
+        # copies of the stored samples, oldest first
+        with self.lock:
+            order = (self.head - self.count + np.arange(self.count)) % self.capacity
+            return self.times[order], self.acc[order], self.gyro[order]
+
+
+class LiveHistory:
+    # part -> LimbHistory, fed by the logger like live_scoring.LiveScores
+
+    def __init__(self, capacity=HISTORY):
+        self.capacity = capacity
+        self.limbs = {}
+        self.lock = threading.Lock()
+
+    def update(self, part, times, values):
+        with self.lock:
+            limb = self.limbs.get(part)
+            if limb is None:
+                limb = self.limbs[part] = LimbHistory(self.capacity)
+        limb.push(times, values)
+
+    def recent(self):
+        with self.lock:
+            limbs = dict(self.limbs)
+        return {part: limb.recent() for part, limb in limbs.items()}
+
+
+def decimate_minmax(times, values, start, end, width):
+    """
+    Min/max decimation of values (sorted by times) to width pixel columns spanning
+    start..end ns. Returns the columns that hold samples with their lowest and highest
+    value, so a 2 * width point line shows every peak no matter how many samples there are.
+    """
+    edges = start + (end - start) * np.arange(width + 1) // width
+    bounds = np.searchsorted(times, edges)
+    lo_index, hi_index = bounds[0], bounds[-1]
+    columns = np.flatnonzero(np.diff(bounds) > 0)
+    if len(columns) == 0:
+        return columns, values[:0], values[:0]
+    window = values[lo_index:hi_index]
+    # empty columns add no samples, so each segment ends where the next non-empty column starts
+    starts = bounds[columns] - lo_index
+    return columns, np.minimum.reduceat(window, starts), np.maximum.reduceat(window, starts)
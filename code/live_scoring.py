@@ -0,0 +1,314 @@
+import bisect
+import math
+import threading
+from collections import deque
+
+import numpy as np
+
+# Same defaults as the offline metrics (arm_leg_usage, fall_rhythm, grip_count, stability, smoothness)
+USAGE_THRESHOLD = 0.8
+RHYTHM_THRESHOLD = 2.5
+RHYTHM_MIN_PAUSE_NS = 500_000_000
+WINDOW_SEC = 0.25
+STILLNESS_TOL_ACC = 1
+STILLNESS_TOL_GYRO = 50
+MIN_CONSEC_WINDOWS = 3
+HOLD_ACCEL_THRESH = 0.12
+HOLD_GYRO_THRESH = 30
+SMOOTH_WINDOW = 10
+SMOOTH_ACCEL_THRESHOLD = 0.8
+SMOOTH_GYRO_THRESHOLD = 8.0
+MAX_EXPECTED_JERK = 1000.0
+
+RATE_WARMUP_SAMPLES = 50  # samples used to fix the window length before windowed metrics start
+
+
+def sorted_median(values, extra=None):
+    # median of a sorted list, optionally with one more value, without copying the list
+    n = len(values) + (extra is not None)
+    if n == 0:
+        return None
+    p = bisect.bisect_left(values, extra) if extra is not None else n
+
+    def at(k):
+        if k < p:
+            return values[k]
+        if k == p:
+            return extra
+        return values[k - 1]
+
+    if n % 2:
+        return at(n // 2)
+    return (at(n // 2 - 1) + at(n // 2)) / 2
+
+
+class LimbTracker:
+    """
+    Online state for one limb. Every metric is updated per batch of samples, so the
+    current value is always ready and reading it never touches past samples.
+
+    Windowed metrics (stability, grips) start once RATE_WARMUP_SAMPLES samples have fixed
+    the window length; the offline code estimates it from the whole session instead, so
+    their live values can differ slightly from the final offline scores.
+    """
+
+    def __init__(self, on_onset):
+        self.on_onset = on_onset
+        self.samples = 0
+
+        # arm/leg usage
+        self.prev_acc_mag = None
+        self.usage_moves = 0
+
+        # rhythm
+        self.last_onset = None
+
+        # smoothness
+        self.recent_acc = deque(maxlen=SMOOTH_WINDOW)
+        self.recent_gyro = deque(maxlen=SMOOTH_WINDOW)
+        self.prev_sample = None   # (t_ns, acc_mag, gyro_mag)
+        self.group_dt = None      # seconds between the current timestamp and the previous one
+        self.in_movement = False
+        self.seg_start = None
+        self.seg_tail = None      # timestamp of a closed movement's last sample, until a new timestamp arrives
+        self.seg_acc = 0.0
+        self.seg_gyro = 0.0
+        self.seg_count = 0
+        self.jerk_scores = []     # clipped, kept sorted
+
+        # windowed metrics
+        self.window_len = None
+        self.warmup_times = []
+        self.pending_acc = np.zeros((0, 3))
+        self.pending_gyro = np.zeros((0, 3))
+        self.grip_run = 0
+        self.grips = 0
+        self.hold_run = 0
+        self.hold_pending = []
+        self.stable_windows = 0
+        self.analyzed_windows = 0
+
+    def update(self, times, values):
+        acc = values[:, 0:3].astype(np.float64)
+        gyro = values[:, 3:6].astype(np.float64)
+        acc_mag = np.linalg.norm(acc, axis=1)
+        gyro_mag = np.linalg.norm(gyro, axis=1)
+        self.samples += len(times)
+
+        self.update_usage(acc_mag)
+        self.update_rhythm(times, acc_mag)
+        self.update_smoothness(times, acc_mag, gyro_mag)
+        self.update_windows(times, acc, gyro)
+
+    def update_usage(self, acc_mag):
+        if self.prev_acc_mag is not None:
+            acc_mag_ext = np.concatenate(([self.prev_acc_mag], acc_mag))
+        else:
+            acc_mag_ext = acc_mag
+        self.usage_moves += int(np.count_nonzero(np.abs(np.diff(acc_mag_ext)) > USAGE_THRESHOLD))
+        self.prev_acc_mag = acc_mag[-1]
+
+    def update_rhythm(self, times, acc_mag):
+        for t in times[acc_mag > RHYTHM_THRESHOLD].tolist():
+            if self.last_onset is None or (t - self.last_onset) > RHYTHM_MIN_PAUSE_NS:
+                self.last_onset = t
+                self.on_onset(t)
+
+    def update_smoothness(self, times, acc_mag, gyro_mag):
+        # Mirrors smoothness.calculate_movement_smoothness: a movement runs up to and including
+        # its first still sample plus any samples sharing that timestamp, samples sharing the
+        # start timestamp add no jerk, and every sample's jerk is divided by the interval before
+        # the first sample of its timestamp (skipped when that is <= 10 ms).
+        for t, a, g in zip(times.tolist(), acc_mag.tolist(), gyro_mag.tolist()):
+            self.recent_acc.append(a)
+            self.recent_gyro.append(g)
+            moving = not (rolling_std(self.recent_acc) < SMOOTH_ACCEL_THRESHOLD and
+                          rolling_std(self.recent_gyro) < SMOOTH_GYRO_THRESHOLD)
+
+            if self.prev_sample is not None and t != self.prev_sample[0]:
+                self.group_dt = (t - self.prev_sample[0]) / 1e9
+
+            if self.seg_tail is not None:
+                if t == self.seg_tail:
+                    self.add_jerk(a, g)
+                else:
+                    self.close_segment()
+
+            if self.in_movement:
+                if t != self.seg_start:
+                    self.add_jerk(a, g)
+                if not moving:
+                    self.in_movement = False
+                    self.seg_tail = t
+            elif moving:
+                if self.seg_tail is not None:
+                    self.close_segment()
+                self.in_movement = True
+                self.seg_start = t
+                self.seg_acc = self.seg_gyro = 0.0
+                self.seg_count = 0
+
+            self.prev_sample = (t, a, g)
+
+    def add_jerk(self, a, g):
+        if self.group_dt is not None and self.group_dt > 0.01:
+            self.seg_acc += abs(a - self.prev_sample[1]) / self.group_dt
+            self.seg_gyro += abs(g - self.prev_sample[2]) / self.group_dt
+            self.seg_count += 1
+
+    def segment_jerk(self):
+        if self.seg_count == 0:
+            return None
+        jerk = (self.seg_acc / self.seg_count + self.seg_gyro / self.seg_count) / 2
+        return min(max(jerk, 0.0), 1000.0)
+
+    def close_segment(self):
+        jerk = self.segment_jerk()
+        if jerk is not None:
+            bisect.insort(self.jerk_scores, jerk)
+        self.seg_tail = None
+
+    def update_windows(self, times, acc, gyro):
+        if self.window_len is None:
+            self.warmup_times.extend(times.tolist())
+            self.pending_acc = np.concatenate((self.pending_acc, acc))
+            self.pending_gyro = np.concatenate((self.pending_gyro, gyro))
+            if len(self.warmup_times) < RATE_WARMUP_SAMPLES:
+                return
+            span = (self.warmup_times[-1] - self.warmup_times[0]) / 1e9
+            rate = (len(self.warmup_times) - 1) / span if span > 0 else 1
+            self.window_len = max(1, int(WINDOW_SEC * rate))
+            self.warmup_times = []
+            acc, gyro = self.pending_acc, self.pending_gyro
+        else:
+            acc = np.concatenate((self.pending_acc, acc))
+            gyro = np.concatenate((self.pending_gyro, gyro))
+
+        num_windows = len(acc) // self.window_len
+        used = num_windows * self.window_len
+        self.pending_acc = acc[used:]
+        self.pending_gyro = gyro[used:]
+        if num_windows == 0:
+            return
+
+        acc_w = acc[:used].reshape(num_windows, self.window_len, 3)
+        gyro_w = gyro[:used].reshape(num_windows, self.window_len, 3)
+        acc_mag = np.linalg.norm(acc_w, axis=2)
+        gyro_mag = np.linalg.norm(gyro_w, axis=2)
+        acc_still = np.mean(np.abs(acc_mag - 1.0), axis=1) < STILLNESS_TOL_ACC
+        grip_still = acc_still & (np.mean(gyro_mag, axis=1) < STILLNESS_TOL_GYRO)
+        hold_still = acc_still & (np.mean(np.abs(gyro_mag - 1.0), axis=1) < STILLNESS_TOL_GYRO)
+        stable = np.all(np.std(acc_w, axis=1) < HOLD_ACCEL_THRESH, axis=1) & \
+                 np.all(np.std(gyro_w, axis=1) < HOLD_GYRO_THRESH, axis=1)
+
+        for g_still, h_still, is_stable in zip(grip_still.tolist(), hold_still.tolist(), stable.tolist()):
+            # a grip is counted once, when its still run reaches MIN_CONSEC_WINDOWS
+            self.grip_run = self.grip_run + 1 if g_still else 0
+            if self.grip_run == MIN_CONSEC_WINDOWS:
+                self.grips += 1
+
+            # hold windows only count once their still run is long enough
+            if h_still:
+                self.hold_run += 1
+                self.hold_pending.append(is_stable)
+                if self.hold_run >= MIN_CONSEC_WINDOWS:
+                    self.stable_windows += sum(self.hold_pending)
+                    self.analyzed_windows += len(self.hold_pending)
+                    self.hold_pending = []
+            else:
+                self.hold_run = 0
+                self.hold_pending = []
+
+    def stability(self):
+        return self.stable_windows / self.analyzed_windows if self.analyzed_windows > 0 else 0
+
+    def smoothness(self):
+        extra = self.segment_jerk() if self.in_movement or self.seg_tail is not None else None
+        median = sorted_median(self.jerk_scores, extra)
+        if median is None:
+            return 100.0
+        return max(0.0, min(1.0, 1 - median / MAX_EXPECTED_JERK)) * 100
+
+
+def rolling_std(values):
+    # sample std (ddof=1) like pandas rolling().std(); NaN for a single value
+    n = len(values)
+    if n < 2:
+        return math.nan
+    mean = sum(values) / n
+    return math.sqrt(sum((v - mean) ** 2 for v in values) / (n - 1))
+
+
+class LiveScores:
+    """
+    Incremental scores for a session while it is being recorded.
+
+    update(part, times_ns, values) takes decoded sample batches (the logger's writer thread
+    feeds it); snapshot() returns the current scores in the shape gui.show_scores uses and
+    costs the same at any point of the session.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limbs = {}
+        self.onsets = []          # movement onsets of all limbs, sorted, int ns
+        self.interval_sum = 0     # exact int ns sums over consecutive onset intervals
+        self.interval_sumsq = 0
+        self.interval_count = 0
+
+    def update(self, part, times, values):
+        with self.lock:
+            tracker = self.limbs.get(part)
+            if tracker is None:
+                tracker = self.limbs[part] = LimbTracker(self.add_onset)
+            tracker.update(times, values)
+
+    def add_interval(self, d, sign=1):
+        self.interval_sum += sign * d
+        self.interval_sumsq += sign * d * d
+        self.interval_count += sign
+
+    def add_onset(self, t):
+        # limbs arrive a batch at a time, so onsets can land anywhere in the merged list
+        i = bisect.bisect_right(self.onsets, t)
+        prev = self.onsets[i - 1] if i > 0 else None
+        nxt = self.onsets[i] if i < len(self.onsets) else None
+        if prev is not None and nxt is not None:
+            self.add_interval(nxt - prev, -1)
+        if prev is not None:
+            self.add_interval(t - prev)
+        if nxt is not None:
+            self.add_interval(nxt - t)
+        self.onsets.insert(i, t)
+
+    def rhythm(self):
+        m = self.interval_count
+        if m < 1:
+            return None
+        mean_interval = self.interval_sum / m / 1e9
+        variance = (self.interval_sumsq * m - self.interval_sum ** 2) / (m * m) / 1e18
+        std_interval = math.sqrt(max(variance, 0.0))
+        rhythm_score = std_interval / mean_interval if mean_interval else float('inf')
+        return {
+            "mean_interval": round(mean_interval, 3),
+            "std_interval": round(std_interval, 3),
+            "rhythm_score": round(rhythm_score, 3)
+        }
+
+    def usage(self):
+        from arm_leg_usage import usage_summary
+        return usage_summary({part: tracker.usage_moves for part, tracker in self.limbs.items()})
+
+    def snapshot(self):
+        with self.lock:
+            limbs = {part: t for part, t in self.limbs.items() if t.samples > 0}
+            if not limbs:
+                return None
+            return {
+                "samples": {part: t.samples for part, t in limbs.items()},
+                "stability": sum(t.stability() for t in limbs.values()) / len(limbs),
+                "smoothness": sum(t.smoothness() for t in limbs.values()) / len(limbs),
+                "usage": self.usage(),
+                "rhythm": self.rhythm(),
+                "grip_count": [limbs[side].grips if side in limbs else 0 for side in ("left_arm", "right_arm")]
+            }
@@ -1,37 +1,79 @@
 import asyncio
-import struct
-import csv
-from datetime import datetime
+import json
+import os
+import time
 from bleak import BleakClient, BleakScanner
 
+from binary_format import format_timestamp, local_time_ns
+from catalog import Catalog
+from fall_alert import FallDetector
+from live_plot import LiveHistory
+from live_scoring import LiveScores
+from packet_writer import FLUSH_INTERVAL, PacketWriter, local_offset_ns
+from session import MANIFEST
+
+DATA_DIR = "data"  # every recording gets its own timestamped folder in here
+
 DEVICES = {
-    "IMU_LeftArm": "data/left_arm.csv",
-    "IMU_RightArm": "data/right_arm.csv",
-    "IMU_LeftLeg": "data/left_leg.csv",
-    "IMU_RightLeg": "data/right_leg.csv"
+    "IMU_LeftArm": "left_arm.csv",
+    "IMU_RightArm": "right_arm.csv",
+    "IMU_LeftLeg": "left_leg.csv",
+    "IMU_RightLeg": "right_leg.csv"
 }
 
 CHAR_UUID = "abcdef01-1234-5678-1234-56789abcdef0"
+SCAN_TIMEOUT = 5.0         # seconds, scanning stops earlier once every device was seen
+CONNECT_TIMEOUT = 10.0
+KNOWN_CONNECT_TIMEOUT = 3.0  # direct connects to remembered addresses give up sooner
+RECONNECT_DELAY = 0.5      # first reconnect backoff, doubled up to MAX_RECONNECT_DELAY
+MAX_RECONNECT_DELAY = 10.0
+KNOWN_DEVICES = "devices.json"   # addresses of the last connected devices, in DATA_DIR
 found_devices = {}
+session_dir = None    # folder of the current (or last) recording
+scan_time = None      # seconds finding and connecting to the devices took last time
+METRICS_FILE = "logger_metrics.json"   # metrics_snapshot() at stop, next to the manifest
+scanner_class = BleakScanner   # BLE transport, swapped by use_transport()
+client_class = BleakClient
+packet_writer = None  # PacketWriter of the running session, poll metrics_snapshot() for per-device counters
+live_scores = None    # LiveScores of the running session, poll live_scores.snapshot() for running scores
+live_history = None   # LiveHistory of the running session, the last samples of every limb for live plots
+fall_detector = None  # FallDetector of the running session, fed every notification
+
+def use_transport(scanner=BleakScanner, client=BleakClient):
+    # replaces bleak for scanning and connecting, e.g. with sim_ble's simulated sensors
+    global scanner_class, client_class
+    scanner_class, client_class = scanner, client
 
 def detection_callback(device, advertisement_data):
     if advertisement_data.local_name:
         found_devices[device.address] = (device, advertisement_data.local_name)
 
-async def scan_for_devices(print_callback):
-    scanner = BleakScanner(detection_callback)
+async def scan_for_devices(print_callback, names=None, timeout=SCAN_TIMEOUT):
+    # scans until every device in names (default: all of DEVICES) was seen, at most timeout seconds
+    wanted = set(names if names is not None else DEVICES)
+    all_found = asyncio.Event()
+
+    def on_advertisement(device, advertisement_data):
+        detection_callback(device, advertisement_data)
+        if wanted <= set(name for _, name in found_devices.values()):
+            all_found.set()
+
+    scanner = scanner_class(on_advertisement)
     await scanner.start()
-    await asyncio.sleep(5)
+    try:
+        await asyncio.wait_for(all_found.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
     await scanner.stop()
     print_callback("[*] Scan complete")
 
-def get_matching_devices(print_callback):
+def get_matching_devices(print_callback, names=None):
     matches = {}
-    requested = set(DEVICES.keys())
+    requested = set(names if names is not None else DEVICES)
     found_names = set(name for _, name in found_devices.values())
 
     for dev, name in found_devices.values():
-        if name in DEVICES:
+        if name in requested:
             matches[name] = dev
 
     missing = requested - found_names
@@ -40,63 +82,261 @@ def get_matching_devices(print_callback):
 
     return matches
 
-async def record_imu(device_name, filename, device, print_callback, stop_event):
-    client = BleakClient(device)
-    csv_file = None
+def load_known_devices(root=DATA_DIR):
+    # name -> address of the devices the previous session connected to
+    path = os.path.join(root, KNOWN_DEVICES)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_known_devices(devices, root=DATA_DIR):
+    known = load_known_devices(root)
+    known.update({name: device_address(device) for name, device in devices.items()})
+    with open(os.path.join(root, KNOWN_DEVICES), "w") as f:
+        json.dump(known, f, indent=2)
+
+def device_address(device):
+    return device if isinstance(device, str) else device.address
+
+async def connect_device(device_name, device, print_callback, timeout=CONNECT_TIMEOUT, quiet=False):
+    """
+    Connects to device (a scanned device or a known address). Returns (client, seconds,
+    disconnected): disconnected is an asyncio.Event set when the link drops. Returns None
+    if the connection failed.
+    """
+    disconnected = asyncio.Event()
+    client = client_class(device, disconnected_callback=lambda _: disconnected.set())
+    start = time.perf_counter()
+    try:
+        await client.connect(timeout=timeout)
+    except Exception as e:
+        if not quiet:
+            print_callback(f"[!] Could not connect to {device_name}: {e}")
+        return None
+    print_callback(f"[+] Connected to {device_name}")
+    return client, time.perf_counter() - start, disconnected
+
+async def connect_all(devices, print_callback, timeout=CONNECT_TIMEOUT, quiet=False):
+    # connects to name -> device in parallel, returns name -> connect_device() result for the ones that worked
+    results = await asyncio.gather(*(
+        connect_device(name, device, print_callback, timeout, quiet) for name, device in devices.items()
+    ))
+    return {name: result for name, result in zip(devices, results) if result is not None}
+
+async def reconnect(device_name, device, print_callback, stop_event):
+    # retries with exponential backoff until connected or the session is stopped
+    delay = RECONNECT_DELAY
+    while not stop_event.is_set():
+        connection = await connect_device(device_name, device, print_callback, KNOWN_CONNECT_TIMEOUT, quiet=True)
+        if connection is not None:
+            return connection
+        try:
+            await asyncio.wait_for(stop_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+    return None
 
+async def wait_first(*events):
+    waiters = [asyncio.create_task(event.wait()) for event in events]
     try:
-        await client.connect(timeout=10.0)
-        print_callback(f"[+] Connected to {device_name}")
-
-        csv_file = open(filename, mode='w', newline='')
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow([
-            "timestamp",
-            "accX", "accY", "accZ",
-            "gyroX", "gyroY", "gyroZ",
-            "magX", "magY", "magZ"
-        ])
+        await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+async def record_imu(device_name, filename, device, print_callback, stop_event, writer=None, connection=None,
+                     detector=None):
+    """
+    Records one device into filename until stop_event is set. connection is a
+    connect_device() result if the device is already connected. When the link drops
+    the device is reconnected in the background with backoff and recording continues
+    into the same file; the disconnected stretch is recorded as a gap. detector, a
+    FallDetector, sees every packet as it arrives.
+    """
+    client = None
+    ring = None
+
+    own_writer = writer is None
+    if own_writer:
+        writer = PacketWriter()
+        writer.start()
+
+    try:
+        if connection is None:
+            connection = await connect_device(device_name, device, print_callback)
+            if connection is None:
+                return
+        client, connect_time, disconnected = connection
+
+        # raw packets go into a ring buffer; the writer thread decodes and writes them in batches
+        ring = writer.add_device(device_name, filename, connect_time=round(connect_time, 3))
+
+        # both packet formats are accepted, the writer thread tells them apart (see packet_format.py);
+        # falls are checked here rather than after the writer's next flush, to alert without delay
+        part = part_name(device_name)
 
         def handle_notification(sender, data):
-            if len(data) == 36:
-                try:
-                    values = struct.unpack('<9f', data)
-                    timestamp = datetime.now().isoformat()
-                    csv_writer.writerow([timestamp] + list(values))
-                except Exception as e:
-                    print_callback(f"[!] Error writing data for {device_name}: {e}")
+            recv_ns = time.time_ns()
+            ring.push(recv_ns, data)
+            if detector is not None:
+                detector.check(part, recv_ns, data)
 
-        await client.start_notify(CHAR_UUID, handle_notification)
-        await stop_event.wait()
+        while True:
+            await client.start_notify(CHAR_UUID, handle_notification)
+            await wait_first(stop_event, disconnected)
+            if stop_event.is_set():
+                break
+
+            gap_start = time.time_ns()
+            print_callback(f"[!] Lost connection to {device_name}, reconnecting...")
+            connection = await reconnect(device_name, device_address(device), print_callback, stop_event)
+            writer.record_gap(device_name, gap_start, time.time_ns())
+            if connection is None:
+                break
+            client, _, disconnected = connection
 
     except Exception as e:
         print_callback(f"[!] Failed during {device_name} session: {e}")
 
     finally:
         try:
-            if client.is_connected:
+            if client is not None and client.is_connected:
                 await client.stop_notify(CHAR_UUID)
                 await client.disconnect()
         except Exception as e:
             print_callback(f"[!] Error disconnecting {device_name}: {e}")
         
-        if csv_file:
+        if ring is not None:
             try:
-                csv_file.close()
+                stats = writer.remove_device(device_name)
+                print_callback(
+                    f"[{device_name}] {stats['written']} samples written, {stats['dropped']} dropped, "
+                    f"{stats['lost']} packets lost in transit, {stats['malformed']} malformed, "
+                    f"{len(stats['gaps'])} reconnects "
+                    f"(buffer high-water {stats['high_water']}/{stats['capacity']})"
+                )
             except Exception as e:
                 print_callback(f"[!] Error closing file for {device_name}: {e}")
+
+        if own_writer:
+            writer.stop()
         
         print_callback(f"[{device_name}] Stopped and cleaned up.")
 
 
+def part_name(name):
+    # "IMU_LeftArm" -> "left_arm", the name the analysis modules use
+    return os.path.splitext(os.path.basename(DEVICES[name]))[0]
+
+
+def output_path(name, folder, binary=False):
+    filename = DEVICES[name]
+    if binary:
+        filename = os.path.splitext(filename)[0] + ".bin"
+    return os.path.join(folder, filename)
+
+
+def metrics_snapshot():
+    """
+    Structured logger metrics for polling while recording: scan time and, per device,
+    connection time, packet/byte counts and rates, inter-arrival jitter and histogram,
+    dropped/lost/malformed counts and notification-to-disk latency. Devices that already
+    stopped report their final values. None before the first recording starts.
+    """
+    if packet_writer is None:
+        return None
+    return {
+        "session": session_dir,
+        "scan_s": scan_time,
+        "devices": {**packet_writer.finished, **packet_writer.stats()}
+    }
+
+
+def new_session_dir(root=DATA_DIR):
+    # data/2025-07-18_21-24-44, so a recording never overwrites an earlier one
+    base = os.path.join(root, time.strftime("%Y-%m-%d_%H-%M-%S"))
+    folder, n = base, 1
+    while os.path.exists(folder):
+        n += 1
+        folder = f"{base}_{n}"
+    os.makedirs(folder)
+    return folder
+
+
+def write_manifest(folder, matching, started_ns, binary, device_stats, climber=None):
+    """
+    manifest.json next to the limb files: when the session ran and, per limb, which device
+    recorded it, how many samples were written or lost and the packet format it sent.
+    """
+    stopped_ns = local_time_ns()
+    offset = local_offset_ns()
+    devices = {}
+    for name, dev in matching.items():
+        stats = device_stats.get(name, {})
+        first, last = stats.get("first_ns"), stats.get("last_ns")
+        devices[part_name(name)] = {
+            "device": name,
+            "address": device_address(dev),
+            "file": os.path.basename(output_path(name, folder, binary)),
+            "samples": stats.get("written", 0),
+            "duration": stats.get("duration", 0.0),
+            "first_sample": format_timestamp(first + offset) if first is not None else None,
+            "last_sample": format_timestamp(last + offset) if last is not None else None,
+            "dropped": stats.get("dropped", 0),
+            "lost": stats.get("lost", 0),
+            "malformed": stats.get("malformed", 0),
+            "packet_version": stats.get("packet_version"),
+            "gaps": stats.get("gaps", [])
+        }
+    manifest = {
+        "session": os.path.basename(folder),
+        "climber": climber,
+        "started": format_timestamp(started_ns),
+        "stopped": format_timestamp(stopped_ns),
+        "duration": (stopped_ns - started_ns) / 1e9,
+        "format": "binary" if binary else "csv",
+        "devices": devices
+    }
+    with open(os.path.join(folder, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
 # main entry point, accepts a print callback
-async def main(print_callback=print, stop_event=None):
+# binary=True records to <limb>.bin (see binary_format.py) instead of CSV
+# flush_interval sets how often (s) the writer thread writes buffered packets to disk
+# every run records into a new session folder under root, see session_dir
+# climber is stored in the manifest, trends.py keeps each climber's scores apart
+# on_fall(start_ns) is called as soon as a fall is detected, with its time.time_ns() start
+async def main(print_callback=print, stop_event=None, binary=False, flush_interval=FLUSH_INTERVAL, root=DATA_DIR,
+               climber=None, on_fall=None):
+    global packet_writer, live_scores, live_history, fall_detector, session_dir, scan_time
+
     if stop_event is None:
         stop_event = asyncio.Event()
 
-    print_callback("[*] Scanning for devices...")
-    await scan_for_devices(print_callback)
-    matching = get_matching_devices(print_callback)
+    # devices from the last session are connected to directly, only the rest is scanned for
+    start = time.perf_counter()
+    known = {name: address for name, address in load_known_devices(root).items() if name in DEVICES}
+    connections = {}
+    if known:
+        print_callback("[*] Connecting to known devices...")
+        connections = await connect_all(known, print_callback, KNOWN_CONNECT_TIMEOUT, quiet=True)
+    matching = {name: known[name] for name in connections}
+
+    missing = [name for name in DEVICES if name not in connections]
+    if missing:
+        print_callback("[*] Scanning for devices...")
+        await scan_for_devices(print_callback, missing)
+        scanned = get_matching_devices(print_callback, missing)
+        connections.update(await connect_all(scanned, print_callback))
+        matching.update({name: scanned[name] for name in connections if name in scanned})
+    scan_time = round(time.perf_counter() - start, 3)
 
     if not matching:
         print_callback("[!] No target devices found.")
@@ -104,10 +344,43 @@ async def main(print_callback=print, stop_event=None):
 
     device_list = "\n".join(matching.keys())
     print_callback(f"[+] Found devices:\n{device_list}")
+    os.makedirs(root, exist_ok=True)
+    save_known_devices(matching, root)
+
+    session_dir = new_session_dir(root)
+    started_ns = local_time_ns()
+
+    live_scores = LiveScores()
+    live_history = LiveHistory()
+
+    def score_batch(name, times, values):
+        live_scores.update(part_name(name), times, values)
+        live_history.update(part_name(name), times, values)
 
+    # the writer thread reports errors with plain print, print_callback may touch Tk
+    packet_writer = PacketWriter(flush_interval=flush_interval, on_batch=score_batch)
+    packet_writer.start()
+
+    def alert_fall(start_ns):
+        print_callback(f"[!] FALL detected at {format_timestamp(start_ns + local_offset_ns())}")
+        if on_fall is not None:
+            on_fall(start_ns)
+
+    # the climber's calibrated fall thresholds, so the alert agrees with the scored falls;
+    # imported here, calibrate.py pulls in the metrics that the GUI only loads once recording
+    from calibrate import load_profile
+    # (raw acc magnitude only: linear acceleration needs the orientation filter over the session)
+    falls = load_profile(climber, root).get("falls", {})
+    fall_detector = FallDetector(alert_fall, **{name: falls[name] for name in ("partial_threshold", "sync_window")
+                                                if name in falls})
+    connected = {part_name(name) for name in matching}
+    unconnected = [part for part in fall_detector.recent if part not in connected]
+    if unconnected:
+        print_callback(f"[*] Fall alerts need all four limbs, not connected: {', '.join(unconnected)}")
 
     tasks = [
-        record_imu(name, DEVICES[name], dev, print_callback, stop_event)
+        record_imu(name, output_path(name, session_dir, binary), dev, print_callback, stop_event,
+                   packet_writer, connections[name], fall_detector)
         for name, dev in matching.items()
     ]
 
@@ -116,3 +389,14 @@ async def main(print_callback=print, stop_event=None):
     except asyncio.CancelledError:
         stop_event.set()  # make all record_imu() exit
         print_callback("[!] Logging cancelled.")
+    finally:
+        packet_writer.stop()
+        try:
+            write_manifest(session_dir, matching, started_ns, binary, packet_writer.finished, climber)
+            with open(os.path.join(session_dir, METRICS_FILE), "w") as f:
+                json.dump(metrics_snapshot(), f, indent=2)
+            catalog = Catalog(root)
+            catalog.add(session_dir)
+            catalog.save()
+        except Exception as e:
+            print(f"[!] Error writing manifest for {session_dir}: {e}")
@@ -0,0 +1,226 @@
+import numpy as np
+
+from resample import resample_session
+from session import PARTS, load_session
+
+# Mahony-style complementary filter: the gyro is integrated and the error between the measured
+# and the predicted gravity and magnetic north directions is fed back as a rotation rate
+KP = 1.0               # feedback gain, rad/s per unit of direction error
+ACC_GATE = 0.25        # g; samples whose |acc| is further than this from 1 g are not gravity, skip them
+MAG_GATE = 0.3         # |mag| this far (relative) from the limb's median is a local disturbance, skip it
+DEG_TO_RAD = np.pi / 180
+# The recorded gyro turns the opposite way to what the acc readings do under the right-hand
+# rule; negating it cuts the bundled session's median residual acceleration from 0.42 g to 0.17 g
+GYRO_SIGN = -1.0
+CHUNK = 1 << 16        # grid samples whose filter inputs are prepared at once
+
+# rotation matrix entries (body -> earth, row-major) as weights of the 16 products q_a * q_b
+ROTATION_WEIGHTS = np.zeros((9, 16))
+for entry, terms in enumerate([
+    [(0, 0, 1), (1, 1, 1), (2, 2, -1), (3, 3, -1)],
+    [(1, 2, 2), (0, 3, -2)],
+    [(1, 3, 2), (0, 2, 2)],
+    [(1, 2, 2), (0, 3, 2)],
+    [(0, 0, 1), (1, 1, -1), (2, 2, 1), (3, 3, -1)],
+    [(2, 3, 2), (0, 1, -2)],
+    [(1, 3, 2), (0, 2, -2)],
+    [(2, 3, 2), (0, 1, 2)],
+    [(0, 0, 1), (1, 1, -1), (2, 2, -1), (3, 3, 1)],
+]):
+    for a, b, weight in terms:
+        ROTATION_WEIGHTS[entry, 4 * a + b] = weight
+
+# q * (0, g) as a (4, 3) matrix of q's components times g: component indices and signs
+RATE_INDEX = np.array([[1, 2, 3], [0, 3, 2], [3, 0, 1], [2, 1, 0]])
+RATE_SIGN = np.array([[-1, -1, -1], [1, -1, 1], [1, 1, -1], [-1, 1, 1]], dtype=np.float64)
+
+NEXT = [1, 2, 0]       # cross product component orders
+PREV = [2, 0, 1]
+
+
+def normalize(vectors, axis=-1):
+    # unit vectors, zero where the norm is zero
+    norm = np.linalg.norm(vectors, axis=axis, keepdims=True)
+    return np.divide(vectors, norm, out=np.zeros_like(vectors), where=norm > 0)
+
+
+def matrix_to_quaternion(matrix):
+    # (k, 3, 3) rotation matrices -> (k, 4) unit quaternions (w, x, y, z), branching on the largest diagonal term
+    m = matrix
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    candidates = np.stack([
+        np.stack([1 + trace, m[:, 2, 1] - m[:, 1, 2], m[:, 0, 2] - m[:, 2, 0], m[:, 1, 0] - m[:, 0, 1]], axis=1),
+        np.stack([m[:, 2, 1] - m[:, 1, 2], 1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2], m[:, 0, 1] + m[:, 1, 0], m[:, 0, 2] + m[:, 2, 0]], axis=1),
+        np.stack([m[:, 0, 2] - m[:, 2, 0], m[:, 0, 1] + m[:, 1, 0], 1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2], m[:, 1, 2] + m[:, 2, 1]], axis=1),
+        np.stack([m[:, 1, 0] - m[:, 0, 1], m[:, 0, 2] + m[:, 2, 0], m[:, 1, 2] + m[:, 2, 1], 1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2]], axis=1),
+    ], axis=1)
+    best = np.argmax(np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=1), axis=1)
+    q = candidates[np.arange(len(m)), best]
+    q = normalize(q)
+    return q * np.where(q[:, :1] < 0, -1, 1)
+
+
+def initial_quaternions(acc, mag):
+    """
+    Orientations (k, 4) that put the measured gravity acc (k, 3) straight up and the
+    horizontal part of mag (k, 3) along north, so the filter starts converged. Without a
+    usable field north is arbitrary.
+    """
+    up = normalize(acc)
+    west = normalize(np.cross(up, mag))
+    missing = ~np.any(west, axis=1)
+    if np.any(missing):
+        # any direction perpendicular to up
+        helper = np.where(np.abs(up[missing, :1]) < 0.9, [[1.0, 0, 0]], [[0, 1.0, 0]])
+        west[missing] = normalize(np.cross(up[missing], helper))
+    north = np.cross(west, up)
+    # rows are the earth axes in body coordinates, i.e. the body -> earth rotation
+    rotation = np.stack([north, west, up], axis=1)
+    q = matrix_to_quaternion(rotation)
+    q[~np.any(up, axis=1)] = [1.0, 0.0, 0.0, 0.0]
+    return q
+
+
+def rotate(q, vectors):
+    # rotates (n, 3) body vectors to earth by unit quaternions (n, 4), in q's dtype
+    w, u = q[:, :1], q[:, 1:]
+    t = 2 * np.cross(u, vectors)
+    return vectors + w * t + np.cross(u, t)
+
+
+def typical_field(aligned):
+    # median |mag| of each limb's valid samples, (limbs, 1, 1)
+    typical = np.zeros((len(aligned.parts), 1, 1))
+    for i in range(len(aligned.parts)):
+        valid = aligned.valid[i]
+        if valid.any():
+            typical[i] = np.median(np.linalg.norm(aligned.mag()[i][valid], axis=1))
+    return typical
+
+
+def filter_inputs(aligned, start, stop, typical):
+    """
+    Filter inputs of grid samples start..stop in time-major (samples, 3, limbs) layout,
+    so the update loop takes one view per input and step: gyro in rad/s, the unit mag
+    direction, and the unit acc and mag directions with their components rotated for the
+    cross products. Directions are zero where a sample is invalid or gated out; invalid
+    samples also get zero gyro, which leaves the orientation unchanged.
+    """
+    valid = aligned.valid[:, start:stop, None]
+    acc = aligned.acc()[:, start:stop].astype(np.float64)
+    mag = aligned.mag()[:, start:stop].astype(np.float64)
+    gyro = np.where(valid, aligned.gyro()[:, start:stop] * (GYRO_SIGN * DEG_TO_RAD), 0.0)
+
+    acc_use = valid & (np.abs(np.linalg.norm(acc, axis=2, keepdims=True) - 1) < ACC_GATE)
+    mag_use = valid & (np.abs(np.linalg.norm(mag, axis=2, keepdims=True) - typical) < MAG_GATE * typical)
+    acc_unit = np.where(acc_use, normalize(acc), 0.0)
+    mag_unit = np.where(mag_use, normalize(mag), 0.0)
+
+    def time_major(x):
+        return np.ascontiguousarray(x.transpose(1, 2, 0))
+
+    return (time_major(gyro), time_major(acc_unit[:, :, NEXT]), time_major(acc_unit[:, :, PREV]),
+            time_major(mag_unit), time_major(mag_unit[:, :, NEXT]), time_major(mag_unit[:, :, PREV]))
+
+
+def run_filter(aligned, kp=KP):
+    """
+    Orientation of every limb of aligned at every grid sample, as (limbs, samples, 4)
+    float32 quaternions (w, x, y, z) rotating body vectors into the earth frame
+    (x magnetic north, y west, z up). All limbs are updated together, one vectorized step
+    per sample; each limb is re-initialised from acc and mag wherever a valid stretch starts.
+    """
+    limbs, samples = aligned.valid.shape
+    dt = 1 / aligned.rate
+    typical = typical_field(aligned)
+
+    # (step, limbs) where a valid stretch starts: right after the recording began or a dropout ended
+    valid = aligned.valid
+    starts = valid & ~np.concatenate((np.zeros((limbs, 1), dtype=bool), valid[:, :-1]), axis=1)
+    limb_idx, step_idx = np.nonzero(starts)
+    start_q = initial_quaternions(aligned.acc()[limb_idx, step_idx].astype(np.float64),
+                                  aligned.mag()[limb_idx, step_idx].astype(np.float64))
+    resets = {}
+    for limb, step, q0 in zip(limb_idx.tolist(), step_idx.tolist(), start_q):
+        resets.setdefault(step, []).append((limb, q0))
+
+    out = np.empty((samples, 4, limbs), dtype=np.float32)
+    q = np.zeros((4, limbs))
+    q[0] = 1.0
+    weights = ROTATION_WEIGHTS
+    rate_index, rate_sign = RATE_INDEX, (RATE_SIGN * (0.5 * dt))[:, :, None]
+    get_resets = resets.get
+
+    for chunk in range(0, samples, CHUNK):
+        gyro, acc_next, acc_prev, mag, mag_next, mag_prev = filter_inputs(aligned, chunk, chunk + CHUNK, typical)
+        for j in range(len(gyro)):
+            reset = get_resets(chunk + j)
+            if reset is not None:
+                for limb, q0 in reset:
+                    q[:, limb] = q0
+            r = (weights @ (q[:, None] * q[None]).reshape(16, limbs)).reshape(3, 3, limbs)
+            h = (r * mag[j]).sum(axis=1)                 # field in the earth frame
+            bx = np.sqrt(h[0] * h[0] + h[1] * h[1])      # ... with its horizontal part turned to north
+            v = r[2]                                     # predicted gravity (up) in the body frame
+            w = r[0] * bx + r[2] * h[2]                  # predicted field in the body frame
+            error = (acc_next[j] * v[PREV] - acc_prev[j] * v[NEXT]
+                     + mag_next[j] * w[PREV] - mag_prev[j] * w[NEXT])
+            g = gyro[j] + kp * error
+            q = q + (q[rate_index] * rate_sign * g).sum(axis=1)
+            q = q / np.sqrt((q * q).sum(axis=0))
+            out[chunk + j] = q
+
+    return np.ascontiguousarray(out.transpose(2, 0, 1))
+
+
+class Orientation:
+    """
+    Sensor-fusion output of a session, on resample's shared grid.
+
+    times: (samples,) int64 epoch ns grid, rate samples per second apart
+    quaternions: float32 (limbs, samples, 4), body -> earth (x magnetic north, y west, z up), limbs in parts order
+    linear_acc: float32 (limbs, samples, 3), earth-frame acceleration in g with gravity removed
+    valid: bool (limbs, samples), False outside a limb's recording and in its dropouts
+    """
+
+    def __init__(self, parts, times, quaternions, linear_acc, valid, rate):
+        self.parts = parts
+        self.times = times
+        self.quaternions = quaternions
+        self.linear_acc = linear_acc
+        self.valid = valid
+        self.rate = rate
+
+    def __len__(self):
+        return len(self.times)
+
+    def index(self, part):
+        return self.parts.index(part)
+
+    def quaternion(self, part):
+        return self.quaternions[self.index(part)]
+
+    def limb_linear_acc(self, part):
+        return self.linear_acc[self.index(part)]
+
+    def linear_acc_magnitude(self, part):
+        # float64 like LimbData.acc_magnitude, 0 where the limb has no valid sample
+        i = self.index(part)
+        return np.where(self.valid[i], np.linalg.norm(self.linear_acc[i].astype(np.float64), axis=1), 0.0)
+
+
+def estimate_orientation(session, rate=None, parts=PARTS, kp=KP):
+    """
+    Quaternions and gravity-free linear acceleration of every limb of session (a Session
+    or folder). Metrics should use Session.orientation(), which runs this once per session.
+    """
+    session = load_session(session)
+    aligned = resample_session(session, rate, parts)
+    quaternions = run_filter(aligned, kp) if len(aligned.parts) else np.zeros((0, 0, 4), dtype=np.float32)
+
+    linear_acc = np.empty(aligned.acc().shape, dtype=np.float32)
+    for i in range(len(aligned.parts)):
+        linear_acc[i] = rotate(quaternions[i], aligned.acc()[i])
+        linear_acc[i, :, 2] -= 1.0
+        linear_acc[i][~aligned.valid[i]] = 0.0
+    return Orientation(aligned.parts, aligned.times, quaternions, linear_acc, aligned.valid, aligned.rate)
@@ -0,0 +1,174 @@
+import numpy as np
+
+from windowing import run_lengths
+
+# Format 1 (legacy): one sample per notification, 9 little-endian float32, no header.
+LEGACY_PACKET_SIZE = 36
+
+# Format 2: a 4-byte header (version, sample count, uint16 packet sequence number) followed
+# by count samples of (uint32 device micros(), 9 float32). See the arduino_setup sketches.
+PACKET_VERSION = 2
+HEADER_SIZE = 4
+SAMPLE_DTYPE = np.dtype([("micros", "<u4"), ("values", "<f4", (9,))])
+SAMPLE_SIZE = SAMPLE_DTYPE.itemsize
+MAX_PACKET_SIZE = 244     # largest notification payload with a 247-byte ATT MTU (6 samples)
+
+SEQ_MODULO = 1 << 16
+MICROS_MODULO = 1 << 32   # micros() wraps after ~71 minutes
+MAX_CLOCK_DRIFT = 100e-6  # fastest the device/host offset estimate may creep upwards (100 ppm)
+RESYNC_NS = 2_000_000_000 # offset jumps larger than this mean the device restarted
+
+
+def packet_dtype(count):
+    return np.dtype([
+        ("version", "u1"),
+        ("count", "u1"),
+        ("seq", "<u2"),
+        ("samples", SAMPLE_DTYPE, (count,))
+    ])
+
+
+def packet_samples(length):
+    # number of samples in a format 2 packet of this length, None if no packet has it
+    count, rest = divmod(length - HEADER_SIZE, SAMPLE_SIZE)
+    if count < 1 or rest or length > MAX_PACKET_SIZE:
+        return None
+    return count
+
+
+def decode_legacy(packets):
+    # (n, 36) uint8 -> (n, 9) float32, one call for the whole batch
+    return np.ascontiguousarray(packets).view('<f4')
+
+
+class PacketDecoder:
+    """
+    Decodes one device's packets in either format into (times_ns, values) batches.
+
+    Legacy samples are stamped with their host receive time. Format 2 samples carry the
+    device's micros(), which is unwrapped and mapped onto the host clock with an offset
+    that follows the lowest-latency packets: it drops immediately to any smaller observed
+    host - device difference and creeps up by at most MAX_CLOCK_DRIFT otherwise, so BLE
+    and scheduling jitter stay out of the timestamps while crystal drift is tracked. A
+    drop would move new samples before ones already written, so those are held at the
+    last written time instead and a device's times never step back, except after a
+    device restart. Gaps in the sequence numbers are counted as lost packets, repeated
+    and late packets are dropped.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.lost = 0
+        self.malformed = 0
+        self.last_seq = None
+        self.last_micros = None   # raw micros() of the last sample
+        self.device_us = 0        # unwrapped device time of the last sample
+        self.offset_ns = None     # host ns - device ns
+        self.offset_time = None   # host receive time the offset was last updated at
+        self.last_ns = None       # host time of the last sample decoded
+
+    def resync(self):
+        # after a reconnect: the packets missed meanwhile are a recorded gap, not lost packets
+        self.last_seq = None
+
+    def decode(self, recv_ns, packets, lengths):
+        """
+        recv_ns: (m,) int64 host receive times, packets: (m, slot) uint8 ring slots,
+        lengths: (m,) bytes used in each slot. Returns int64 times_ns and (n, 9) float32
+        values, in arrival order.
+        """
+        times, values = [], []
+        starts, counts, run_lengths_ = run_lengths(lengths)
+        for start, count, length in zip(starts.tolist(), counts.tolist(), run_lengths_.tolist()):
+            run = slice(start, start + count)
+            if length == LEGACY_PACKET_SIZE:
+                self.version = 1
+                times.append(recv_ns[run])
+                values.append(decode_legacy(packets[run, :length]))
+                continue
+            samples = packet_samples(length)
+            if samples is None:
+                self.malformed += count
+                continue
+            decoded = self.decode_samples(recv_ns[run], packets[run, :length], samples)
+            if decoded is not None:
+                times.append(decoded[0])
+                values.append(decoded[1])
+
+        if not times:
+            return None, None
+        if len(times) == 1:
+            return times[0], values[0]
+        return np.concatenate(times), np.concatenate(values)
+
+    def decode_samples(self, recv_ns, packets, samples):
+        records = np.ascontiguousarray(packets).view(packet_dtype(samples)).reshape(-1)
+        valid = (records["version"] == PACKET_VERSION) & (records["count"] == samples)
+        if not valid.all():
+            self.malformed += int(np.count_nonzero(~valid))
+            records = records[valid]
+            recv_ns = recv_ns[valid]
+        if len(records) == 0:
+            return None
+        self.version = PACKET_VERSION
+
+        # a repeated or late packet's samples were written already or would go back in time
+        fresh = self.count_lost(records["seq"])
+        if not fresh.all():
+            records = records[fresh]
+            recv_ns = recv_ns[fresh]
+            if len(records) == 0:
+                return None
+        device_ns = self.unwrap_micros(records["samples"]["micros"].reshape(-1)) * 1000
+        # a notification goes out right after its last sample is taken
+        self.update_offset(recv_ns, device_ns[samples - 1::samples])
+        times = device_ns + self.offset_ns
+        if self.last_ns is not None:
+            times = np.maximum.accumulate(np.concatenate(([self.last_ns], times)))[1:]
+        self.last_ns = int(times[-1])
+        return times, records["samples"]["values"].reshape(-1, 9)
+
+    def count_lost(self, seq):
+        # Sequence steps are taken modulo SEQ_MODULO, forward by less than half of it; any
+        # other step is a repeated or late packet, which is not a gap and does not move
+        # the count on, only packets past the highest seq so far can skip over lost ones.
+        # Returns which packets are past it, the others are not decoded.
+        seq = seq.astype(np.int64)
+        if self.last_seq is None:
+            self.last_seq = (int(seq[0]) - 1) % SEQ_MODULO
+        steps = np.diff(seq, prepend=self.last_seq) % SEQ_MODULO
+        steps = np.where(steps < SEQ_MODULO // 2, steps, steps - SEQ_MODULO)
+        position = np.cumsum(steps)   # relative to last_seq
+        highest = np.maximum.accumulate(np.concatenate(([0], position)))
+        self.lost += int(np.sum(np.maximum(position - highest[:-1] - 1, 0)))
+        self.last_seq = (self.last_seq + int(highest[-1])) % SEQ_MODULO
+        return position > highest[:-1]
+
+    def unwrap_micros(self, micros):
+        # like count_lost, a step back by less than half of MICROS_MODULO is not a wrap; after a
+        # device reset the clock then goes back, and update_offset resyncs to it
+        micros = micros.astype(np.int64)
+        if self.last_micros is None:
+            base = micros[0]
+            steps = np.diff(micros, prepend=micros[0]) % MICROS_MODULO
+        else:
+            base = self.device_us
+            steps = np.diff(micros, prepend=self.last_micros) % MICROS_MODULO
+        steps = np.where(steps < MICROS_MODULO // 2, steps, steps - MICROS_MODULO)
+        device_us = base + np.cumsum(steps)
+        self.last_micros = int(micros[-1])
+        self.device_us = int(device_us[-1])
+        return device_us
+
+    def update_offset(self, recv_ns, device_ns):
+        observed = recv_ns - device_ns
+        lowest = int(observed.min())
+        now = int(recv_ns[-1])
+        if self.offset_ns is None or abs(int(np.median(observed)) - self.offset_ns) > RESYNC_NS:
+            # a new device clock, its times start over
+            self.offset_ns = lowest
+            self.last_ns = None
+        else:
+            allowed = self.offset_ns + int(MAX_CLOCK_DRIFT * (now - self.offset_time))
+            self.offset_ns = min(lowest, allowed)
+        self.offset_time = now
@@ -0,0 +1,327 @@
+import csv
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from binary_format import CSV_HEADER, RECORD_DTYPE, BinaryWriter, format_timestamp
+from packet_format import MAX_PACKET_SIZE, PacketDecoder
+
+RING_CAPACITY = 4096      # packets per device, ~40 s at 100 Hz with legacy one-sample packets
+FLUSH_INTERVAL = 0.25     # seconds between writer thread flushes
+HISTOGRAM_EDGES_MS = [0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]   # bin lower edges, the last bin is open
+RATE_WINDOW_NS = 2_000_000_000   # packets/s and bytes/s are averaged over this much recent time
+
+
+class PacketRing:
+    """
+    Preallocated single-producer / single-consumer ring of raw BLE packets.
+
+    push() runs on the asyncio loop for every notification and only stores the
+    receive time and copies the bytes into a free slot. drain() runs on the writer
+    thread and hands back everything pushed since the last drain. When the ring is
+    full new packets are dropped and counted, the loop never blocks on the writer.
+    Packets longer than a slot are counted as malformed and not stored.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY, slot_size=MAX_PACKET_SIZE):
+        self.capacity = capacity
+        self.slot_size = slot_size
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.zeros(capacity, dtype=np.int32)
+        self.buffer = bytearray(capacity * slot_size)
+        self.slots = np.frombuffer(self.buffer, dtype=np.uint8).reshape(capacity, slot_size)
+        self.head = 0             # total packets pushed
+        self.tail = 0             # total packets drained
+        self.high_water = 0
+        self.dropped = 0
+        self.malformed = 0
+
+    def push(self, recv_time_ns, data):
+        size = len(data)
+        if size > self.slot_size:
+            self.malformed += 1
+            return False
+        used = self.head - self.tail
+        if used >= self.capacity:
+            self.dropped += 1
+            return False
+
+        i = self.head % self.capacity
+        self.times[i] = recv_time_ns
+        self.lengths[i] = size
+        offset = i * self.slot_size
+        self.buffer[offset:offset + size] = data
+        self.head += 1
+
+        if used + 1 > self.high_water:
+            self.high_water = used + 1
+        return True
+
+    def drain(self):
+        head = self.head
+        if head == self.tail:
+            return None, None, None
+        idx = np.arange(self.tail, head) % self.capacity
+        times = self.times[idx]
+        packets = self.slots[idx]
+        lengths = self.lengths[idx]
+        self.tail = head
+        return times, packets, lengths
+
+
+def local_offset_ns():
+    return time.localtime().tm_gmtoff * 1_000_000_000
+
+
+class CsvSink:
+    def __init__(self, filename):
+        self.file = open(filename, mode='w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_HEADER)
+
+    def write_batch(self, times_ns, values):
+        offset = local_offset_ns()
+        self.writer.writerows(
+            [format_timestamp(ts + offset)] + row
+            for ts, row in zip(times_ns.tolist(), values.tolist())
+        )
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BinarySink:
+    def __init__(self, filename):
+        self.writer = BinaryWriter(filename)
+
+    def write_batch(self, times_ns, values):
+        records = np.empty(len(times_ns), dtype=RECORD_DTYPE)
+        records["timestamp"] = times_ns + local_offset_ns()
+        records["values"] = values
+        self.writer.write_records(records)
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+
+def histogram_ms(values_ns):
+    # counts of values_ns per HISTOGRAM_EDGES_MS bin
+    bins = np.searchsorted(HISTOGRAM_EDGES_MS, values_ns / 1e6, side='right') - 1
+    return np.bincount(np.clip(bins, 0, None), minlength=len(HISTOGRAM_EDGES_MS))
+
+
+class DeviceMetrics:
+    """
+    Throughput and latency counters of one device, updated by the writer thread once
+    per drained batch, so the notification path pays nothing for them.
+
+    Inter-arrival times are the gaps between consecutive notifications' receive times;
+    latency runs from a notification's receive time until its batch was written and
+    flushed to the file.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+        self.last_recv = None
+        self.arrival_counts = np.zeros(len(HISTOGRAM_EDGES_MS), dtype=np.int64)
+        self.arrival_sum = 0
+        self.arrival_sumsq = 0
+        self.arrival_count = 0
+        self.latency_counts = np.zeros(len(HISTOGRAM_EDGES_MS), dtype=np.int64)
+        self.latency_sum = 0
+        self.latency_max = 0
+        self.latency_last = 0
+        self.history = deque()    # (last receive time_ns, packets, bytes) after each batch, for the rates
+
+    def record_arrivals(self, recv_ns, lengths):
+        self.packets += len(recv_ns)
+        self.bytes += int(lengths.sum())
+        if self.last_recv is not None:
+            intervals = np.diff(recv_ns, prepend=self.last_recv)
+        else:
+            intervals = np.diff(recv_ns)
+        self.last_recv = int(recv_ns[-1])
+        intervals = intervals.astype(np.float64)
+        self.arrival_counts += histogram_ms(intervals)
+        self.arrival_sum += intervals.sum()
+        self.arrival_sumsq += (intervals ** 2).sum()
+        self.arrival_count += len(intervals)
+
+        self.history.append((self.last_recv, self.packets, self.bytes))
+        while len(self.history) > 2 and self.last_recv - self.history[1][0] >= RATE_WINDOW_NS:
+            self.history.popleft()
+
+    def record_written(self, recv_ns, written_ns):
+        latency = written_ns - recv_ns
+        self.latency_counts += histogram_ms(latency)
+        self.latency_sum += int(latency.sum())
+        self.latency_last = int(latency.max())
+        self.latency_max = max(self.latency_max, self.latency_last)
+
+    def rates(self):
+        if len(self.history) < 2:
+            return 0.0, 0.0
+        (t0, p0, b0), (t1, p1, b1) = self.history[0], self.history[-1]
+        seconds = (t1 - t0) / 1e9
+        if seconds <= 0:
+            return 0.0, 0.0
+        return (p1 - p0) / seconds, (b1 - b0) / seconds
+
+    def snapshot(self):
+        packets_per_sec, bytes_per_sec = self.rates()
+        n = self.arrival_count
+        mean = self.arrival_sum / n if n else 0.0
+        std = max(self.arrival_sumsq / n - mean ** 2, 0.0) ** 0.5 if n else 0.0
+        return {
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "packets_per_sec": round(packets_per_sec, 2),
+            "bytes_per_sec": round(bytes_per_sec, 1),
+            "interarrival_mean_ms": round(mean / 1e6, 3),
+            "interarrival_jitter_ms": round(std / 1e6, 3),
+            "interarrival_histogram": self.arrival_counts.tolist(),
+            "latency_mean_ms": round(self.latency_sum / self.packets / 1e6, 3) if self.packets else 0.0,
+            "latency_max_ms": round(self.latency_max / 1e6, 3),
+            "latency_last_ms": round(self.latency_last / 1e6, 3),
+            "latency_histogram": self.latency_counts.tolist(),
+            "histogram_edges_ms": HISTOGRAM_EDGES_MS
+        }
+
+
+def open_sink(filename):
+    if filename.endswith(".bin"):
+        return BinarySink(filename)
+    return CsvSink(filename)
+
+
+class PacketWriter:
+    """
+    Background thread that drains every device's PacketRing into its file.
+
+    Packets are decoded and written in batches every flush_interval seconds, so
+    the BLE callbacks (and the Tk loop sharing their thread) never touch the disk.
+    on_batch(name, times_ns, values), if given, also gets every decoded batch.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, capacity=RING_CAPACITY, print_callback=print, on_batch=None):
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.print_callback = print_callback
+        self.on_batch = on_batch
+        self.devices = {}
+        self.finished = {}        # name -> final device_stats of devices that were removed
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="packet-writer", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add_device(self, name, filename, connect_time=None):
+        # connect_time: seconds the BLE connection took, reported with the device's stats
+        ring = PacketRing(self.capacity)
+        sink = open_sink(filename)
+        with self.lock:
+            self.devices[name] = {"name": name, "ring": ring, "decoder": PacketDecoder(), "sink": sink, "written": 0,
+                                  "first": None, "last": None, "metrics": DeviceMetrics(), "connect_time": connect_time,
+                                  "gaps": []}
+        return ring
+
+    def record_gap(self, name, start_ns, end_ns):
+        # the device was disconnected from start_ns until end_ns (host time.time_ns())
+        with self.lock:
+            device = self.devices.get(name)
+            if device is None:
+                return
+            device["gaps"].append((start_ns, end_ns))
+            # packets from before the gap are decoded with the old sequence numbers
+            self.flush_device(device)
+            device["decoder"].resync()
+
+    def remove_device(self, name):
+        # final flush and close, called from the device's record_imu cleanup
+        with self.lock:
+            device = self.devices.pop(name, None)
+            if device is None:
+                return None
+            self.flush_device(device)
+            device["sink"].close()
+            stats = self.finished[name] = self.device_stats(device)
+        return stats
+
+    def flush_device(self, device):
+        recv_times, packets, lengths = device["ring"].drain()
+        if recv_times is None:
+            return
+        metrics = device["metrics"]
+        metrics.record_arrivals(recv_times, lengths)
+        times, values = device["decoder"].decode(recv_times, packets, lengths)
+        if times is None:
+            return
+        device["sink"].write_batch(times, values)
+        metrics.record_written(recv_times, time.time_ns())
+        device["written"] += len(times)
+        if device["first"] is None:
+            device["first"] = int(times[0])
+        device["last"] = int(times[-1])
+        if self.on_batch is not None:
+            self.on_batch(device["name"], times, values)
+
+    def flush(self):
+        with self.lock:
+            for name, device in self.devices.items():
+                try:
+                    self.flush_device(device)
+                except Exception as e:
+                    self.print_callback(f"[!] Error writing data for {name}: {e}")
+
+    def run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        with self.lock:
+            for name in list(self.devices):
+                device = self.devices.pop(name)
+                self.flush_device(device)
+                device["sink"].close()
+                self.finished[name] = self.device_stats(device)
+
+    def device_stats(self, device):
+        ring = device["ring"]
+        decoder = device["decoder"]
+        first, last = device["first"], device["last"]
+        offset = local_offset_ns()
+        return {
+            "written": device["written"],
+            "first_ns": first,
+            "last_ns": last,
+            "duration": (last - first) / 1e9 if first is not None else 0.0,
+            "buffered": ring.head - ring.tail,
+            "high_water": ring.high_water,
+            "capacity": ring.capacity,
+            "dropped": ring.dropped,
+            "lost": decoder.lost,
+            "malformed": ring.malformed + decoder.malformed,
+            "packet_version": decoder.version,
+            "connect_s": device["connect_time"],
+            "gaps": [
+                {"start": format_timestamp(start + offset), "end": format_timestamp(end + offset),
+                 "seconds": round((end - start) / 1e9, 3)}
+                for start, end in device["gaps"]
+            ],
+            **device["metrics"].snapshot()
+        }
+
+    def stats(self):
+        with self.lock:
+            return {name: self.device_stats(device) for name, device in self.devices.items()}
@@ -0,0 +1,166 @@
+import numpy as np
+
+from session import PARTS, load_session
+from windowing import run_lengths
+
+GAP_FACTOR = 5   # an interval this many times the typical one is a dropout
+
+
+def typical_interval(timestamps):
+    # median spacing between distinct timestamps in ns, None with fewer than two of them
+    distinct = np.unique(timestamps)
+    if len(distinct) < 2:
+        return None
+    return float(np.median(np.diff(distinct)))
+
+
+def gap_threshold(timestamps, gap_factor=GAP_FACTOR):
+    typical = typical_interval(timestamps)
+    return None if typical is None else gap_factor * typical
+
+
+def find_gaps(timestamps, gap_factor=GAP_FACTOR):
+    """
+    Dropouts in a limb's recording: (start_ns, end_ns) of every interval longer than
+    gap_factor times the typical spacing between distinct timestamps.
+    """
+    threshold = gap_threshold(timestamps, gap_factor)
+    if threshold is None:
+        return []
+    dt = np.diff(timestamps)
+    idx = np.flatnonzero(dt > threshold)
+    return list(zip(timestamps[idx].tolist(), timestamps[idx + 1].tolist()))
+
+
+def estimate_sample_rate(timestamps, gap_factor=GAP_FACTOR):
+    """
+    Samples per second over the recorded stretches of timestamps (int64 epoch ns).
+
+    Dropouts (see find_gaps) are left out of both the sample and the time count, and
+    repeated host timestamps from notifications that arrived together still count as
+    samples, so neither pulls the estimate the way a plain mean interval does.
+    """
+    threshold = gap_threshold(timestamps, gap_factor)
+    if threshold is None:
+        return 1
+    dt = np.diff(timestamps)
+    recorded = (dt >= 0) & (dt <= threshold)
+    duration = dt[recorded].sum()
+    return np.count_nonzero(recorded) / duration * 1e9 if duration > 0 else 1
+
+
+def spread_duplicates(timestamps, interval_ns, gap_ns):
+    """
+    Spreads runs of identical timestamps evenly over the interval before them, ending at
+    the shared timestamp. The logger stamps samples on arrival, so a run is a batch of
+    notifications received together that were sampled during that interval. Runs after
+    a dropout or at the start are spread over interval_ns per sample instead.
+    """
+    starts, lengths, values = run_lengths(timestamps)
+    span = np.empty_like(values)
+    span[0] = 0
+    span[1:] = values[1:] - values[:-1]
+    nominal = (interval_ns * lengths).astype(np.int64)
+    span = np.where((span <= 0) | (span > gap_ns), nominal, span)
+
+    position = np.arange(len(timestamps)) - np.repeat(starts, lengths) + 1
+    run_len = np.repeat(lengths, lengths)
+    return np.repeat(values - span, lengths) + np.repeat(span, lengths) * position // run_len
+
+
+def interpolate(timestamps, values, grid, gap_ns):
+    """
+    Linear interpolation of (n, channels) values onto grid for all channels at once.
+    Returns float32 (len(grid), channels) values and a bool mask that is False outside
+    the recording and inside dropouts longer than gap_ns.
+    """
+    n = len(timestamps)
+    right = np.searchsorted(timestamps, grid, side='right')
+    idx = np.clip(right - 1, 0, n - 2)
+    t0 = timestamps[idx]
+    t1 = timestamps[idx + 1]
+    dt = t1 - t0
+    frac = np.clip((grid - t0) / np.maximum(dt, 1), 0.0, 1.0)[:, None]
+
+    v0 = values[idx].astype(np.float64)
+    v1 = values[idx + 1].astype(np.float64)
+    resampled = (v0 + frac * (v1 - v0)).astype(np.float32)
+
+    valid = (grid >= timestamps[0]) & (grid <= timestamps[-1]) & (dt <= gap_ns)
+    return resampled, valid
+
+
+class AlignedSession:
+    """
+    Every limb of a session on one shared uniform time grid.
+
+    times: (samples,) int64 epoch ns grid, rate samples per second apart
+    data: float32 array of shape (limbs, samples, 9), limbs in parts order, SENSOR_COLUMNS channels
+    valid: bool array of shape (limbs, samples), False before/after a limb's recording and in its dropouts
+    gaps: part -> list of (start_ns, end_ns) dropouts
+    """
+
+    def __init__(self, parts, times, data, valid, rate, gaps):
+        self.parts = parts
+        self.times = times
+        self.data = data
+        self.valid = valid
+        self.rate = rate
+        self.gaps = gaps
+
+    def __len__(self):
+        return len(self.times)
+
+    def index(self, part):
+        return self.parts.index(part)
+
+    def limb(self, part):
+        return self.data[self.index(part)]
+
+    def acc(self):
+        return self.data[:, :, 0:3]
+
+    def gyro(self):
+        return self.data[:, :, 3:6]
+
+    def mag(self):
+        return self.data[:, :, 6:9]
+
+
+def resample_session(session, rate=None, parts=PARTS, gap_factor=GAP_FACTOR):
+    """
+    Resamples the limbs of session (a Session or folder) onto one uniform grid covering
+    all of them. rate defaults to the median of the limbs' estimate_sample_rate.
+    """
+    session = load_session(session)
+    limbs = {part: session[part] for part in parts if part in session and len(session[part]) >= 2}
+    if not limbs:
+        return AlignedSession([], np.zeros(0, dtype=np.int64), np.zeros((0, 0, 9), dtype=np.float32),
+                              np.zeros((0, 0), dtype=bool), rate or 1, {})
+
+    if rate is None:
+        rate = float(np.median([estimate_sample_rate(limb.timestamps, gap_factor) for limb in limbs.values()]))
+    step = max(1, int(round(1e9 / rate)))
+
+    start = min(int(limb.timestamps.min()) for limb in limbs.values())
+    end = max(int(limb.timestamps.max()) for limb in limbs.values())
+    times = start + step * np.arange((end - start) // step + 1, dtype=np.int64)
+
+    data = np.empty((len(limbs), len(times), 9), dtype=np.float32)
+    valid = np.empty((len(limbs), len(times)), dtype=bool)
+    gaps = {}
+    for i, (part, limb) in enumerate(limbs.items()):
+        timestamps, values = limb.timestamps, limb.values
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+
+        gap_ns = gap_threshold(timestamps, gap_factor)
+        if gap_ns is None:
+            gap_ns = gap_factor * step
+        gaps[part] = find_gaps(timestamps, gap_factor)
+        limb_rate = estimate_sample_rate(timestamps, gap_factor)
+        spread = spread_duplicates(timestamps, 1e9 / limb_rate, gap_ns)
+        data[i], valid[i] = interpolate(spread, values, times, gap_ns)
+
+    return AlignedSession(list(limbs), times, data, valid, rate, gaps)
@@ -0,0 +1,210 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from arm_leg_usage import get_arm_leg_usage
+from fall_rhythm import get_falls, get_rhythm
+from grip_count import get_grips
+from session import PARTS, Session
+from smoothness import average_smoothness, get_limb_smoothness, get_smoothness_score
+from stability import get_stability
+
+METRIC_TIMEOUT = 120      # seconds per metric job, counted from when a worker is free for it
+MAX_WORKERS = 4
+
+DEFAULTS = {
+    "usage": {
+        "arm_usage_ratio": 0,
+        "leg_usage_ratio": 0,
+        "comment": "No data recorded"
+    },
+    "stability": 0.0,
+    "smoothness": 0.0,
+    "rhythm": {
+        "mean_interval": 0.0,
+        "std_interval": 0.0,
+        "rhythm_score": 0.0
+    },
+    "grips": None,
+    "falls": {"partial_falls": [], "full_falls": []}
+}
+
+# scores key listing the metrics that show their DEFAULTS value because they have no real
+# one, so trends.flatten_scores never stores a placeholder as a session's score
+DEFAULTED = "defaulted"
+
+# the get_* function behind each metric, for scoring a session in a single process
+METRICS = {
+    "usage": get_arm_leg_usage,
+    "stability": get_stability,
+    "smoothness": get_smoothness_score,
+    "rhythm": get_rhythm,
+    "grips": get_grips,
+    "falls": get_falls
+}
+
+# worker-side jobs, looked up by name so only strings cross the process boundary
+JOBS = {**METRICS, "smoothness": get_limb_smoothness}
+
+_session = None
+_folder = None
+
+
+def init_worker(folder=None):
+    # unpickling this function imported the metrics (and pandas) already; parse the session too if known
+    if folder is not None:
+        worker_session(folder)
+
+
+def worker_session(folder):
+    # every worker parses a session once, then serves any number of jobs on it
+    global _session, _folder
+    if folder != _folder:
+        _session = Session.load(folder)
+        _folder = folder
+    return _session
+
+
+def run_job(folder, job, args, params):
+    return JOBS[job](worker_session(folder), *args, **params)
+
+
+def ready():
+    return os.getpid()
+
+
+def score_all(session, profile=None):
+    """
+    Every metric of session in the calling process, the same values show_scores displays.
+    profile: metric -> threshold keyword arguments, e.g. a climber's calibrate.load_profile().
+    Returns (scores, errors): metric -> value, with DEFAULTS for metrics that raised or had
+    no value (listed under scores[DEFAULTED]), and metric -> error message for those that raised.
+    """
+    profile = profile or {}
+    scores, errors, defaulted = {}, {}, []
+    for name, metric in METRICS.items():
+        try:
+            value = metric(session, **profile.get(name, {}))
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+            value = None
+        if value is None:
+            value = DEFAULTS[name]
+            defaulted.append(name)
+        scores[name] = value
+    scores[DEFAULTED] = defaulted
+    return scores, errors
+
+
+def metric_jobs(profile=None):
+    """
+    metric -> (list of (job, args, params), combine). Smoothness is split per limb, the
+    other metrics are already vectorized across limbs and run as a single job. params are
+    the metric's thresholds from profile.
+    """
+    profile = profile or {}
+    single = lambda results: results[0]
+    jobs = {name: ([(name, (), profile.get(name, {}))], single)
+            for name in ("usage", "stability", "rhythm", "grips", "falls")}
+    jobs["smoothness"] = ([("smoothness", (part,), profile.get("smoothness", {})) for part in PARTS],
+                          average_smoothness)
+    return jobs
+
+
+def pool_size(max_workers=MAX_WORKERS):
+    return max(1, min(max_workers, os.cpu_count() or 1))
+
+
+def make_pool(folder=None, max_workers=MAX_WORKERS):
+    # spawn, so workers never inherit Tk or the logger's threads
+    return ProcessPoolExecutor(
+        max_workers=pool_size(max_workers),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(folder,)
+    )
+
+
+async def warm_pool(max_workers=MAX_WORKERS):
+    """
+    A pool whose workers are already started and have imported the metrics, for
+    score_session(pool=...). Starting the interpreters and importing pandas takes
+    about as long as scoring a short session, so the GUI warms a pool up while recording.
+    """
+    loop = asyncio.get_running_loop()
+    pool = make_pool(max_workers=max_workers)
+    # the executor only starts workers for submitted work, one job per worker starts them all
+    await asyncio.gather(*(loop.run_in_executor(pool, ready) for _ in range(pool_size(max_workers))))
+    return pool
+
+
+def free_slot(slots, future):
+    # a timed-out job keeps its worker until it finishes, and its slot with it
+    slots.release()
+    if not future.cancelled():
+        future.exception()   # retrieved, a late error of a job nobody waits for is not logged
+
+
+async def run_timed(loop, pool, slots, folder, job, args, params, timeout):
+    # submitted once a worker is free, so the timeout covers running the job, not queueing
+    await slots.acquire()
+    future = loop.run_in_executor(pool, run_job, folder, job, args, params)
+    future.add_done_callback(lambda done: free_slot(slots, done))
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+
+async def run_metric(loop, pool, slots, folder, name, jobs, combine, timeout, errors, defaulted):
+    tasks = [asyncio.ensure_future(run_timed(loop, pool, slots, folder, job, args, params, timeout))
+             for job, args, params in jobs]
+    try:
+        value = combine(await asyncio.gather(*tasks))
+    except asyncio.TimeoutError:
+        errors[name] = f"timed out after {timeout} s"
+        value = None
+    except Exception as e:
+        errors[name] = f"{type(e).__name__}: {e}"
+        value = None
+    finally:
+        # the metric failed if one of its jobs did, its other jobs need not run
+        for task in tasks:
+            task.cancel()
+    if name in errors:
+        print(f"[!] {name} failed: {errors[name]}")
+    if value is None:
+        value = DEFAULTS[name]
+        defaulted.append(name)
+    return value
+
+
+async def score_session(folder, on_result, timeout=METRIC_TIMEOUT, max_workers=MAX_WORKERS, pool=None,
+                        profile=None):
+    """
+    Runs every metric on the session in folder concurrently in a process pool.
+
+    on_result(name, value) is called on the event loop as soon as each metric finishes,
+    so callers can render it right away. Jobs are handed to the pool as workers become
+    free; a metric that raises, or has a job running longer than timeout seconds, reports
+    its DEFAULTS value instead and never holds up the others, as
+    does one without a value; on_result(DEFAULTED, names) lists them once all are done,
+    so the collected results look like score_all's scores. Returns metric -> error message for the metrics that failed. A pool from warm_pool()
+    is used instead of starting one, and shut down afterwards like a new one. profile
+    holds threshold overrides per metric, as in score_all.
+    """
+    loop = asyncio.get_running_loop()
+    if pool is None:
+        pool = make_pool(folder, max_workers)
+    errors, defaulted = {}, []
+    slots = asyncio.Semaphore(pool_size(max_workers))
+
+    async def run(name, jobs, combine):
+        on_result(name, await run_metric(loop, pool, slots, folder, name, jobs, combine, timeout, errors,
+                                         defaulted))
+
+    try:
+        await asyncio.gather(*(run(name, jobs, combine) for name, (jobs, combine) in metric_jobs(profile).items()))
+    finally:
+        # a timed-out job may still be running, don't block the loop waiting for it
+        pool.shutdown(wait=False, cancel_futures=True)
+    on_result(DEFAULTED, defaulted)
+    return errors
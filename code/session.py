@@ -0,0 +1,187 @@
+import json
+import os
+
+import numpy as np
+
+from binary_format import iter_binary, read_binary
+
+PARTS = ["left_arm", "right_arm", "left_leg", "right_leg"]
+MANIFEST = "manifest.json"   # written by the logger next to the limb files
+
+SENSOR_COLUMNS = [
+    "accX", "accY", "accZ",
+    "gyroX", "gyroY", "gyroZ",
+    "magX", "magY", "magZ"
+]
+
+
+class LimbData:
+    """
+    One limb's recording as typed columns.
+
+    timestamps: int64 epoch nanoseconds (the logger's naive host time, read as UTC)
+    values: float32 array of shape (n, 9), in SENSOR_COLUMNS order. acc, gyro and mag are views into it.
+    For binary session files both are views onto the memory-mapped records.
+    """
+
+    def __init__(self, timestamps, values):
+        self.timestamps = timestamps
+        self.values = values
+        self.acc = values[:, 0:3]
+        self.gyro = values[:, 3:6]
+        self.mag = values[:, 6:9]
+        self._acc_mag = None
+        self._gyro_mag = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def seconds(self):
+        return self.timestamps / 1e9
+
+    def acc_magnitude(self):
+        # float64, so thresholds compare exactly as they did on the parsed CSV values
+        if self._acc_mag is None:
+            self._acc_mag = np.linalg.norm(self.acc.astype(np.float64), axis=1)
+        return self._acc_mag
+
+    def gyro_magnitude(self):
+        if self._gyro_mag is None:
+            self._gyro_mag = np.linalg.norm(self.gyro.astype(np.float64), axis=1)
+        return self._gyro_mag
+
+    def to_frame(self):
+        import pandas as pd
+        index = pd.DatetimeIndex(self.timestamps.astype('datetime64[ns]'), name='timestamp')
+        return pd.DataFrame(self.values.astype(np.float64), index=index, columns=SENSOR_COLUMNS)
+
+
+def parse_limb_rows(df):
+    import pandas as pd
+    timestamps = pd.to_datetime(df['timestamp'], format='ISO8601', errors='coerce')
+    values = df[SENSOR_COLUMNS].apply(pd.to_numeric, errors='coerce')
+
+    # rows cut short when the logger was stopped mid-write are dropped
+    valid = timestamps.notna().to_numpy() & values.notna().all(axis=1).to_numpy()
+    ts = timestamps.to_numpy(dtype='datetime64[ns]')[valid].view(np.int64)
+    data = np.ascontiguousarray(values.to_numpy(dtype=np.float64)[valid], dtype=np.float32)
+    return ts, data
+
+
+def read_limb_csv(path):
+    # pandas is imported on first use: the logger and GUI import this module for
+    # MANIFEST and PARTS and should start without it
+    import pandas as pd
+    return LimbData(*parse_limb_rows(pd.read_csv(path)))
+
+
+def read_limb_binary(path):
+    # zero-copy: both columns are views onto the memory-mapped file
+    records = read_binary(path)
+    return LimbData(records['timestamp'], records['values'])
+
+
+def iter_limb_chunks(path, chunk_samples):
+    """
+    A limb file as consecutive (timestamps, values) chunks of at most chunk_samples rows,
+    typed like LimbData's columns, so a session of any length can be analysed in constant
+    memory (see streaming.py). CSV rows are parsed exactly as read_limb_csv parses them.
+    """
+    if path.endswith(".bin"):
+        for records in iter_binary(path, chunk_samples):
+            yield records['timestamp'], records['values']
+        return
+    import pandas as pd
+    with pd.read_csv(path, chunksize=chunk_samples) as reader:
+        for df in reader:
+            yield parse_limb_rows(df)
+
+
+def find_limb_file(folder, part):
+    # prefer whichever of <part>.bin / <part>.csv was recorded last
+    candidates = [os.path.join(folder, f"{part}{ext}") for ext in (".bin", ".csv")]
+    existing = [path for path in candidates if os.path.exists(path)]
+    if not existing:
+        return None
+    return max(existing, key=os.path.getmtime)
+
+
+def is_session(folder):
+    return any(find_limb_file(folder, part) is not None for part in PARTS)
+
+
+def read_manifest(folder):
+    # the logger's manifest of a session folder, None for folders recorded without one
+    path = os.path.join(folder, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class Session:
+    """
+    A recorded session with every limb file parsed once.
+
+    Build it with Session.load(folder) and pass it to the get_* metric functions.
+    """
+
+    def __init__(self, folder, limbs):
+        self.folder = folder
+        self.limbs = limbs
+        self._orientation = None
+
+    @classmethod
+    def load(cls, folder):
+        limbs = {}
+        for part in PARTS:
+            path = find_limb_file(folder, part)
+            if path is None:
+                print(f"No csv file found for {part}")
+                continue
+            try:
+                if path.endswith(".bin"):
+                    limbs[part] = read_limb_binary(path)
+                else:
+                    limbs[part] = read_limb_csv(path)
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+        return cls(folder, limbs)
+
+    def __contains__(self, part):
+        return part in self.limbs
+
+    def __getitem__(self, part):
+        return self.limbs[part]
+
+    def get(self, part):
+        return self.limbs.get(part)
+
+    def orientation(self):
+        # quaternions and gravity-free acceleration of every limb, computed on first use (see orientation.py)
+        if self._orientation is None:
+            from orientation import estimate_orientation
+            self._orientation = estimate_orientation(self)
+        return self._orientation
+
+    def acc_magnitude(self, part, linear=False):
+        """
+        (timestamps, float64 acc magnitude) of a limb in the session. With linear, the
+        gravity-free acceleration of orientation() instead, on its resampled grid without
+        the limb's dropouts, so a threshold on it does not depend on how the sensor is held.
+        """
+        if not linear:
+            limb = self.limbs[part]
+            return limb.timestamps, limb.acc_magnitude()
+        orientation = self.orientation()
+        if part not in orientation.parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        valid = orientation.valid[orientation.index(part)]
+        return orientation.times[valid], orientation.linear_acc_magnitude(part)[valid]
+
+
+def load_session(source):
+    # metrics accept either a loaded Session or a session folder
+    if isinstance(source, Session):
+        return source
+    return Session.load(source)
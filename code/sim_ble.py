@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import tempfile
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+import logger
+from packet_format import LEGACY_PACKET_SIZE, PACKET_VERSION, packet_dtype
+from session import PARTS, find_limb_file, read_limb_csv, read_limb_binary
+
+BATCH_INTERVAL = 0.005    # seconds between emitter wake-ups, due packets are sent together
+CONNECT_WAIT = 30         # seconds load_test waits for the logger to scan and connect
+
+
+class SimulatedSensor:
+    """
+    One fake IMU_* peripheral: advertises its name and, while a client is subscribed,
+    emits notifications with values from source, an (n, 9) float32 array replayed in a
+    loop.
+
+    rate is the device sample rate and speed scales it, so speed=10 replays ten times
+    faster than real time. samples_per_packet=0 sends legacy 36-byte packets, otherwise
+    format 2 packets of that many samples with micros() timestamps and sequence numbers.
+    jitter_ms delays each notification by an exponential amount, loss drops packets at
+    random and disconnect_after ends the connection after that many seconds;
+    the sensor advertises again reconnect_delay seconds later.
+    """
+
+    def __init__(self, name, source, rate=100.0, speed=1.0, samples_per_packet=0, jitter_ms=0.0,
+                 loss=0.0, disconnect_after=None, reconnect_delay=1.0, seed=0):
+        self.name = name
+        self.address = f"SIM:{zlib.crc32(name.encode()) & 0xFFFFFF:06X}"
+        self.source = np.ascontiguousarray(source, dtype=np.float32)
+        self.rate = rate * speed
+        self.samples_per_packet = samples_per_packet
+        self.jitter = jitter_ms / 1000
+        self.loss = loss
+        self.disconnect_after = disconnect_after
+        self.reconnect_delay = reconnect_delay
+        self.rng = np.random.default_rng(seed)
+        self.advertising_at = 0.0   # monotonic time the sensor is visible again
+        self.sample = 0             # next sample of source, continues across connections
+        self.seq = 0
+        self.sent = 0
+        self.lost = 0
+
+    def packet_interval(self):
+        return max(self.samples_per_packet, 1) / self.rate
+
+    def build_packets(self, count, start_time):
+        """
+        The next count packets as (count, size) uint8 rows. start_time is the monotonic
+        time of the first sample, micros() counts from the simulator's start.
+        """
+        per_packet = max(self.samples_per_packet, 1)
+        idx = (self.sample + np.arange(count * per_packet)) % len(self.source)
+        values = self.source[idx]
+        self.sample += count * per_packet
+        if self.samples_per_packet == 0:
+            return values.view(np.uint8).reshape(count, LEGACY_PACKET_SIZE)
+
+        packets = np.zeros(count, dtype=packet_dtype(per_packet))
+        packets["version"] = PACKET_VERSION
+        packets["count"] = per_packet
+        packets["seq"] = (self.seq + np.arange(count)) % (1 << 16)
+        self.seq += count
+        sample_times = start_time + np.arange(count * per_packet) / self.rate
+        micros = (sample_times * 1e6).astype(np.int64) % (1 << 32)
+        packets["samples"]["micros"] = micros.reshape(count, per_packet)
+        packets["samples"]["values"] = values.reshape(count, per_packet, 9)
+        return packets.view(np.uint8).reshape(count, -1)
+
+    async def stream(self, client, handler):
+        """
+        Emits notifications to handler until client unsubscribes or disconnects. Packets
+        are due on a fixed schedule; every BATCH_INTERVAL the ones that are due (plus
+        their jitter) are sent in order, so high rates don't need one sleep per packet.
+        """
+        interval = self.packet_interval()
+        start = time.monotonic()
+        sent_until = start             # due time of the next packet to build
+        pending = deque()              # (send_time, bytes) built but not yet sent
+        while client.subscribed:
+            now = time.monotonic()
+            if self.disconnect_after is not None and now - start >= self.disconnect_after:
+                client.drop_connection()
+                self.advertising_at = now + self.reconnect_delay
+                return
+
+            count = int((now - sent_until) / interval) + 1 if now >= sent_until else 0
+            if count:
+                rows = self.build_packets(count, sent_until - start)
+                due = sent_until + np.arange(count) * interval
+                if self.jitter:
+                    due = np.maximum.accumulate(due + self.rng.exponential(self.jitter, count))
+                keep = self.rng.random(count) >= self.loss if self.loss else np.ones(count, dtype=bool)
+                self.lost += int(count - keep.sum())
+                pending.extend(zip(due[keep].tolist(), (bytearray(row) for row in rows[keep])))
+                sent_until += count * interval
+
+            while pending and pending[0][0] <= now:
+                _, data = pending.popleft()
+                handler(client.characteristic, data)
+                self.sent += 1
+
+            await asyncio.sleep(BATCH_INTERVAL)
+
+
+class Simulator:
+    """
+    A set of SimulatedSensors behind fake BleakScanner/BleakClient classes. install()
+    makes the logger use them in place of bleak.
+    """
+
+    def __init__(self, sensors):
+        self.sensors = {sensor.address: sensor for sensor in sensors}
+
+    def scanner(self, detection_callback):
+        return SimulatedScanner(self, detection_callback)
+
+    def client(self, device, disconnected_callback=None, **kwargs):
+        return SimulatedClient(self, device, disconnected_callback)
+
+    def install(self):
+        logger.use_transport(self.scanner, self.client)
+
+    def uninstall(self):
+        logger.use_transport()
+
+
+class SimulatedDevice:
+    # stands in for bleak's BLEDevice
+    def __init__(self, sensor):
+        self.address = sensor.address
+        self.name = sensor.name
+
+
+class SimulatedAdvertisement:
+    def __init__(self, sensor):
+        self.local_name = sensor.name
+
+
+class SimulatedScanner:
+    def __init__(self, simulator, detection_callback):
+        self.simulator = simulator
+        self.detection_callback = detection_callback
+        self.task = None
+
+    async def advertise(self):
+        # every visible sensor advertises every 100 ms, like a real advertising interval
+        while True:
+            now = time.monotonic()
+            for sensor in self.simulator.sensors.values():
+                if sensor.advertising_at <= now:
+                    self.detection_callback(SimulatedDevice(sensor), SimulatedAdvertisement(sensor))
+            await asyncio.sleep(0.1)
+
+    async def start(self):
+        self.task = asyncio.create_task(self.advertise())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+class SimulatedClient:
+    def __init__(self, simulator, device, disconnected_callback=None):
+        address = device if isinstance(device, str) else device.address
+        self.sensor = simulator.sensors.get(address)
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.subscribed = False
+        self.characteristic = None
+        self.task = None
+
+    async def connect(self, timeout=10.0):
+        # like connecting by address: wait until the sensor advertises or timeout runs out
+        wait = timeout if self.sensor is None else self.sensor.advertising_at - time.monotonic()
+        if wait > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError(f"Device with address {self.address} was not found")
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await asyncio.sleep(0.05)   # connection setup
+        self.is_connected = True
+        return True
+
+    async def start_notify(self, char_uuid, handler):
+        if not self.is_connected:
+            raise RuntimeError("Not connected")
+        self.characteristic = char_uuid
+        self.subscribed = True
+        self.task = asyncio.create_task(self.sensor.stream(self, handler))
+
+    async def stop_notify(self, char_uuid):
+        self.subscribed = False
+        if self.task is not None:
+            await self.task
+            self.task = None
+
+    async def disconnect(self):
+        self.subscribed = False
+        self.is_connected = False
+        return True
+
+    def drop_connection(self):
+        # the link went away on the sensor's side
+        self.subscribed = False
+        self.is_connected = False
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+
+def load_sources(folder, count):
+    # limb values of a recorded session folder, one per device, reused in PARTS order
+    sources = []
+    for part in PARTS:
+        path = find_limb_file(folder, part)
+        if path is not None:
+            limb = read_limb_binary(path) if path.endswith(".bin") else read_limb_csv(path)
+            sources.append(np.array(limb.values))
+    if not sources:
+        raise ValueError(f"No limb files in {folder}")
+    return [sources[i % len(sources)] for i in range(count)]
+
+
+def synthetic_sources(count, rate, seconds=600, seed=0):
+    from synth import generate_session
+    session = generate_session(seconds, rate=rate, seed=seed, dropouts_per_minute=0, loss=0)
+    limbs = [session[part].values for part in PARTS]
+    return [limbs[i % len(limbs)] for i in range(count)]
+
+
+def simulated_devices(count):
+    # name -> file like logger.DEVICES: the four limb sensors, then extra ones for load tests
+    devices = dict(list(logger.DEVICES.items())[:count])
+    for i in range(len(devices), count):
+        devices[f"IMU_Extra{i + 1}"] = f"extra_{i + 1}.csv"
+    return devices
+
+
+async def load_test(devices=4, rate=100.0, speed=1.0, seconds=10.0, samples_per_packet=0, jitter_ms=0.0,
+                    loss=0.0, disconnect_after=None, source=None, binary=False, root=None, seed=0,
+                    print_callback=print):
+    """
+    Runs logger.main against simulated sensors for seconds and returns a summary per
+    device: samples sent and written, packets lost on the simulated link, and the
+    logger's own metrics. A pipeline keeping up writes every sample that was sent.
+    """
+    simulated = simulated_devices(devices)
+    names = list(simulated)
+    if source:
+        sources = load_sources(source, devices)
+    else:
+        sources = synthetic_sources(devices, rate, seed=seed)
+    sensors = [
+        SimulatedSensor(name, values, rate, speed, samples_per_packet, jitter_ms, loss, disconnect_after, seed=seed + i)
+        for i, (name, values) in enumerate(zip(names, sources))
+    ]
+    simulator = Simulator(sensors)
+    simulator.install()
+    saved_devices = logger.DEVICES
+    logger.DEVICES = simulated
+
+    root = root or tempfile.mkdtemp(prefix="sim_ble_")
+    stop_event = asyncio.Event()
+    logger.packet_writer = None
+    task = asyncio.create_task(logger.main(print_callback, stop_event, binary=binary, root=root))
+    try:
+        # recording starts once the logger has scanned and connected, or gave up on some devices
+        deadline = time.monotonic() + CONNECT_WAIT
+        while logger.packet_writer is None or len(logger.packet_writer.devices) < len(sensors):
+            if task.done() or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(seconds)
+        stop_event.set()
+        await task
+    finally:
+        simulator.uninstall()
+        logger.DEVICES = saved_devices
+
+    metrics = logger.metrics_snapshot() or {"devices": {}}
+    per_packet = max(samples_per_packet, 1)
+    summary = {}
+    for sensor in sensors:
+        device = metrics["devices"].get(sensor.name, {})
+        summary[sensor.name] = {
+            "sent_samples": sensor.sent * per_packet,
+            "written_samples": device.get("written", 0),
+            "link_lost_packets": sensor.lost,
+            "logger": device
+        }
+    return {"session": logger.session_dir, "rate": rate * speed, "devices": summary}
+
+
+def print_summary(result):
+    print(f"[+] {len(result['devices'])} devices at {result['rate']:g} Hz, session in {result['session']}")
+    for name, device in result["devices"].items():
+        stats = device["logger"]
+        behind = device["sent_samples"] - device["written_samples"]
+        print(f"    {name:14} sent {device['sent_samples']:8}  written {device['written_samples']:8}  "
+              f"missing {behind:6}  dropped {stats.get('dropped', 0):5}  lost {stats.get('lost', 0):5}  "
+              f"latency max {stats.get('latency_max_ms', 0):7.1f} ms  buffer high-water {stats.get('high_water', 0)}")
+
+
+if __name__ == "__main__":
+    # python code/sim_ble.py --seconds 30
+    # python code/sim_ble.py --devices 8 --rate 200 --samples-per-packet 4 --jitter 5 --loss 0.01
+    # python code/sim_ble.py --source data --speed 4
+    parser = argparse.ArgumentParser(description="Load-test the logger with simulated BLE sensors.")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=100, help="sample rate per device in Hz")
+    parser.add_argument("--speed", type=float, default=1, help="replay speed, multiplies the rate")
+    parser.add_argument("--seconds", type=float, default=10, help="recording length")
+    parser.add_argument("--samples-per-packet", type=int, default=0, help="0 for legacy 36-byte packets")
+    parser.add_argument("--jitter", type=float, default=0, help="mean notification delay jitter in ms")
+    parser.add_argument("--loss", type=float, default=0, help="fraction of packets lost on the link")
+    parser.add_argument("--disconnect-after", type=float, help="drop every connection after this many seconds")
+    parser.add_argument("--source", help="session folder to replay instead of synthetic data")
+    parser.add_argument("--binary", action="store_true")
+    parser.add_argument("--root", help="folder for the recorded session (default: a temporary folder)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    result = asyncio.run(load_test(
+        args.devices, args.rate, args.speed, args.seconds, args.samples_per_packet, args.jitter,
+        args.loss, args.disconnect_after, args.source, args.binary, args.root, args.seed,
+    ))
+    print_summary(result)
@@ -1,128 +1,184 @@
-import os
-
-import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-
 
-def calculate_movement_smoothness(file_path, stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0,
-                                  max_expected_jerk=1000.0):
-    """
-    Calculates a smoothness score by analyzing jerk during movement periods.
+from session import load_session
+from windowing import rolling_std
 
-    stillness_accel_threshold, stillness_gyro_thresholdL: these are crucial parameters. They define how much "noise" (small variations) we allow in the sensor readings before we consider a limb to be truly "moving." If the sensor readings change less than these thresholds, we assume the limb is still.
 
-    max_expected_jerk: this parameter helps us normalize our final smoothness score. It represents the maximum jerk we'd expect to see in a very jerky movement.
+def movement_stats(limb, window_size=10):
     """
-    try:
-        df = pd.read_csv(file_path, index_col='timestamp')
-        df.index = pd.to_datetime(df.index, format='mixed')
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return 0.0, None, []
+    Everything calculate_movement_smoothness needs that does not depend on its thresholds:
+    rolling stds of the acc and gyro magnitudes and every sample's jerk. calibrate.py
+    computes them once per limb and tries many thresholds on them.
+    """
+    n = len(limb)
+    acc_mag = limb.acc_magnitude()
+    gyro_mag = limb.gyro_magnitude()
+    acc_mag_std = rolling_std(acc_mag, window_size)
+    gyro_mag_std = rolling_std(gyro_mag, window_size)
+
+    # Each sample's jerk is its magnitude change over the time since the previous distinct
+    # timestamp; samples whose interval is <= 10 ms are left out.
+    ts = limb.timestamps
+    first = np.searchsorted(ts, ts, side='left')
+    dt = np.zeros(n)
+    dt[1:] = np.diff(ts) / 1e9
+    step_dt = dt[first]
+    valid = step_dt > 0.01
+
+    acc_jerk = np.zeros(n + 1)
+    gyro_jerk = np.zeros(n + 1)
+    acc_jerk[1:n] = np.where(valid[1:], np.abs(np.diff(acc_mag)) / np.where(valid[1:], step_dt[1:], 1.0), 0.0)
+    gyro_jerk[1:n] = np.where(valid[1:], np.abs(np.diff(gyro_mag)) / np.where(valid[1:], step_dt[1:], 1.0), 0.0)
+    counts = np.zeros(n + 1)
+    counts[:n] = valid
+    return {"acc_mag_std": acc_mag_std, "gyro_mag_std": gyro_mag_std, "first": first,
+            "acc_jerk": acc_jerk, "gyro_jerk": gyro_jerk, "counts": counts}
+
+
+def moving_samples(stats, stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0):
+    # when the limb is MOVING ---
+    return ~((stats["acc_mag_std"] < stillness_accel_threshold) & (stats["gyro_mag_std"] < stillness_gyro_threshold))
 
-    if df.empty:
-        return 0.0, None, []
 
-    # 1: Detect Movement vs. Stillness
-    # calculate the magnitude
-    df['acc_mag'] = np.sqrt(df['accX'] ** 2 + df['accY'] ** 2 + df['accZ'] ** 2)
-    df['gyro_mag'] = np.sqrt(df['gyroX'] ** 2 + df['gyroY'] ** 2 + df['gyroZ'] ** 2)
+def movement_jerks(ts, is_moving, stats):
+    """
+    The movement periods of is_moving and their clipped jerk scores. stats holds first,
+    acc_jerk, gyro_jerk and counts as movement_stats returns them for the samples of ts.
+    Returns (starts, ends, jerk_scores): sample indices of each movement's first moving and
+    first still sample, and the scores of the movements that have a jerk.
+    """
+    n = len(ts)
+
+    # a movement runs from its first moving sample to the first still sample after it
+    change = np.diff(is_moving.astype(np.int8))
+    starts = np.flatnonzero(change == 1) + 1
+    ends = np.flatnonzero(change == -1) + 1
+    if is_moving[0]:
+        starts = np.insert(starts, 0, 0)
+    if is_moving[-1]:
+        ends = np.append(ends, n - 1)
+    min_len = min(len(starts), len(ends))
+    starts = starts[:min_len]
+    ends = ends[:min_len]
+
+    if min_len == 0:
+        return starts, ends, np.zeros(0)
+
+    # Segments are selected by timestamp, so a repeated timestamp at either edge pulls in
+    # all of its samples.
+    seg_start = stats["first"][starts]
+    seg_end = np.searchsorted(ts, ts[ends], side='right')
+    # the first sample of a segment has no previous sample inside it
+    jerk_from = np.searchsorted(ts, ts[seg_start], side='right')
+
+    # one reduceat over [jerk_from, seg_end) boundaries, every other slot is a segment
+    bounds = np.empty(2 * len(jerk_from), dtype=np.int64)
+    bounds[0::2] = jerk_from
+    bounds[1::2] = seg_end
+    bounds = np.minimum(bounds, n)
+    acc_sum = np.add.reduceat(stats["acc_jerk"], bounds)[0::2]
+    gyro_sum = np.add.reduceat(stats["gyro_jerk"], bounds)[0::2]
+    count = np.add.reduceat(stats["counts"], bounds)[0::2]
+
+    has_jerk = (seg_end - seg_start >= 2) & (jerk_from < seg_end) & (count > 0)
+    acc_sum = np.where(jerk_from < seg_end, acc_sum, 0.0)
+    gyro_sum = np.where(jerk_from < seg_end, gyro_sum, 0.0)
+    jerk_scores = ((acc_sum[has_jerk] / count[has_jerk]) + (gyro_sum[has_jerk] / count[has_jerk])) / 2
+    return starts, ends, np.clip(jerk_scores, 0, 1000)
+
+
+def median_movement_jerk(limb, stats, stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0):
+    """
+    Median jerk of the limb's movement periods under the given stillness thresholds, with
+    stats from movement_stats. Returns (median_jerk, movements); median_jerk is None when
+    no movement has a jerk.
+    """
+    ts = limb.timestamps
+    is_moving = moving_samples(stats, stillness_accel_threshold, stillness_gyro_threshold)
+    starts, ends, jerk_scores = movement_jerks(ts, is_moving, stats)
+    movements = list(zip(ts[starts].tolist(), ts[ends].tolist()))
+    if not movements or len(jerk_scores) == 0:
+        return None, movements
+    return np.median(jerk_scores), movements
 
-    window_size = 10
-    df['acc_mag_std'] = df['acc_mag'].rolling(window=window_size, min_periods=1).std()
-    df['gyro_mag_std'] = df['gyro_mag'].rolling(window=window_size, min_periods=1).std()
 
-    df['is_still'] = (df['acc_mag_std'] < stillness_accel_threshold) & \
-                     (df['gyro_mag_std'] < stillness_gyro_threshold)
+def calculate_movement_smoothness(limb, stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0,
+                                  max_expected_jerk=1000.0):
+    """
+    Calculates a smoothness score by analyzing jerk during movement periods.
 
-    # when the limb is MOVING ---
-    df['is_moving'] = ~df['is_still']
+    stillness_accel_threshold, stillness_gyro_thresholdL: these are crucial parameters. They define how much "noise" (small variations) we allow in the sensor readings before we consider a limb to be truly "moving." If the sensor readings change less than these thresholds, we assume the limb is still.
 
-    # 2: Identify Movement Periods ---
-    df['movement_change'] = df['is_moving'].astype(int).diff()
-    starts = df.index[df['movement_change'] == 1]
-    ends = df.index[df['movement_change'] == -1]
+    max_expected_jerk: this parameter helps us normalize our final smoothness score. It represents the maximum jerk we'd expect to see in a very jerky movement.
 
-    if df['is_moving'].iloc[0]:
-        starts = starts.insert(0, df.index[0])
-    if df['is_moving'].iloc[-1]:
-        ends = ends.append(pd.Index([df.index[-1]]))
+    Returns (score, limb, movements), movements being (start, end) epoch-ns timestamp pairs.
+    """
+    n = len(limb)
+    if n == 0:
+        return 0.0, None, []
 
-    movements = []
-    min_len = min(len(starts), len(ends))
-    for i in range(min_len):
-        movements.append((starts[i], ends[i]))
+    # 1: Detect Movement vs. Stillness, 2: Identify Movement Periods, 3: their jerk
+    stats = movement_stats(limb)
+    average_jerk, movements = median_movement_jerk(limb, stats, stillness_accel_threshold, stillness_gyro_threshold)
 
     if not movements:
         print("Warning: No movement periods detected!")
         # If there's no movement, the movement is perfectly smooth.
-        return 100.0, df, []
-
-    # 3: Calculate Smoothness Score from Jerk ---
-    jerk_scores = []
-    for start, end in movements:
-        move_df = df.loc[start:end].copy()
-        if len(move_df) < 2:
-            continue
-
-        # Calculate time differences for this specific movement block
-        dt = move_df.index.to_series().diff().dt.total_seconds().dropna()
-        dt = dt[dt > 0.01]
-        if dt.empty:
-            continue
-
-        # Calculate jerk for both accelerometer and gyroscope magnitudes
-        acc_jerk = move_df['acc_mag'].diff().dropna() / dt
-        gyro_jerk = move_df['gyro_mag'].diff().dropna() / dt
+        return 100.0, limb, []
 
-        # Combine the absolute jerk values
-        total_jerk = (np.abs(acc_jerk).mean() + np.abs(gyro_jerk).mean()) / 2
-
-        if not pd.isna(total_jerk):
-            jerk_scores.append(total_jerk)
-
-    if not jerk_scores:
+    if average_jerk is None:
         print("Warning: No valid jerk scores calculated!")
-        return 100.0, df, []
+        return 100.0, limb, []
 
     # Lower average jerk is better (smoother)
-    average_jerk = np.median(np.clip(jerk_scores, 0, 1000))
-    
     # Normalize the score.
     smoothness_score = 1 - (average_jerk / max_expected_jerk)
     final_score = max(0.0, min(1.0, smoothness_score)) * 100
 
-    return final_score, df, movements
+    return final_score, limb, movements
+
+LIMB_NAMES = {
+    'Right Arm': 'right_arm',
+    'Left Arm': 'left_arm',
+    'Left Leg': 'left_leg',
+    'Right Leg': 'right_leg'
+}
+
+
+def get_limb_smoothness(session, part, stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0,
+                        max_expected_jerk=1000.0):
+    # one limb's score, or None when the limb is missing or could not be processed
+    session = load_session(session)
+    if part not in session:
+        return None
+    raw_score, processed_limb, detected_movements = calculate_movement_smoothness(
+        session[part], stillness_accel_threshold, stillness_gyro_threshold, max_expected_jerk)
+    if processed_limb is None:
+        return None
+    return raw_score
 
-def get_smoothness_score(folder="data"):
-    limb_files = {
-        'Right Arm': os.path.join(folder, 'right_arm.csv'),
-        'Left Arm': os.path.join(folder, 'left_arm.csv'),
-        'Left Leg': os.path.join(folder, 'left_leg.csv'),
-        'Right Leg': os.path.join(folder, 'right_leg.csv')
-    }
+
+def average_smoothness(limb_scores):
+    # None when no limb has a score, the session has no smoothness rather than 0
+    scores = [score for score in limb_scores if score is not None]
+    if scores:
+        return sum(scores) / len(scores)
+    return None
+
+
+def get_smoothness_score(session="data", stillness_accel_threshold=0.8, stillness_gyro_threshold=8.0,
+                         max_expected_jerk=1000.0):
+    session = load_session(session)
 
     limb_scores = {}
     output_directory = "climber_smoothness_results"
 
-    for limb, file in limb_files.items():
-        # print(f"\n--- Processing {limb} data from {file} ---")
-        raw_score, processed_df, detected_movements = calculate_movement_smoothness(file)
-
-        if processed_df is not None:
-            final_score = raw_score
-            limb_scores[limb] = final_score
-        else:
+    for limb, part in LIMB_NAMES.items():
+        # print(f"\n--- Processing {limb} data from {part} ---")
+        limb_scores[limb] = get_limb_smoothness(session, part, stillness_accel_threshold,
+                                                stillness_gyro_threshold, max_expected_jerk)
+        if limb_scores[limb] is None:
             print(f"Skipping visualization for {limb} due to data processing error.")
 
     # print("\n-- Overall Smoothness Results --")
-    if limb_scores:
-        overall_score = sum(limb_scores.values()) / len(limb_scores)
-        # print(f"Overall Average Smoothness Score (All Limbs): {overall_score:.1f}/100")
-        return overall_score
-    else:
-        # print("No valid data found for smoothness score.")
-        return 0.0
\ No newline at end of file
+    return average_smoothness(limb_scores.values())
@@ -1,72 +1,71 @@
-import pandas as pd
 import numpy as np
-import os
-
-def estimate_sample_rate(timestamps):
-    if len(timestamps) < 2:
-        return 1
-    intervals = [(t2 - t1).total_seconds() for t1, t2 in zip(timestamps[:-1], timestamps[1:])]
-    avg_interval = np.mean(intervals)
-    return 1 / avg_interval if avg_interval > 0 else 1
+from collections import defaultdict
+
+from resample import estimate_sample_rate
+from session import load_session
+from windowing import long_runs, segment_breaks, window_view
+
+def still_window_mask(acc_windows, gyro_windows, stillness_tol_acc=1, stillness_tol_gyro=50):
+    # windows quiet enough to belong to a hold
+    accel_magnitude = np.linalg.norm(acc_windows, axis=2)
+    gyro_magnitude = np.linalg.norm(gyro_windows, axis=2)
+    return (np.mean(np.abs(accel_magnitude - 1.0), axis=1) < stillness_tol_acc) & \
+           (np.mean(np.abs(gyro_magnitude - 1.0), axis=1) < stillness_tol_gyro)
+
+def stable_window_mask(acc_windows, gyro_windows, accel_thresh=0.12, gyro_thresh=30):
+    # windows whose every acc and gyro axis stays within the stability thresholds
+    accel_std = np.std(acc_windows, axis=1)
+    gyro_std = np.std(gyro_windows, axis=1)
+    return np.all(accel_std < accel_thresh, axis=1) & np.all(gyro_std < gyro_thresh, axis=1)
+
+def compute_hold_stability_batch(limbs, window_size=0.25, accel_thresh=0.12, gyro_thresh=30,
+                                 stillness_tol_acc=1, stillness_tol_gyro=50, min_consec_windows=3):
+    """
+    Hold stability for several limbs at once.
+
+    limbs: name -> (accel_data, gyro_data, sample_rate). Returns name -> (stability_score,
+    stability_segments), the same values compute_hold_stability gives for each limb alone.
+    Limbs with the same window length are stacked into one (windows, window_len, 3) array,
+    so window means, stds and the still-run detection are single array operations.
+    """
+    groups = defaultdict(list)
+    for name, (accel_data, gyro_data, sample_rate) in limbs.items():
+        groups[max(1, int(window_size * sample_rate))].append(name)
+
+    results = {}
+    for window_len, names in groups.items():
+        acc_windows = []
+        gyro_windows = []
+        limb_ids = []
+        for k, name in enumerate(names):
+            accel_data, gyro_data, _ = limbs[name]
+            acc_windows.append(window_view(np.asarray(accel_data, dtype=np.float64), window_len))
+            gyro_windows.append(window_view(np.asarray(gyro_data, dtype=np.float64), window_len))
+            limb_ids.append(np.full(len(acc_windows[-1]), k))
+        acc_windows = np.concatenate(acc_windows)
+        gyro_windows = np.concatenate(gyro_windows)
+        limb_ids = np.concatenate(limb_ids)
+
+        is_still = still_window_mask(acc_windows, gyro_windows, stillness_tol_acc, stillness_tol_gyro)
+        hold = long_runs(is_still, min_consec_windows, segment_breaks(limb_ids))
+        stable = stable_window_mask(acc_windows[hold], gyro_windows[hold], accel_thresh, gyro_thresh)
+
+        hold_limbs = limb_ids[hold]
+        for k, name in enumerate(names):
+            segments = stable[hold_limbs == k]
+            analyzed_windows = len(segments)
+            stable_windows = int(np.count_nonzero(segments))
+            stability_score = stable_windows / analyzed_windows if analyzed_windows > 0 else 0
+            results[name] = (stability_score, segments.tolist())
+
+    return results
 
 def compute_hold_stability(accel_data, gyro_data, sample_rate):
-    window_size = 0.25
-    accel_thresh = 0.12
-    gyro_thresh = 30
-    stillness_tol_acc = 1
-    stillness_tol_gyro = 50
-    min_consec_windows = 3
-
-    window_len = max(1, int(window_size * sample_rate))
-    num_windows = len(accel_data) // window_len
-    accel_magnitude = np.linalg.norm(accel_data, axis=1)
-    gyro_magnitude = np.linalg.norm(gyro_data, axis=1)
-
-    is_still = []
-    for i in range(num_windows):
-        start = i * window_len
-        end = start + window_len
-        acc_mag_window = accel_magnitude[start:end]
-        gyro_mag_window = gyro_magnitude[start:end]
-        still = np.mean(np.abs(acc_mag_window - 1.0)) < stillness_tol_acc and \
-                np.mean(np.abs(gyro_mag_window - 1.0)) < stillness_tol_gyro
-        is_still.append(still)
-
-    hold_indices = []
-    i = 0
-    while i <= len(is_still) - min_consec_windows:
-        if all(is_still[i:i + min_consec_windows]):
-            hold_indices.extend(range(i, i + min_consec_windows))
-            i += 1
-        else:
-            i += 1
-    hold_indices = sorted(set(hold_indices))
-
-    stable_windows = 0
-    analyzed_windows = 0
-    stability_segments = []
-
-    for i in hold_indices:
-        start = i * window_len
-        end = start + window_len
-        accel_window = accel_data[start:end]
-        gyro_window = gyro_data[start:end]
-
-        accel_std = np.std(accel_window, axis=0)
-        gyro_std = np.std(gyro_window, axis=0)
-
-        if np.all(accel_std < accel_thresh) and np.all(gyro_std < gyro_thresh):
-            stable_windows += 1
-            stability_segments.append(True)
-        else:
-            stability_segments.append(False)
-
-        analyzed_windows += 1
-
-    stability_score = stable_windows / analyzed_windows if analyzed_windows > 0 else 0
-    return stability_score, stability_segments
-
-def get_stability(folder):
+    return compute_hold_stability_batch({"limb": (accel_data, gyro_data, sample_rate)})["limb"]
+
+def get_stability(session, accel_thresh=0.12, gyro_thresh=30, stillness_tol_acc=1, stillness_tol_gyro=50,
+                  min_consec_windows=3):
+    session = load_session(session)
     overall_scores = {}
     limb_map = {
         "left_leg": "Left Leg",
@@ -75,31 +74,44 @@ def get_stability(folder):
         "right_arm": "Right Arm"
     }
 
+    limbs = {}
     for limb_file, limb_name in limb_map.items():
-        path = os.path.join(folder, f"{limb_file}.csv")
+        limb = session.get(limb_file)
+        if limb is None:
+            print(f"\nFile not found for {limb_name}: {limb_file}.csv")
+            continue
         try:
-            df = pd.read_csv(path)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-            acc_data = df[['accX', 'accY', 'accZ']].to_numpy()
-            gyro_data = df[['gyroX', 'gyroY', 'gyroZ']].to_numpy()
-            timestamps = df['timestamp'].to_list()
-
-            sample_rate = estimate_sample_rate(timestamps)
-            stability_score, segments = compute_hold_stability(acc_data, gyro_data, sample_rate)
-
-            # print(f"\n--- {limb_name} ---")
-            # print(f"Estimated sample rate: {sample_rate:.2f} Hz")
-            # print(f"Stability Score (Still Segments): {stability_score * 100:.1f}%")
-            # print(f"Stable Windows: {segments}")
-
-            overall_scores[limb_name] = stability_score
-
-        except FileNotFoundError:
-            print(f"\nFile not found for {limb_name}: {path}")
+            acc_data = limb.acc.astype(np.float64)
+            gyro_data = limb.gyro.astype(np.float64)
+            sample_rate = estimate_sample_rate(limb.timestamps)
+            limbs[limb_name] = (acc_data, gyro_data, sample_rate)
         except Exception as e:
             print(f"\nError processing {limb_name}: {e}")
 
+    thresholds = {"accel_thresh": accel_thresh, "gyro_thresh": gyro_thresh, "stillness_tol_acc": stillness_tol_acc,
+                  "stillness_tol_gyro": stillness_tol_gyro, "min_consec_windows": min_consec_windows}
+    try:
+        results = compute_hold_stability_batch(limbs, **thresholds)
+    except Exception:
+        # find the limb that failed, the others still count
+        results = {}
+        for limb_name, data in limbs.items():
+            try:
+                results.update(compute_hold_stability_batch({limb_name: data}, **thresholds))
+            except Exception as e:
+                print(f"\nError processing {limb_name}: {e}")
+
+    for limb_name in limbs:
+        if limb_name not in results:
+            continue
+        stability_score, segments = results[limb_name]
+
+        # print(f"\n--- {limb_name} ---")
+        # print(f"Stability Score (Still Segments): {stability_score * 100:.1f}%")
+        # print(f"Stable Windows: {segments}")
+
+        overall_scores[limb_name] = stability_score
+
     if overall_scores:
         avg_score = np.mean(list(overall_scores.values()))
         # print(f"\nAverage Stability Score Across All Limbs: {avg_score * 100:.1f}%")
@@ -0,0 +1,489 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from arm_leg_usage import usage_summary
+from binary_format import format_timestamp
+from calibrate import DEFAULTS as THRESHOLDS
+from fall_rhythm import PARTS as FALL_PARTS, analyze_rhythm, debounce, find_synced_events
+from grip_count import ARMS, grip_still_mask
+from resample import GAP_FACTOR
+from scoring import DEFAULTED, DEFAULTS, score_all
+from session import PARTS, LimbData, Session, find_limb_file, iter_limb_chunks
+from smoothness import LIMB_NAMES, average_smoothness, movement_jerks, moving_samples
+from stability import stable_window_mask, still_window_mask
+from windowing import rolling_std, run_lengths, window_view
+
+CHUNK_SAMPLES = 1 << 16    # rows per chunk read from a limb file
+WINDOW_SEC = 0.25          # stability and grip windows, as in their metrics
+SMOOTH_WINDOW = 10         # smoothness rolling std window, as in movement_stats
+RHYTHM_THRESHOLD = 2.5     # get_rhythm's movement threshold and pause
+RHYTHM_MIN_PAUSE_NS = 500_000_000
+STABILITY_LIMBS = ["left_leg", "right_leg", "left_arm", "right_arm"]   # get_stability's averaging order
+
+# interval histogram of IntervalStats: 16.4 us buckets up to 4.3 s, longer intervals share the last one
+BUCKET_SHIFT = 14
+BUCKETS = 1 << 18
+
+
+class IntervalStats:
+    """
+    resample.estimate_sample_rate of timestamps that arrive in chunks, in memory that does
+    not depend on their number. The median interval and the intervals below the gap
+    threshold are needed exactly: a first pass (add) histograms the intervals, a second
+    (add_exact, after plan) keeps the exact intervals of the few buckets the median and
+    the threshold can fall in. Assumes the timestamps never step back, see monotonic.
+    """
+
+    def __init__(self, gap_factor=GAP_FACTOR):
+        self.gap_factor = gap_factor
+        self.counts = np.zeros(BUCKETS, dtype=np.int64)
+        self.sums = np.zeros(BUCKETS)        # integer ns, exact below 2 ** 53 (104 days)
+        self.zeros = 0
+        self.monotonic = True
+        self.last = None
+        self.wanted = None
+        self.exact = {}                      # interval -> count, in the wanted buckets
+
+    def intervals(self, ts):
+        ts = np.asarray(ts, dtype=np.int64)
+        dt = np.diff(ts, prepend=ts[:1] if self.last is None else [self.last])
+        if self.last is None:
+            dt = dt[1:]
+        self.last = ts[-1]
+        return dt
+
+    def add(self, ts):
+        dt = self.intervals(ts)
+        if np.any(dt < 0):
+            self.monotonic = False
+        self.zeros += int(np.count_nonzero(dt == 0))
+        positive = dt[dt > 0]
+        buckets = np.minimum(positive >> BUCKET_SHIFT, BUCKETS - 1)
+        self.counts += np.bincount(buckets, minlength=BUCKETS)
+        self.sums += np.bincount(buckets, weights=positive, minlength=BUCKETS)
+
+    def plan(self):
+        # buckets of the two middle intervals and of every gap threshold between them
+        self.last = None
+        total = int(self.counts.sum())
+        if total == 0:
+            self.wanted = np.zeros(0, dtype=np.int64)
+            return
+        cumulative = np.cumsum(self.counts)
+        low, high = np.searchsorted(cumulative, [(total - 1) // 2, total // 2], side='right')
+        first = int(self.gap_factor * (int(low) << BUCKET_SHIFT)) >> BUCKET_SHIFT
+        last = int(self.gap_factor * ((int(high) + 1) << BUCKET_SHIFT)) >> BUCKET_SHIFT
+        wanted = np.concatenate(([low, high], np.arange(first, last + 2)))
+        self.wanted = np.unique(np.minimum(wanted, BUCKETS - 1))
+
+    def add_exact(self, ts):
+        dt = self.intervals(ts)
+        positive = dt[dt > 0]
+        keep = np.isin(np.minimum(positive >> BUCKET_SHIFT, BUCKETS - 1), self.wanted)
+        values, counts = np.unique(positive[keep], return_counts=True)
+        for value, count in zip(values.tolist(), counts.tolist()):
+            self.exact[value] = self.exact.get(value, 0) + count
+
+    def exact_bucket(self, bucket):
+        # sorted intervals and their counts in one of the wanted buckets
+        values = sorted(v for v in self.exact if min(v >> BUCKET_SHIFT, BUCKETS - 1) == bucket)
+        return np.array(values, dtype=np.int64), np.array([self.exact[v] for v in values], dtype=np.int64)
+
+    def order_statistic(self, k):
+        cumulative = np.cumsum(self.counts)
+        bucket = int(np.searchsorted(cumulative, k, side='right'))
+        rank = k - (int(cumulative[bucket - 1]) if bucket else 0)
+        values, counts = self.exact_bucket(bucket)
+        return values[np.searchsorted(np.cumsum(counts), rank, side='right')]
+
+    def sample_rate(self):
+        total = int(self.counts.sum())
+        if total == 0:
+            return 1
+        # np.median of the distinct-timestamp intervals, as typical_interval takes it
+        typical = float(np.median(np.array([self.order_statistic((total - 1) // 2),
+                                            self.order_statistic(total // 2)])))
+        threshold = self.gap_factor * typical
+
+        bucket = min(int(threshold) >> BUCKET_SHIFT, BUCKETS - 1)
+        values, counts = self.exact_bucket(bucket)
+        below = values <= threshold
+        recorded = self.zeros + int(self.counts[:bucket].sum()) + int(counts[below].sum())
+        duration = np.int64(int(self.sums[:bucket].sum()) + int((values[below] * counts[below]).sum()))
+        return recorded / duration * 1e9 if duration > 0 else 1
+
+
+class SmoothnessStream:
+    """
+    smoothness.calculate_movement_smoothness over chunks. The rolling stds carry the last
+    SMOOTH_WINDOW - 1 magnitudes over, each sample's jerk the sample before it, and the
+    samples from the last still sample on a new timestamp on stay buffered until the next
+    one closes them. Inside an open movement only the jerk sums grow (see compact), so
+    memory stays the same however long a limb keeps moving.
+    """
+
+    def __init__(self, stillness_accel_threshold, stillness_gyro_threshold, max_expected_jerk):
+        self.thresholds = (stillness_accel_threshold, stillness_gyro_threshold)
+        self.max_expected_jerk = max_expected_jerk
+        self.samples = 0
+        self.acc_history = np.zeros(0)
+        self.gyro_history = np.zeros(0)
+        self.previous = None      # (timestamp, acc_mag, gyro_mag, step_dt) of the last sample
+        self.buffer = None        # per-sample arrays of the open tail
+        self.movements = 0
+        self.jerk_scores = []
+
+    def update(self, ts, acc_mag, gyro_mag):
+        n = len(ts)
+        stats = {"acc_mag_std": rolling_std(acc_mag, SMOOTH_WINDOW, self.acc_history),
+                 "gyro_mag_std": rolling_std(gyro_mag, SMOOTH_WINDOW, self.gyro_history)}
+        self.acc_history = np.concatenate((self.acc_history, acc_mag))[-(SMOOTH_WINDOW - 1):]
+        self.gyro_history = np.concatenate((self.gyro_history, gyro_mag))[-(SMOOTH_WINDOW - 1):]
+        moving = moving_samples(stats, *self.thresholds)
+
+        # jerk over the time since the previous distinct timestamp, as in movement_stats
+        if self.previous is None:
+            self.previous = (ts[0], acc_mag[0], gyro_mag[0], 0.0)
+        prev_ts, prev_acc, prev_gyro, prev_step = self.previous
+        ts_ext = np.concatenate(([prev_ts], ts))
+        dt = np.diff(ts_ext) / 1e9
+        run_start = np.maximum.accumulate(np.where(ts_ext[1:] != ts_ext[:-1], np.arange(n), -1))
+        step_dt = np.where(run_start >= 0, dt[np.maximum(run_start, 0)], prev_step)
+        valid = step_dt > 0.01
+        divisor = np.where(valid, step_dt, 1.0)
+        acc_jerk = np.where(valid, np.abs(np.diff(np.concatenate(([prev_acc], acc_mag)))) / divisor, 0.0)
+        gyro_jerk = np.where(valid, np.abs(np.diff(np.concatenate(([prev_gyro], gyro_mag)))) / divisor, 0.0)
+        self.previous = (ts[-1], acc_mag[-1], gyro_mag[-1], step_dt[-1])
+        self.samples += n
+
+        chunk = {"ts": ts, "moving": moving, "acc_jerk": acc_jerk, "gyro_jerk": gyro_jerk,
+                 "counts": valid.astype(np.float64)}
+        if self.buffer is not None:
+            chunk = {name: np.concatenate((self.buffer[name], values)) for name, values in chunk.items()}
+
+        # everything before the last still sample that is followed by a new timestamp is final
+        ts, moving = chunk["ts"], chunk["moving"]
+        cuts = np.flatnonzero(~moving[:-1] & (ts[1:] != ts[:-1])) + 1
+        if len(cuts):
+            self.close(chunk, cuts[-1])
+            chunk = {name: values[cuts[-1]:] for name, values in chunk.items()}
+        self.buffer = self.compact(chunk)
+
+    @staticmethod
+    def compact(tail):
+        """
+        movement_jerks only sums the jerks and counts of the samples inside a movement, past
+        its first timestamp and up to its last. A run of whole timestamp groups of moving
+        samples that follows a moving sample and is followed by another timestamp is such
+        an inside, so each run is merged into one moving sample on its last timestamp that
+        holds the run's sums. The tail's movements and their scores stay the same.
+        """
+        ts, moving = tail["ts"], tail["moving"]
+        n = len(ts)
+        if n < 3:
+            return tail
+        new_group = np.concatenate(([True], ts[1:] != ts[:-1]))
+        group = np.cumsum(new_group) - 1
+        group_starts = np.flatnonzero(new_group)
+        all_moving = np.logical_and.reduceat(moving, group_starts)
+        group_last = np.append(group_starts[1:], n) - 1
+        inside = np.zeros(len(group_starts), dtype=bool)
+        inside[1:-1] = all_moving[1:-1] & moving[group_last[:-2]]
+        merge = inside[group]
+        if np.count_nonzero(merge[1:] & merge[:-1]) == 0:
+            return tail
+
+        # every sample starts a new slot except one continuing a run being merged
+        slot = np.cumsum(~np.concatenate(([False], merge[1:] & merge[:-1]))) - 1
+        last = np.flatnonzero(np.append(slot[1:] != slot[:-1], True))
+        compacted = {"ts": ts[last], "moving": moving[last]}
+        for name in ("acc_jerk", "gyro_jerk", "counts"):
+            compacted[name] = np.bincount(slot, weights=tail[name])
+        return compacted
+
+    def close(self, chunk, end):
+        ts = chunk["ts"][:end]
+        stats = {"first": np.searchsorted(ts, ts, side='left')}
+        for name in ("acc_jerk", "gyro_jerk", "counts"):
+            stats[name] = np.append(chunk[name][:end], 0.0)
+        starts, ends, jerk_scores = movement_jerks(ts, chunk["moving"][:end], stats)
+        self.movements += len(starts)
+        self.jerk_scores.append(jerk_scores)
+
+    def score(self):
+        # the limb's calculate_movement_smoothness score, None without samples
+        if self.samples == 0:
+            return None
+        if self.buffer is not None and len(self.buffer["ts"]):
+            self.close(self.buffer, len(self.buffer["ts"]))
+            self.buffer = None
+        jerk_scores = np.concatenate(self.jerk_scores) if self.jerk_scores else np.zeros(0)
+        if self.movements == 0 or len(jerk_scores) == 0:
+            return 100.0
+        smoothness_score = 1 - (np.median(jerk_scores) / self.max_expected_jerk)
+        return max(0.0, min(1.0, smoothness_score)) * 100
+
+
+class WindowStream:
+    """
+    Hold stability and grips over consecutive windows of window_len samples, fed in
+    chunks. Samples short of a whole window wait for the next chunk; a run of still
+    windows that reaches the end of a chunk stays open until one that is not still.
+    """
+
+    def __init__(self, window_len, stability, grips):
+        self.window_len = window_len
+        self.stability = stability
+        self.grips = grips
+        self.pending_ts = np.zeros(0, dtype=np.int64)
+        self.pending_values = np.zeros((0, 9), dtype=np.float32)
+        self.hold_run = (0, 0)           # open run of hold-still windows: (windows, stable windows)
+        self.stable_windows = 0
+        self.analyzed_windows = 0
+        self.grip_run = (0, None, None)  # open run of grip-still windows: (windows, start ns, end ns)
+        self.grip_events = []
+
+    def update(self, ts, values):
+        ts = np.concatenate((self.pending_ts, ts))
+        values = np.concatenate((self.pending_values, values))
+        used = len(ts) // self.window_len * self.window_len
+        self.pending_ts, self.pending_values = ts[used:], values[used:]
+        if used == 0:
+            return
+        limb = LimbData(ts[:used], values[:used])
+
+        # stability, with the same window arrays get_stability builds
+        acc_windows = window_view(limb.acc.astype(np.float64), self.window_len)
+        gyro_windows = window_view(limb.gyro.astype(np.float64), self.window_len)
+        is_still = still_window_mask(acc_windows, gyro_windows, self.stability["stillness_tol_acc"],
+                                     self.stability["stillness_tol_gyro"])
+        stable = stable_window_mask(acc_windows, gyro_windows, self.stability["accel_thresh"],
+                                    self.stability["gyro_thresh"])
+        stable_before = np.concatenate(([0], np.cumsum(stable)))
+        starts, lengths, still = run_lengths(is_still)
+        for start, length, run_still in zip(starts.tolist(), lengths.tolist(), still.tolist()):
+            if run_still:
+                windows, stable_count = self.hold_run
+                self.hold_run = (windows + length, stable_count + int(stable_before[start + length] - stable_before[start]))
+            else:
+                self.close_hold()
+        # the last run stays open unless it was not still
+
+        if self.grips is None:
+            return
+        # grips, with the magnitude windows detect_grips builds
+        is_still = grip_still_mask(window_view(limb.acc_magnitude(), self.window_len),
+                                   window_view(limb.gyro_magnitude(), self.window_len),
+                                   self.grips["stillness_tol_acc"], self.grips["stillness_tol_gyro"])
+        starts, lengths, still = run_lengths(is_still)
+        times = limb.timestamps
+        for start, length, run_still in zip(starts.tolist(), lengths.tolist(), still.tolist()):
+            if run_still:
+                windows, first, _ = self.grip_run
+                if windows == 0:
+                    first = int(times[start * self.window_len])
+                self.grip_run = (windows + length, first, int(times[(start + length) * self.window_len - 1]))
+            else:
+                self.close_grip()
+
+    def close_hold(self):
+        windows, stable_count = self.hold_run
+        if windows >= self.stability["min_consec_windows"]:
+            self.analyzed_windows += windows
+            self.stable_windows += stable_count
+        self.hold_run = (0, 0)
+
+    def close_grip(self):
+        windows, t0, t1 = self.grip_run
+        if windows >= self.grips["min_consec_windows"]:
+            self.grip_events.append({"start": format_timestamp(t0), "end": format_timestamp(t1),
+                                     "duration": (t1 - t0) / 1e9})
+        self.grip_run = (0, None, None)
+
+    def finish(self):
+        self.close_hold()
+        if self.grips is not None:
+            self.close_grip()
+
+    def stability_score(self):
+        return self.stable_windows / self.analyzed_windows if self.analyzed_windows > 0 else 0
+
+
+class LimbStream:
+    """
+    Every metric's per-limb state over one limb file, read chunk by chunk in three passes:
+    the sample-level metrics and the interval histogram, the exact intervals for the
+    sample rate, and the windowed metrics whose window length that rate fixes.
+    """
+
+    def __init__(self, part, thresholds):
+        self.part = part
+        self.thresholds = thresholds
+        self.intervals = IntervalStats()
+        self.samples = 0
+        self.prev_acc_mag = None
+        self.usage_moves = 0
+        self.fall_times = []
+        self.last_onset = None
+        self.onsets = []
+        self.smoothness = SmoothnessStream(**thresholds["smoothness"])
+        self.windows = None
+
+    def update(self, ts, values):
+        limb = LimbData(np.asarray(ts, dtype=np.int64), values)
+        acc_mag, gyro_mag = limb.acc_magnitude(), limb.gyro_magnitude()
+        self.samples += len(limb)
+        self.intervals.add(limb.timestamps)
+
+        # arm/leg usage: magnitude jumps, continued from the last sample of the previous chunk
+        jumps = np.abs(np.diff(acc_mag, prepend=acc_mag[:1] if self.prev_acc_mag is None else [self.prev_acc_mag]))
+        self.usage_moves += int(np.count_nonzero(jumps > self.thresholds["usage"]["movement_threshold"]))
+        self.prev_acc_mag = acc_mag[-1]
+
+        # falls: every sample above the partial threshold is an event
+        self.fall_times.append(limb.timestamps[acc_mag > self.thresholds["falls"]["partial_threshold"]])
+
+        # rhythm: onsets more than the pause after the last one kept, as debounce keeps them
+        hits = limb.timestamps[acc_mag > RHYTHM_THRESHOLD]
+        if self.last_onset is not None:
+            hits = hits[hits > self.last_onset + RHYTHM_MIN_PAUSE_NS]
+        onsets = debounce(hits, RHYTHM_MIN_PAUSE_NS)
+        if len(onsets):
+            self.onsets.append(onsets)
+            self.last_onset = int(onsets[-1])
+
+        self.smoothness.update(limb.timestamps, acc_mag, gyro_mag)
+
+    def start_windows(self):
+        window_len = max(1, int(WINDOW_SEC * self.intervals.sample_rate()))
+        grips = self.thresholds["grips"] if self.part in ARMS and self.samples > 0 else None
+        self.windows = WindowStream(window_len, self.thresholds["stability"], grips)
+
+    def rhythm_onsets(self):
+        # epoch seconds, as detect_movement_times returns them
+        return (np.concatenate(self.onsets) / 1e9).tolist() if self.onsets else []
+
+
+def stream_limb(path, part, thresholds, chunk_samples=CHUNK_SAMPLES):
+    """
+    A LimbStream run over path, or None if its timestamps step back somewhere: chunks
+    can then not be processed in order, and the caller has to score in memory.
+    """
+    stream = LimbStream(part, thresholds)
+    for ts, values in iter_limb_chunks(path, chunk_samples):
+        if len(ts):
+            stream.update(ts, values)
+    if not stream.intervals.monotonic:
+        return None
+
+    stream.intervals.plan()
+    for ts, _ in iter_limb_chunks(path, chunk_samples):
+        if len(ts):
+            stream.intervals.add_exact(ts)
+
+    stream.start_windows()
+    for ts, values in iter_limb_chunks(path, chunk_samples):
+        if len(ts):
+            stream.windows.update(np.asarray(ts, dtype=np.int64), values)
+    stream.windows.finish()
+    return stream
+
+
+def stream_falls(limbs, sync_window):
+    # detect_falls over the fall events every limb stream collected
+    fall_limbs = [part for part in FALL_PARTS if part in limbs]
+    fall_times = [np.concatenate(limbs[part].fall_times) for part in fall_limbs]
+    if fall_times:
+        full_starts = find_synced_events(np.concatenate(fall_times),
+                                         np.concatenate([np.full(len(times), FALL_PARTS.index(part))
+                                                         for part, times in zip(fall_limbs, fall_times)]),
+                                         len(FALL_PARTS), sync_window)
+    else:
+        full_starts = []
+    return {
+        "partial_falls": [(format_timestamp(ts), part) for part, times in zip(fall_limbs, fall_times)
+                          for ts in times.tolist()],
+        "full_falls": [format_timestamp(ts) for ts in full_starts],
+    }
+
+
+def stream_scores(folder, profile=None, chunk_samples=CHUNK_SAMPLES):
+    """
+    Every metric of the session in folder, identical to scoring.score_all's scores, with
+    peak memory set by chunk_samples instead of the session length. Limb files are read
+    one chunk at a time (three passes each; binary files are much faster to re-read than
+    CSV). What is kept grows only with the events found: movements, grips, falls and
+    rhythm onsets. A session whose clock stepped back, or a profile asking for linear
+    (gravity-free) acceleration, is scored in memory instead. Returns (scores, errors)
+    like score_all: a metric that raises or has no value gets its DEFAULTS value.
+    """
+    if any(params.get("linear") for params in (profile or {}).values()):
+        # the gravity-free acceleration needs the orientation filter over whole limbs
+        return score_all(Session.load(folder), profile)
+    thresholds = {metric: {**params, **(profile or {}).get(metric, {})} for metric, params in THRESHOLDS.items()}
+    limbs = {}
+    for part in PARTS:
+        path = find_limb_file(folder, part)
+        if path is None:
+            continue
+        stream = stream_limb(path, part, thresholds, chunk_samples)
+        if stream is None:
+            print(f"[!] Timestamps of {path} step back, scoring {folder} in memory")
+            return score_all(Session.load(folder), profile)
+        limbs[part] = stream
+
+    # each metric is finished on its own, as score_all runs them
+    def stability():
+        scores = [limbs[part].windows.stability_score() for part in STABILITY_LIMBS if part in limbs]
+        return np.mean(scores) if scores else 0.0
+
+    def rhythm():
+        return analyze_rhythm(sorted(t for stream in limbs.values() for t in stream.rhythm_onsets()))
+
+    metrics = {
+        "usage": lambda: usage_summary({part: stream.usage_moves for part, stream in limbs.items()}),
+        "stability": stability,
+        "smoothness": lambda: average_smoothness([limbs[part].smoothness.score() if part in limbs else None
+                                                  for part in LIMB_NAMES.values()]),
+        "rhythm": rhythm,
+        "grips": lambda: {side: limbs[side].windows.grip_events if side in limbs and limbs[side].samples else []
+                          for side in ARMS},
+        "falls": lambda: stream_falls(limbs, thresholds["falls"]["sync_window"]),
+    }
+    scores, errors, defaulted = {}, {}, []
+    for name, finish in metrics.items():
+        try:
+            value = finish()
+        except Exception as e:
+            errors[name] = f"{type(e).__name__}: {e}"
+            value = None
+        if value is None:
+            value = DEFAULTS[name]
+            defaulted.append(name)
+        scores[name] = value
+    scores[DEFAULTED] = defaulted
+    return scores, errors
+
+
+if __name__ == "__main__":
+    # python code/streaming.py archive/all-day --chunk 65536
+    parser = argparse.ArgumentParser(description="Score a session chunk by chunk in constant memory.")
+    parser.add_argument("folder")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SAMPLES, help="samples per chunk")
+    parser.add_argument("--climber", help="score with this climber's calibrated thresholds")
+    args = parser.parse_args()
+
+    profile = None
+    if args.climber:
+        from calibrate import load_profile
+        profile = load_profile(args.climber)
+    start = time.perf_counter()
+    scores, errors = stream_scores(args.folder, profile, args.chunk)
+    print(json.dumps(scores, indent=2, default=float))
+    for name, error in errors.items():
+        print(f"[!] {name} failed: {error}", file=sys.stderr)
+    print(f"[*] {time.perf_counter() - start:.2f} s", file=sys.stderr)
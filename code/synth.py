@@ -0,0 +1,197 @@
+import argparse
+import csv
+import os
+from datetime import datetime
+
+import numpy as np
+
+from binary_format import CSV_HEADER, EPOCH, RECORD_DTYPE, BinaryWriter, format_timestamp
+from session import PARTS, LimbData, Session
+
+# Scales of the real sensors (Arduino_BMI270_BMM150 defaults), so values land on the same
+# float32 grid the firmware sends: acc in g, gyro in deg/s, mag in whole uT.
+ACC_LSB = 1 / 8192
+GYRO_LSB = 2000 / 32768
+
+START = datetime(2025, 7, 18, 21, 24, 44)
+EARTH_FIELD = np.array([15.0, -63.0, -36.0])   # uT, as in the bundled session
+
+ARMS = ["left_arm", "right_arm"]
+
+
+def unit(vectors):
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def climb_events(duration, rng, falls_per_hour=2.0, dyno_chance=0.05):
+    """
+    The climb as a list of events (kind, start_s, end_s, parts): single-limb moves
+    (arms twice as often as legs) and whole-body dynos separated by holds, plus falls:
+    free fall, an impact on every limb and a rest on the ground.
+    """
+    events = []
+    t = 1.0
+    num_falls = int(round(falls_per_hour * duration / 3600))
+    falls = sorted(rng.uniform(10, max(duration - 20, 10), size=num_falls).tolist())
+    while t < duration - 2:
+        if falls and t >= falls[0] and t < duration - 20:
+            falls.pop(0)
+            free_fall = rng.uniform(0.4, 0.8)
+            events.append(("fall", t, t + free_fall, PARTS))
+            t += free_fall + rng.uniform(8, 15)
+            continue
+        if rng.random() < dyno_chance:
+            length = rng.uniform(0.3, 0.6)
+            events.append(("dyno", t, t + length, PARTS))
+        else:
+            part = rng.choice(ARMS * 2 + PARTS[2:])
+            length = rng.uniform(0.4, 1.2)
+            events.append(("move", t, t + length, [part]))
+        t += length + rng.uniform(1.0, 6.0)   # hold until the next move
+    return events
+
+
+def device_signal(part, times, events, rng):
+    """
+    (n, 9) float64 device readings of one limb at times (seconds): gravity along a limb
+    direction that only turns during moves, smooth acc/gyro bursts for moves and dynos,
+    free fall and a > 10 g impact for falls, and sensor noise.
+    """
+    n = len(times)
+    knots_t = [0.0]
+    knots_dir = [unit(rng.normal(size=3))]
+    acc = np.zeros((n, 3))
+    gyro = np.zeros((n, 3))
+    free_fall = np.zeros(n, dtype=bool)
+
+    for kind, start, end, parts in events:
+        if part not in parts:
+            continue
+        i, j = np.searchsorted(times, [start, end])
+        if j <= i:
+            continue
+        envelope = np.sin(np.linspace(0, np.pi, j - i)) ** 2
+        if kind == "fall":
+            free_fall[i:j] = True
+            k = min(j + int(rng.integers(0, 5)), n - 1)
+            acc[k] += unit(rng.normal(size=3)) * rng.uniform(11, 16)
+            gyro[i:j] += np.outer(envelope, unit(rng.normal(size=3))) * rng.uniform(100, 300)
+        else:
+            acc_amp, gyro_amp = (rng.uniform(2.5, 4.0), rng.uniform(300, 500)) if kind == "dyno" else \
+                                (rng.uniform(0.5, 1.5), rng.uniform(150, 450))
+            acc[i:j] += np.outer(envelope, unit(rng.normal(size=3))) * acc_amp
+            gyro[i:j] += np.outer(envelope, unit(rng.normal(size=3))) * gyro_amp
+            # short jolts when pushing off and when catching the next hold
+            for k in (i, j - 1):
+                acc[k:k + int(rng.integers(1, 4))] += unit(rng.normal(size=3)) * rng.uniform(1.5, 3.0)
+        # the limb settles in a new orientation
+        knots_t += [start, end]
+        knots_dir += [knots_dir[-1], unit(knots_dir[-1] + rng.normal(scale=0.4, size=3))]
+
+    knots_dir = np.array(knots_dir)
+    gravity = unit(np.column_stack([np.interp(times, knots_t, knots_dir[:, c]) for c in range(3)]))
+    gravity[free_fall] = 0.0
+
+    # sensor noise plus the small tremor of a climber holding on
+    acc += gravity + rng.normal(scale=0.02, size=(n, 3))
+    gyro += rng.normal(scale=8.0, size=(n, 3))
+    mag = EARTH_FIELD + 30 * gravity[:, [1, 2, 0]] + rng.normal(scale=1.0, size=(n, 3))
+
+    values = np.empty((n, 9))
+    values[:, 0:3] = np.round(acc / ACC_LSB) * ACC_LSB
+    values[:, 3:6] = np.round(gyro / GYRO_LSB) * GYRO_LSB
+    values[:, 6:9] = np.round(mag)
+    return values
+
+
+def host_timestamps(device_times, rng, jitter_ms=5.0, connection_interval_ms=20.0):
+    """
+    Host receive times (seconds) of samples taken at device_times: a radio latency with
+    exponential jitter, delivered at the next BLE connection event (so samples often
+    share a timestamp, like in recorded sessions), never going backwards.
+    """
+    latency = 0.008 + rng.exponential(jitter_ms / 1000, size=len(device_times))
+    interval = connection_interval_ms / 1000
+    arrival = np.ceil((device_times + latency) / interval) * interval
+    return np.maximum.accumulate(arrival)
+
+
+def dropout_mask(times, duration, rng, dropouts_per_minute=0.5, loss=0.005):
+    # False for samples lost to BLE dropouts (0.3-3 s each) and to single lost packets
+    keep = rng.random(len(times)) >= loss
+    for _ in range(rng.poisson(dropouts_per_minute * duration / 60)):
+        start = rng.uniform(0, duration)
+        i, j = np.searchsorted(times, [start, start + rng.uniform(0.3, 3.0)])
+        keep[i:j] = False
+    return keep
+
+
+def generate_session(duration, rate=100.0, seed=0, falls_per_hour=2.0, dropouts_per_minute=0.5,
+                     loss=0.005, jitter_ms=5.0, connection_interval_ms=20.0, start=START):
+    """
+    A synthetic four-limb session of duration seconds as an in-memory Session, sampled at
+    rate Hz on the devices and stamped the way logger.record_imu stamps real packets.
+    The same seed always gives the same session.
+    """
+    rng = np.random.default_rng(seed)
+    events = climb_events(duration, rng, falls_per_hour)
+    start_ns = int((start - EPOCH).total_seconds() * 1e9)
+
+    limbs = {}
+    for part in PARTS:
+        connect_delay = rng.uniform(0, 2)   # devices connect one after another
+        times = np.arange(connect_delay, duration, 1 / rate)
+        times += rng.normal(scale=0.0002, size=len(times))
+        values = device_signal(part, times, events, rng)
+        host = host_timestamps(times, rng, jitter_ms, connection_interval_ms)
+        keep = dropout_mask(times, duration, rng, dropouts_per_minute, loss)
+        timestamps = start_ns + np.round(host[keep] * 1e6).astype(np.int64) * 1000   # microsecond resolution, like isoformat()
+        limbs[part] = LimbData(timestamps, values[keep].astype(np.float32))
+    return Session(None, limbs)
+
+
+def write_session(session, folder, binary=False):
+    """
+    Writes session's limbs to folder as <part>.csv in the logger's CSV schema, or as
+    <part>.bin in the binary format. Returns the paths written.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for part, limb in session.limbs.items():
+        if binary:
+            path = os.path.join(folder, f"{part}.bin")
+            records = np.empty(len(limb), dtype=RECORD_DTYPE)
+            records["timestamp"] = limb.timestamps
+            records["values"] = limb.values
+            writer = BinaryWriter(path)
+            writer.write_records(records)
+            writer.close()
+        else:
+            path = os.path.join(folder, f"{part}.csv")
+            with open(path, mode='w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(CSV_HEADER)
+                writer.writerows(
+                    [format_timestamp(ts)] + row
+                    for ts, row in zip(limb.timestamps.tolist(), limb.values.tolist())
+                )
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    # python code/synth.py synthetic/10min --minutes 10
+    parser = argparse.ArgumentParser(description="Write a synthetic four-limb session.")
+    parser.add_argument("folder")
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=100, help="device sample rate in Hz")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--falls-per-hour", type=float, default=2)
+    parser.add_argument("--dropouts-per-minute", type=float, default=0.5)
+    parser.add_argument("--binary", action="store_true", help="write .bin files instead of CSV")
+    args = parser.parse_args()
+
+    session = generate_session(args.minutes * 60, args.rate, args.seed,
+                               args.falls_per_hour, args.dropouts_per_minute)
+    for path in write_session(session, args.folder, args.binary):
+        print(f"[+] {path}")
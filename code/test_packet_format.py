@@ -0,0 +1,37 @@
+import numpy as np
+
+from packet_format import PACKET_VERSION, PacketDecoder, packet_dtype
+
+SAMPLES = 2
+RATE_US = 10_000
+
+
+def packets(seqs):
+    # one format 2 packet per seq, samples RATE_US apart, as ring slots and their lengths
+    dtype = packet_dtype(SAMPLES)
+    records = np.zeros(len(seqs), dtype=dtype)
+    records["version"] = PACKET_VERSION
+    records["count"] = SAMPLES
+    records["seq"] = seqs
+    records["samples"]["micros"] = (np.asarray(seqs)[:, None] * SAMPLES + np.arange(SAMPLES)) * RATE_US
+    records["samples"]["values"][..., 0] = np.asarray(seqs)[:, None]
+    return records.view(np.uint8).reshape(len(seqs), -1), np.full(len(seqs), dtype.itemsize)
+
+
+def test_packet_sent_twice():
+    decoder = PacketDecoder()
+    seqs = [0, 1, 2, 2, 3]
+    slots, lengths = packets(seqs)
+    recv_ns = 10 ** 18 + np.array([s * SAMPLES * RATE_US * 1000 + 5_000_000 for s in seqs], dtype=np.int64)
+
+    times, values = decoder.decode(recv_ns[:3], slots[:3], lengths[:3])
+    offset = decoder.offset_ns
+    more_times, more_values = decoder.decode(recv_ns[3:], slots[3:], lengths[3:])
+    times = np.concatenate((times, more_times))
+    values = np.concatenate((values, more_values))
+
+    assert decoder.lost == 0
+    # the repeat is dropped, not decoded a second time or taken for a clock wrap
+    assert values[:, 0].tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert decoder.offset_ns == offset
+    assert np.all(np.diff(times) == RATE_US * 1000)
@@ -0,0 +1,25 @@
+import scoring
+from synth import generate_session
+from trends import TrendStore
+
+
+def test_defaulted_rhythm_leaves_bests_unchanged(tmp_path, monkeypatch):
+    session = generate_session(120, seed=0)
+    scores, errors = scoring.score_all(session)
+    assert not errors and scores["rhythm"] is not None
+
+    with TrendStore(path=str(tmp_path / "trends.sqlite")) as store:
+        store.add_session("alex", "first", "2026-01-05T10:00:00", scores)
+        bests = store.personal_bests("alex")
+        weeks = store.weekly_means("alex", "rhythm_score")
+
+        # too few moves: get_rhythm has no value and score_all falls back to its placeholder
+        monkeypatch.setitem(scoring.METRICS, "rhythm", lambda session: None)
+        scores, errors = scoring.score_all(session)
+        assert scores["rhythm"] == scoring.DEFAULTS["rhythm"]
+        assert scores[scoring.DEFAULTED] == ["rhythm"]
+
+        store.add_session("alex", "second", "2026-01-06T10:00:00", scores)
+        assert store.personal_bests("alex") == bests
+        assert store.weekly_means("alex", "rhythm_score") == weeks
+        assert [row[1] for row in store.history("alex", "rhythm_score")] == ["first"]
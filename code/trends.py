@@ -0,0 +1,282 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from binary_format import format_timestamp
+from session import PARTS, find_limb_file, read_manifest
+
+DATA_DIR = "data"
+DATABASE = "trends.sqlite"
+DEFAULT_CLIMBER = "climber"
+WHOLE_BODY = ""       # limb of metrics that score the whole session
+
+# metrics whose personal best is tracked, and whether higher (max) or lower (min) is better
+BEST = {
+    "stability": max,
+    "smoothness": max,
+    "rhythm_score": min,     # spread of the move intervals relative to their mean
+    "full_falls": min,
+    "partial_falls": min,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    climber TEXT NOT NULL,
+    session TEXT NOT NULL,
+    started TEXT NOT NULL,
+    week TEXT NOT NULL,
+    duration REAL,
+    PRIMARY KEY (climber, session)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    climber TEXT NOT NULL,
+    session TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    limb TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (climber, session, metric, limb)
+);
+CREATE INDEX IF NOT EXISTS scores_by_metric ON scores (climber, metric, limb);
+CREATE TABLE IF NOT EXISTS weekly (
+    climber TEXT NOT NULL,
+    week TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    limb TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    total REAL NOT NULL,
+    PRIMARY KEY (climber, metric, limb, week)
+);
+CREATE TABLE IF NOT EXISTS bests (
+    climber TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    limb TEXT NOT NULL,
+    value REAL NOT NULL,
+    session TEXT NOT NULL,
+    PRIMARY KEY (climber, metric, limb)
+);
+"""
+
+
+def flatten_scores(scores):
+    """
+    (metric, limb, value) rows of one session's scores as scoring.score_session or
+    score_all returns them. Per-limb rows come from the metrics that report per limb
+    (grips, partial falls); arm and leg usage are stored as the "arms" and "legs" limbs.
+    Metrics listed under "defaulted" (scoring.DEFAULTED) only hold placeholders and are left out.
+    """
+    scores = {name: value for name, value in scores.items() if name not in scores.get("defaulted", ())}
+    rows = []
+    if "stability" in scores:
+        rows.append(("stability", WHOLE_BODY, scores["stability"]))
+    if "smoothness" in scores:
+        rows.append(("smoothness", WHOLE_BODY, scores["smoothness"]))
+    usage = scores.get("usage")
+    if usage:
+        rows += [("usage", "arms", usage["arm_usage_ratio"]), ("usage", "legs", usage["leg_usage_ratio"])]
+    rhythm = scores.get("rhythm")
+    if rhythm:
+        rows += [(name, WHOLE_BODY, rhythm[name]) for name in ("mean_interval", "std_interval", "rhythm_score")]
+    grips = scores.get("grips")
+    if grips:
+        for side, events in grips.items():
+            rows.append(("grips", side, len(events)))
+            if events:
+                rows.append(("grip_hold", side, sum(g["duration"] for g in events) / len(events)))
+    falls = scores.get("falls")
+    if falls:
+        rows.append(("full_falls", WHOLE_BODY, len(falls["full_falls"])))
+        limbs = [part for _, part in falls["partial_falls"]]
+        rows += [("partial_falls", part, limbs.count(part)) for part in PARTS]
+    return [(metric, limb, float(value)) for metric, limb, value in rows]
+
+
+def iso_week(started):
+    year, week, _ = datetime.fromisoformat(started).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def session_started(folder):
+    # the manifest's start time, or for folders recorded without one the oldest limb file's mtime
+    manifest = read_manifest(folder)
+    if manifest and manifest.get("started"):
+        return manifest["started"], manifest.get("duration")
+    mtimes = [os.path.getmtime(path) for path in (find_limb_file(folder, part) for part in PARTS) if path]
+    started = datetime.fromtimestamp(min(mtimes)) if mtimes else datetime.now()
+    return format_timestamp(int((started - datetime(1970, 1, 1)).total_seconds() * 1e9)), None
+
+
+class TrendStore:
+    """
+    Scores of every session by climber in root/trends.sqlite, with weekly sums and
+    personal bests kept up to date as sessions are added.
+
+    add_session() writes a session's per-metric, per-limb scores and adjusts only the
+    aggregates it touches, so trend queries read a few pre-aggregated rows and never
+    the sessions' limb files. Re-adding a session replaces its earlier scores.
+    """
+
+    def __init__(self, root=DATA_DIR, path=None):
+        self.path = path or os.path.join(root, DATABASE)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_session(self, climber, session, started, scores, duration=None):
+        """
+        Stores one scored session of climber. session is its key (the folder name),
+        started its ISO start time, scores as returned by scoring.
+        """
+        rows = flatten_scores(scores)
+        week = iso_week(started)
+        with self.db:
+            self.remove_session(climber, session)
+            self.db.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?)", (climber, session, started, week, duration))
+            self.db.executemany("INSERT INTO scores VALUES (?, ?, ?, ?, ?)",
+                                [(climber, session, metric, limb, value) for metric, limb, value in rows])
+            self.db.executemany(
+                "INSERT INTO weekly VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (climber, metric, limb, week) DO UPDATE "
+                "SET sessions = sessions + 1, total = total + excluded.total",
+                [(climber, week, metric, limb, value) for metric, limb, value in rows]
+            )
+            for metric, limb, value in rows:
+                better = BEST.get(metric)
+                if better is None:
+                    continue
+                best = self.db.execute("SELECT value FROM bests WHERE climber = ? AND metric = ? AND limb = ?",
+                                       (climber, metric, limb)).fetchone()
+                if best is None or better(value, best[0]) != best[0]:
+                    self.db.execute("INSERT OR REPLACE INTO bests VALUES (?, ?, ?, ?, ?)",
+                                    (climber, metric, limb, value, session))
+
+    def remove_session(self, climber, session):
+        # takes a session back out of the aggregates; call inside a transaction
+        row = self.db.execute("SELECT week FROM sessions WHERE climber = ? AND session = ?",
+                              (climber, session)).fetchone()
+        if row is None:
+            return
+        week = row[0]
+        old = self.db.execute("SELECT metric, limb, value FROM scores WHERE climber = ? AND session = ?",
+                              (climber, session)).fetchall()
+        self.db.executemany(
+            "UPDATE weekly SET sessions = sessions - 1, total = total - ? "
+            "WHERE climber = ? AND week = ? AND metric = ? AND limb = ?",
+            [(value, climber, week, metric, limb) for metric, limb, value in old]
+        )
+        self.db.execute("DELETE FROM weekly WHERE climber = ? AND week = ? AND sessions <= 0", (climber, week))
+        self.db.execute("DELETE FROM scores WHERE climber = ? AND session = ?", (climber, session))
+        self.db.execute("DELETE FROM sessions WHERE climber = ? AND session = ?", (climber, session))
+
+        # a best the session held is recomputed from the remaining sessions' scores
+        held = self.db.execute("SELECT metric, limb FROM bests WHERE climber = ? AND session = ?",
+                               (climber, session)).fetchall()
+        for metric, limb in held:
+            order = "DESC" if BEST[metric] is max else "ASC"
+            best = self.db.execute(
+                f"SELECT value, session FROM scores WHERE climber = ? AND metric = ? AND limb = ? "
+                f"ORDER BY value {order} LIMIT 1", (climber, metric, limb)).fetchone()
+            if best is None:
+                self.db.execute("DELETE FROM bests WHERE climber = ? AND metric = ? AND limb = ?",
+                                (climber, metric, limb))
+            else:
+                self.db.execute("UPDATE bests SET value = ?, session = ? WHERE climber = ? AND metric = ? AND limb = ?",
+                                (*best, climber, metric, limb))
+
+    def climbers(self):
+        return [row[0] for row in self.db.execute("SELECT DISTINCT climber FROM sessions ORDER BY climber")]
+
+    def sessions(self, climber):
+        # (session, started, duration), oldest first
+        return self.db.execute("SELECT session, started, duration FROM sessions WHERE climber = ? ORDER BY started",
+                               (climber,)).fetchall()
+
+    def history(self, climber, metric, limb=WHOLE_BODY):
+        # (started, session, value) of every session with the metric, oldest first
+        return self.db.execute(
+            "SELECT s.started, s.session, c.value FROM scores c JOIN sessions s USING (climber, session) "
+            "WHERE c.climber = ? AND c.metric = ? AND c.limb = ? ORDER BY s.started",
+            (climber, metric, limb)).fetchall()
+
+    def weekly_means(self, climber, metric, limb=WHOLE_BODY):
+        # (week, sessions, mean) per ISO week, oldest first
+        return self.db.execute(
+            "SELECT week, sessions, total / sessions FROM weekly "
+            "WHERE climber = ? AND metric = ? AND limb = ? ORDER BY week",
+            (climber, metric, limb)).fetchall()
+
+    def personal_bests(self, climber):
+        # (metric, limb) -> (value, session)
+        rows = self.db.execute("SELECT metric, limb, value, session FROM bests WHERE climber = ?", (climber,))
+        return {(metric, limb): (value, session) for metric, limb, value, session in rows}
+
+
+def add_from_catalog(store, catalog, climber=None):
+    """
+    Adds the catalog's sessions to store under the climber in each session's manifest,
+    or climber (default DEFAULT_CLIMBER) if it names none. Sessions the catalog has no
+    scores for are scored first, once. Returns how many sessions were added.
+    """
+    added = 0
+    for key, entry in catalog.sessions():
+        folder = catalog.folder(key)
+        scores = catalog.scores(folder)
+        manifest = entry.get("manifest") or {}
+        started, duration = session_started(folder)
+        store.add_session(manifest.get("climber") or climber or DEFAULT_CLIMBER, key, started, scores, duration)
+        added += 1
+    return added
+
+
+def print_trend(store, climber, metric, limb=WHOLE_BODY):
+    start = time.perf_counter()
+    weeks = store.weekly_means(climber, metric, limb)
+    bests = store.personal_bests(climber)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    label = f"{metric} ({limb})" if limb else metric
+    print(f"{label} of {climber}, weekly means:")
+    for week, sessions, mean in weeks:
+        print(f"  {week}  {mean:10.3f}  ({sessions} session{'s' if sessions != 1 else ''})")
+    if (metric, limb) in bests:
+        value, session = bests[(metric, limb)]
+        print(f"  personal best {value:.3f} in {session}")
+    print(f"[*] query took {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    # python code/trends.py import data            adds the sessions in data/catalog.json
+    # python code/trends.py show stability --climber alex
+    parser = argparse.ArgumentParser(description="Cross-session score trends per climber.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("import", help="add the sessions of a catalog, scoring the ones it has no scores for")
+    add.add_argument("root", nargs="?", default=DATA_DIR)
+    add.add_argument("--climber", help="climber of sessions whose manifest names none")
+    show = commands.add_parser("show", help="weekly means and personal best of a metric")
+    show.add_argument("metric")
+    show.add_argument("--limb", default=WHOLE_BODY)
+    show.add_argument("--climber", default=DEFAULT_CLIMBER)
+    show.add_argument("--root", default=DATA_DIR)
+    args = parser.parse_args()
+
+    with TrendStore(args.root) as store:
+        if args.command == "import":
+            from catalog import Catalog
+            catalog = Catalog(args.root)
+            catalog.refresh()
+            print(f"[+] {add_from_catalog(store, catalog, args.climber)} sessions added")
+        else:
+            if args.climber not in store.climbers():
+                print(f"[!] No sessions of {args.climber}", file=sys.stderr)
+                sys.exit(1)
+            print_trend(store, args.climber, args.metric, args.limb)
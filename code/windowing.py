@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def window_view(data, window_len):
+    # (num_windows, window_len, ...) view over the whole windows, trailing samples are dropped
+    num_windows = len(data) // window_len
+    return data[:num_windows * window_len].reshape((num_windows, window_len) + data.shape[1:])
+
+
+def run_lengths(values, breaks=None):
+    """
+    Run-length encodes a 1-D array.
+
+    Returns (starts, lengths, run_values): the index of each run's first element, its length
+    and its value. breaks: optional bool array, True where a new segment (e.g. another limb)
+    starts, so runs never continue across it.
+    """
+    n = len(values)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), values[:0]
+    new_run = np.empty(n, dtype=bool)
+    new_run[0] = True
+    new_run[1:] = values[1:] != values[:-1]
+    if breaks is not None:
+        new_run |= breaks
+    starts = np.flatnonzero(new_run)
+    lengths = np.diff(np.append(starts, n))
+    return starts, lengths, values[starts]
+
+
+def long_runs(mask, min_len, breaks=None):
+    # marks the elements of mask that sit in a run of at least min_len consecutive Trues
+    starts, lengths, run_values = run_lengths(mask, breaks)
+    return np.repeat(run_values & (lengths >= min_len), lengths)
+
+
+def segment_breaks(segment_ids):
+    # True where segment_ids changes, for run_lengths(breaks=...)
+    breaks = np.zeros(len(segment_ids), dtype=bool)
+    breaks[1:] = segment_ids[1:] != segment_ids[:-1]
+    return breaks
+
+
+def rolling_std(values, window, history=None, block=1 << 16):
+    """
+    Sample std (ddof=1) of each value and the window - 1 values before it, like pandas'
+    rolling(window, min_periods=1).std(): fewer values at the start, NaN for a single one.
+
+    history: the values preceding values, when a long series is processed chunk by chunk.
+    Each std is computed from its own window alone, so chunked and whole-series results
+    are identical (pandas' running sums are not).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    history = np.zeros(0) if history is None else np.asarray(history, dtype=np.float64)[max(0, len(history) - window + 1):]
+    data = np.concatenate((history, values))
+    n, h = len(values), len(history)
+    out = np.empty(n)
+
+    # values without a full window: only at the very start of a series
+    partial = min(max(window - 1 - h, 0), n)
+    for i in range(partial):
+        count = h + i + 1
+        out[i] = np.std(data[:count], ddof=1) if count > 1 else np.nan
+
+    if n > partial:
+        windows = np.lib.stride_tricks.sliding_window_view(data, window)[h + partial - window + 1:]
+        for start in range(0, len(windows), block):
+            out[partial + start:partial + start + block] = np.std(windows[start:start + block], axis=1, ddof=1)
+    return out